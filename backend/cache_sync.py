@@ -0,0 +1,368 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from dotenv import load_dotenv
+from pymongo.errors import OperationFailure
+
+from mongo_client import create_client
+from tenancy import ALL_TENANTS, DEFAULT_TENANT, TenantConfig, current_tenant
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+# Per-worker caches of reference data and auth lookups, kept coherent across
+# workers and pods. Every worker runs a CacheInvalidator at startup:
+#
+#   change_stream  watches the database and drops affected entries as soon as
+#                  any worker (or script) writes; needs a replica set
+#   poll           fallback when change streams are unavailable: writers bump
+#                  a counter in `cache_versions` and every worker polls it
+#
+# Reference collections are cached as whole lists, so any change flushes the
+# collection's entries. sessions and users are cached per document and
+# invalidated by _id; inserts there cannot make a cached entry stale, so they
+# are ignored. Entries also expire after ttl_seconds, which bounds staleness
+# for writes the poller cannot see (e.g. seed scripts).
+#
+# With tenancy on (tenancy.py) entries are kept per campus. In database mode
+# the stream watches every campus database and attributes changes by database
+# name. Field-mode change events carry only the _id, so a change there flushes
+# the collection for every campus (per-document invalidation stays exact).
+#
+# To try change streams locally, start a single-node replica set:
+#
+#   mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017
+#   mongosh --eval 'rs.initiate()'
+#
+# then run `python cache_sync.py check` (see the bottom of this file).
+
+REFERENCE_COLLECTIONS = ("faqs", "departments", "faculty", "events", "locations")
+DOCUMENT_COLLECTIONS = ("sessions", "users")
+WATCHED_COLLECTIONS = REFERENCE_COLLECTIONS + DOCUMENT_COLLECTIONS
+VERSIONS_COLLECTION = "cache_versions"
+SYNC_MODES = ("auto", "change_stream", "poll", "off")
+
+# "$changeStream stage is only supported on replica sets"
+_CHANGE_STREAMS_UNSUPPORTED = {40573, 40324}
+
+class LocalCache:
+    # LRU with a TTL, partitioned by campus (see tenancy.py). Entries can be
+    # tagged with the _id of the document they came from, for per-document
+    # invalidation. A reader that started loading before an invalidation must
+    # not cache its (possibly stale) result, so set() takes the generation
+    # read before the load.
+    #
+    # max_entries is shared by all campuses. When it is exceeded the campus
+    # holding the most entries gives up its least recently used one, so a
+    # large campus only ever evicts its own data while a smaller campus is
+    # below its share. tenant=None means the campus bound to the request.
+    def __init__(self, ttl_seconds: float = 300.0, max_entries: int = 50000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # tenant -> OrderedDict[(namespace, key)] = (expires, value, doc_id)
+        self._partitions: Dict[str, OrderedDict] = {}
+        self._size = 0
+        self._by_doc: Dict[tuple, set] = {}
+        self._generations: Dict[tuple, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def generation(self, namespace: str, tenant: Optional[str] = None) -> int:
+        # Bumped by invalidations of this campus's namespace and of the
+        # namespace across all campuses.
+        tenant = tenant or current_tenant()
+        return self._generations.get((tenant, namespace), 0) + self._generations.get((ALL_TENANTS, namespace), 0)
+
+    def get(self, namespace: str, key: str, tenant: Optional[str] = None):
+        entries = self._partitions.get(tenant or current_tenant())
+        entry = entries.get((namespace, key)) if entries else None
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._drop(tenant or current_tenant(), (namespace, key))
+            self.misses += 1
+            return None
+        entries.move_to_end((namespace, key))
+        self.hits += 1
+        return entry[1]
+
+    def set(self, namespace: str, key: str, value, doc_id: Optional[str] = None,
+            generation: Optional[int] = None, tenant: Optional[str] = None) -> None:
+        tenant = tenant or current_tenant()
+        if self.ttl_seconds <= 0 or value is None:
+            return
+        if generation is not None and generation != self.generation(namespace, tenant):
+            return
+        entries = self._partitions.setdefault(tenant, OrderedDict())
+        if (namespace, key) in entries:
+            self._drop(tenant, (namespace, key))
+        entries[(namespace, key)] = (time.monotonic() + self.ttl_seconds, value, doc_id)
+        self._size += 1
+        if doc_id is not None:
+            self._by_doc.setdefault((tenant, namespace, doc_id), set()).add(key)
+        while self._size > self.max_entries:
+            victim = max(self._partitions, key=lambda t: len(self._partitions[t]))
+            self._drop(victim, next(iter(self._partitions[victim])))
+            self.evictions += 1
+
+    def _drop(self, tenant: str, entry_key: tuple) -> None:
+        entries = self._partitions[tenant]
+        _, _, doc_id = entries.pop(entry_key)
+        self._size -= 1
+        if not entries:
+            del self._partitions[tenant]
+        if doc_id is not None:
+            namespace, key = entry_key
+            keys = self._by_doc.get((tenant, namespace, doc_id))
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._by_doc[(tenant, namespace, doc_id)]
+
+    def invalidate(self, namespace: str, doc_id: Optional[str] = None, tenant: Optional[str] = None) -> None:
+        # tenant=ALL_TENANTS for changes that cannot be attributed to a campus.
+        tenant = tenant or current_tenant()
+        self._generations[(tenant, namespace)] = self._generations.get((tenant, namespace), 0) + 1
+        self.invalidations += 1
+        tenants = list(self._partitions) if tenant == ALL_TENANTS else [tenant]
+        for t in tenants:
+            if doc_id is None:
+                entries = self._partitions.get(t, {})
+                for entry_key in [k for k in entries if k[0] == namespace]:
+                    self._drop(t, entry_key)
+            else:
+                for key in list(self._by_doc.get((t, namespace, doc_id), ())):
+                    self._drop(t, (namespace, key))
+
+    def clear(self) -> None:
+        for namespace in {ns for _, ns in self._generations} | {ns for p in self._partitions.values() for ns, _ in p}:
+            self._generations[(ALL_TENANTS, namespace)] = self._generations.get((ALL_TENANTS, namespace), 0) + 1
+        self._partitions.clear()
+        self._by_doc.clear()
+        self._size = 0
+
+    def stats(self) -> dict:
+        entries = {}
+        for tenant, partition in self._partitions.items():
+            counts = entries.setdefault(tenant, {})
+            for namespace, _ in partition:
+                counts[namespace] = counts.get(namespace, 0) + 1
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "max_entries": self.max_entries,
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
+
+class ChangeStreamsUnavailable(Exception):
+    pass
+
+class CacheInvalidator:
+    def __init__(self, db, cache: LocalCache, mode: str = "auto", poll_interval: float = 1.0,
+                 collections: Iterable[str] = WATCHED_COLLECTIONS, tenants: Optional[TenantConfig] = None):
+        if mode not in SYNC_MODES:
+            raise ValueError(f"CACHE_SYNC_MODE must be one of {', '.join(SYNC_MODES)}")
+        # The shared DB_NAME database, not a tenant-scoped handle.
+        self.db = db
+        self.tenants = tenants or TenantConfig()
+        self.cache = cache
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.collections = tuple(collections)
+        self.active = None
+        self.last_invalidation_at: Optional[str] = None
+        self._resume_token = None
+        self._versions: Dict[str, int] = {}
+
+    async def touch(self, collection: str) -> None:
+        # Called by the app after its own writes: drops the local entries
+        # immediately and bumps the version other pollers are watching.
+        tenant = current_tenant()
+        self.cache.invalidate(collection, tenant=tenant)
+        await self.db[VERSIONS_COLLECTION].update_one(
+            {"_id": collection if tenant == DEFAULT_TENANT else f"{tenant}:{collection}"},
+            {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}},
+            upsert=True,
+        )
+
+    def _invalidate(self, tenant: str, collection: str, doc_id: Optional[str] = None) -> None:
+        self.cache.invalidate(collection, doc_id, tenant=tenant)
+        self.last_invalidation_at = datetime.now(timezone.utc).isoformat()
+
+    async def run(self) -> None:
+        # Started once per worker at startup.
+        if self.mode == "off":
+            return
+        backoff = 1.0
+        while True:
+            try:
+                if self.mode in ("auto", "change_stream"):
+                    await self._watch()
+                else:
+                    await self._poll()
+            except ChangeStreamsUnavailable:
+                if self.mode == "change_stream":
+                    logger.error("Change streams are not available; cache invalidation relies on TTL only")
+                    self.active = None
+                    return
+                logger.warning("Change streams are not available, polling %s instead", VERSIONS_COLLECTION)
+                self.mode = "poll"
+            except Exception:
+                # Events may have been missed while disconnected.
+                logger.exception("Cache invalidation watcher failed, flushing local caches")
+                self.cache.clear()
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+            else:
+                backoff = 1.0
+
+    def _pipeline(self) -> list:
+        reference = [c for c in self.collections if c not in DOCUMENT_COLLECTIONS]
+        documents = [c for c in self.collections if c in DOCUMENT_COLLECTIONS]
+        match = {"$or": [
+            {"ns.coll": {"$in": reference}},
+            {"ns.coll": {"$in": documents}, "operationType": {"$in": ["update", "replace", "delete"]}},
+            {"operationType": {"$in": ["drop", "rename", "dropDatabase", "invalidate"]}},
+        ]}
+        if self.tenants.mode == "database":
+            match["ns.db"] = {"$in": [self.tenants.database_name(t) for t in self.tenants.tenants]}
+        return [{"$match": match}, {"$project": {"ns": 1, "operationType": 1, "documentKey": 1}}]
+
+    async def _watch(self) -> None:
+        try:
+            # One database per campus means watching the whole deployment.
+            target = self.db.client if self.tenants.mode == "database" else self.db
+            stream = target.watch(self._pipeline(), resume_after=self._resume_token)
+            async with stream:
+                if self._resume_token is None:
+                    # Anything cached before the stream opened may be stale.
+                    self.cache.clear()
+                self.active = "change_stream"
+                async for change in stream:
+                    self._resume_token = stream.resume_token
+                    self._apply(change)
+        except NotImplementedError:
+            raise ChangeStreamsUnavailable()
+        except OperationFailure as exc:
+            if exc.code in _CHANGE_STREAMS_UNSUPPORTED:
+                raise ChangeStreamsUnavailable()
+            if exc.code == 286:
+                # ChangeStreamHistoryLost: the resume point fell off the oplog.
+                self._resume_token = None
+            raise
+
+    def _tenant_of(self, change: dict) -> Optional[str]:
+        # Field-mode events only carry the _id, not the campus.
+        if self.tenants.mode == "database":
+            return self.tenants.tenant_for_database(change.get("ns", {}).get("db", ""))
+        return ALL_TENANTS if self.tenants.mode == "field" else DEFAULT_TENANT
+
+    def _apply(self, change: dict) -> None:
+        collection = change.get("ns", {}).get("coll")
+        operation = change["operationType"]
+        tenant = self._tenant_of(change)
+        if operation in ("invalidate", "dropDatabase"):
+            if operation == "invalidate":
+                self._resume_token = None
+            self.cache.clear()
+            self.last_invalidation_at = datetime.now(timezone.utc).isoformat()
+        elif collection not in self.collections or tenant is None:
+            return
+        elif collection in DOCUMENT_COLLECTIONS and operation in ("update", "replace", "delete"):
+            self._invalidate(tenant, collection, str(change["documentKey"]["_id"]))
+        else:
+            self._invalidate(tenant, collection)
+
+    async def _poll(self) -> None:
+        self.active = "poll"
+        first = not self._versions
+        while True:
+            async for doc in self.db[VERSIONS_COLLECTION].find({}):
+                # _id is "<collection>", or "<tenant>:<collection>" with tenancy on.
+                tenant, _, collection = doc["_id"].rpartition(":")
+                if collection not in self.collections:
+                    continue
+                version = doc.get("version", 0)
+                if not first and self._versions.get(doc["_id"]) != version:
+                    self._invalidate(tenant or DEFAULT_TENANT, collection)
+                self._versions[doc["_id"]] = version
+            first = False
+            await asyncio.sleep(self.poll_interval)
+
+    def status(self) -> dict:
+        return {
+            "mode": self.mode,
+            "active": self.active,
+            "poll_interval": self.poll_interval,
+            "last_invalidation_at": self.last_invalidation_at,
+            **self.cache.stats(),
+        }
+
+# ---------------------------------------------------------------------------
+# Propagation check
+# ---------------------------------------------------------------------------
+#
+#   python cache_sync.py check [--mode auto|poll] [--rounds 20]
+#
+# Simulates two workers with separate clients against MONGO_URL (in a scratch
+# database): worker B caches a document, worker A updates it, and the time
+# until B's entry is gone is reported.
+
+async def check(args) -> None:
+    clients = [create_client() for _ in range(2)]
+    dbs = [c[args.db] for c in clients]
+    workers = [CacheInvalidator(db, LocalCache(ttl_seconds=3600), args.mode, args.poll_interval) for db in dbs]
+    tasks = [asyncio.create_task(w.run()) for w in workers]
+    writer, reader = workers
+    try:
+        await dbs[0].faqs.delete_many({})
+        await dbs[0].faqs.insert_one({"id": "probe", "question": "probe", "answer": "0"})
+        await asyncio.sleep(max(1.0, args.poll_interval * 2))
+        print(f"Writer: {writer.active}, reader: {reader.active}")
+
+        delays = []
+        for i in range(args.rounds):
+            reader.cache.set("faqs", "context", [{"id": "probe", "answer": str(i)}])
+            started = time.perf_counter()
+            await dbs[0].faqs.update_one({"id": "probe"}, {"$set": {"answer": str(i + 1)}})
+            await writer.touch("faqs")
+            while reader.cache.get("faqs", "context") is not None:
+                if time.perf_counter() - started > args.timeout:
+                    raise SystemExit(f"Round {i}: not invalidated within {args.timeout}s")
+                await asyncio.sleep(0.005)
+            delays.append((time.perf_counter() - started) * 1000)
+        delays.sort()
+        print(f"✓ {len(delays)} invalidations propagated: p50 {delays[len(delays) // 2]:.1f} ms, max {delays[-1]:.1f} ms")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await clients[0].drop_database(args.db)
+        for c in clients:
+            c.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check cross-worker cache invalidation against MONGO_URL.")
+    parser.add_argument("command", choices=["check"])
+    parser.add_argument("--mode", choices=["auto", "change_stream", "poll"], default="auto")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--db", default="cache_sync_check")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(check(parse_args()))
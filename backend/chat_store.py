@@ -0,0 +1,383 @@
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from mongo_client import create_client
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Storage layouts for chat_history. Both expose the same flat records
+# ({id, user_id, query, response, timestamp}) to the API, admin views and
+# exports:
+#
+#   flat      one document per message in `chat_history` (the default)
+#   bucketed  one document per (user_id, day) in `chat_history_buckets`,
+#             holding up to max_turns turns sorted by timestamp; a full
+#             bucket is closed and the day continues in a new one
+#
+# Buckets keep heavy users' histories in a few hundred documents instead of
+# tens of thousands, and the per-user index has one entry per bucket rather
+# than one per message.
+#
+# Retention and bulk purges (retention.py) go through expired()/drop_expired()
+# and delete_records(), and answer precomputation (precompute.py) ranks
+# questions with query_counts(), so they work the same on either layout.
+
+HISTORY_LAYOUTS = ("flat", "bucketed")
+DEFAULT_BUCKET_TURNS = 200
+# Fields kept per turn; user_id lives on the bucket.
+TURN_FIELDS = ("id", "query", "response", "timestamp", "intent", "usage")
+# Re-derives a bucket's count and time bounds from the turns it still holds.
+RECOUNT_BUCKET = [{"$set": {
+    "count": {"$size": "$turns"},
+    "first_ts": {"$min": "$turns.timestamp"},
+    "last_ts": {"$max": "$turns.timestamp"},
+}}]
+
+def _turn(record: dict) -> dict:
+    return {k: record[k] for k in TURN_FIELDS if k in record}
+
+class FlatChatHistory:
+    layout = "flat"
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index([("user_id", 1), ("timestamp", -1), ("id", -1)])
+        await self.collection.create_index([("timestamp", -1), ("id", -1)])
+        await self.collection.create_index("id")
+
+    async def insert(self, record: dict) -> None:
+        await self.collection.insert_one(dict(record))
+
+    def find(self, query: dict, newest_first: bool = True, limit: int = 0,
+             min_ts: Optional[str] = None, max_ts: Optional[str] = None):
+        # min_ts/max_ts are pruning hints for the bucketed layout; here the
+        # query itself already carries the bounds.
+        direction = -1 if newest_first else 1
+        cursor = self.collection.find(query, {"_id": 0}).sort([("timestamp", direction), ("id", direction)])
+        return cursor.limit(limit) if limit else cursor
+
+    async def find_one(self, record_id: str, user_id: Optional[str] = None) -> Optional[dict]:
+        query = {"id": record_id}
+        if user_id:
+            query["user_id"] = user_id
+        return await self.collection.find_one(query, {"_id": 0})
+
+    async def delete(self, record_id: str) -> bool:
+        result = await self.collection.delete_one({"id": record_id})
+        return result.deleted_count > 0
+
+    async def delete_records(self, records: List[dict]) -> int:
+        result = await self.collection.delete_many({"id": {"$in": [r["id"] for r in records]}})
+        return result.deleted_count
+
+    async def expired(self, cutoff: str, limit: int) -> Tuple[List[dict], list]:
+        # Oldest records first. Returns the records and the handle to pass
+        # to drop_expired() once they are archived.
+        records = await self.find({"timestamp": {"$lt": cutoff}}, newest_first=False, limit=limit).to_list(limit)
+        return records, [r["id"] for r in records]
+
+    async def drop_expired(self, handle: list) -> None:
+        await self.collection.delete_many({"id": {"$in": handle}})
+
+    async def query_counts(self, since: str, limit: int) -> List[dict]:
+        # Most frequent queries since `since`, case-folded: [{_id, count}].
+        return await self.collection.aggregate([
+            {"$match": {"timestamp": {"$gte": since}}},
+            {"$group": {"_id": {"$toLower": "$query"}, "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}},
+            {"$limit": limit},
+        ], allowDiskUse=True).to_list(limit)
+
+class BucketedChatHistory:
+    layout = "bucketed"
+
+    def __init__(self, collection, max_turns: int = DEFAULT_BUCKET_TURNS):
+        self.collection = collection
+        self.max_turns = max_turns
+
+    async def ensure_indexes(self) -> None:
+        # (user_id, day) finds the open bucket on insert; last_ts orders and
+        # prunes a user's buckets on read. turns.id serves cursor lookups and
+        # deletes by record id. The partial unique index allows one open
+        # bucket per user and day, so racing first inserts cannot open two.
+        await self.collection.create_index([("user_id", 1), ("day", -1), ("last_ts", -1)])
+        await self.collection.create_index([("user_id", 1), ("day", 1)], unique=True,
+                                           partialFilterExpression={"closed": False}, name="open_bucket")
+        await self.collection.create_index([("last_ts", -1)])
+        await self.collection.create_index("turns.id")
+
+    def _append(self, record: dict) -> tuple:
+        # Appends to the day's open bucket, or opens one. Only the open bucket
+        # takes turns: a closed one stays closed when deletes shrink it, so a
+        # user's buckets never interleave in time. The count filter makes a
+        # full bucket that is not closed yet miss too, and buckets written
+        # before the flag existed count as closed. $sort keeps turns in
+        # timestamp order even when concurrent requests land slightly out of
+        # order.
+        ts = record["timestamp"]
+        return (
+            {"user_id": record["user_id"], "day": ts[:10], "closed": False, "count": {"$lt": self.max_turns}},
+            {
+                "$push": {"turns": {"$each": [_turn(record)], "$sort": {"timestamp": 1, "id": 1}}},
+                "$inc": {"count": 1},
+                "$min": {"first_ts": ts},
+                "$max": {"last_ts": ts},
+            },
+        )
+
+    def _close_full(self, user_id: str, day: str) -> tuple:
+        return (
+            {"user_id": user_id, "day": day, "closed": False, "count": {"$gte": self.max_turns}},
+            {"$set": {"closed": True}},
+        )
+
+    async def insert(self, record: dict) -> None:
+        for attempt in range(3):
+            try:
+                bucket = await self.collection.find_one_and_update(
+                    *self._append(record), upsert=True, projection={"count": 1},
+                    return_document=ReturnDocument.AFTER)
+            except DuplicateKeyError:
+                # Another request opened the day's bucket first, or the open
+                # one is full but not closed yet: close it and try again.
+                if attempt == 2:
+                    raise
+                await self.collection.update_many(*self._close_full(record["user_id"], record["timestamp"][:10]))
+                continue
+            if bucket["count"] >= self.max_turns:
+                await self.collection.update_one({"_id": bucket["_id"]}, {"$set": {"closed": True}})
+            return
+
+    def find(self, query: dict, newest_first: bool = True, limit: int = 0,
+             min_ts: Optional[str] = None, max_ts: Optional[str] = None):
+        # Unwinds matching buckets back into flat records. One user's buckets
+        # never overlap in time (turns only go to the single open bucket, and
+        # deletes re-derive first_ts/last_ts), so ordering buckets and then
+        # the turns inside them is already a total order: the pipeline streams
+        # and $limit stops reading buckets early. The exception is a request
+        # whose turn is written after a later one filled the previous bucket;
+        # it can only be out of place by the milliseconds between the two.
+        # Across users buckets do overlap, so global reads need a real sort on
+        # the unwound turns.
+        direction = -1 if newest_first else 1
+        bucket_match = {}
+        per_user = isinstance(query.get("user_id"), str)
+        if per_user:
+            bucket_match["user_id"] = query["user_id"]
+        if "id" in query:
+            bucket_match["turns.id"] = query["id"]
+        if min_ts:
+            bucket_match["last_ts"] = {"$gte": min_ts}
+        if max_ts:
+            bucket_match["first_ts"] = {"$lte": max_ts}
+
+        pipeline = [{"$match": bucket_match}]
+        if per_user:
+            pipeline.append({"$sort": {"day": direction, "last_ts": direction}})
+        pipeline += [
+            {"$project": {"_id": 0, "user_id": 1,
+                          "turns": {"$reverseArray": "$turns"} if newest_first else "$turns"}},
+            {"$unwind": "$turns"},
+            {"$project": {"user_id": 1, **{field: f"$turns.{field}" for field in TURN_FIELDS}}},
+        ]
+        if query:
+            pipeline.append({"$match": query})
+        if not per_user:
+            pipeline.append({"$sort": {"timestamp": direction, "id": direction}})
+        if limit:
+            pipeline.append({"$limit": limit})
+        return self.collection.aggregate(pipeline, allowDiskUse=True)
+
+    async def find_one(self, record_id: str, user_id: Optional[str] = None) -> Optional[dict]:
+        query = {"turns.id": record_id}
+        if user_id:
+            query["user_id"] = user_id
+        bucket = await self.collection.find_one(
+            query, {"_id": 0, "user_id": 1, "turns": {"$elemMatch": {"id": record_id}}})
+        if not bucket or not bucket.get("turns"):
+            return None
+        return {**bucket["turns"][0], "user_id": bucket["user_id"]}
+
+    async def delete(self, record_id: str) -> bool:
+        return await _unappend(self.collection, [record_id]) > 0
+
+    async def delete_records(self, records: List[dict]) -> int:
+        return await _unappend(self.collection, [r["id"] for r in records])
+
+    async def expired(self, cutoff: str, limit: int) -> Tuple[List[dict], list]:
+        # Whole buckets whose newest turn is older than cutoff, oldest first.
+        # A bucket straddling the cutoff waits until all of its turns are past
+        # it, so records may outlive the retention period by up to a day.
+        records, bucket_ids = [], []
+        cursor = self.collection.find({"last_ts": {"$lt": cutoff}}).sort("last_ts", 1).limit(limit)
+        async for bucket in cursor:
+            bucket_ids.append(bucket["_id"])
+            records += [{**turn, "user_id": bucket["user_id"]} for turn in bucket["turns"]]
+            if len(records) >= limit:
+                break
+        await cursor.close()
+        return records, bucket_ids
+
+    async def drop_expired(self, handle: list) -> None:
+        await self.collection.delete_many({"_id": {"$in": handle}})
+
+    async def query_counts(self, since: str, limit: int) -> List[dict]:
+        return await self.collection.aggregate([
+            {"$match": {"last_ts": {"$gte": since}}},
+            {"$unwind": "$turns"},
+            {"$match": {"turns.timestamp": {"$gte": since}}},
+            {"$group": {"_id": {"$toLower": "$turns.query"}, "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}},
+            {"$limit": limit},
+        ], allowDiskUse=True).to_list(limit)
+
+def make_chat_history(db, layout: str = "flat", max_turns: int = DEFAULT_BUCKET_TURNS):
+    if layout not in HISTORY_LAYOUTS:
+        raise ValueError(f"CHAT_HISTORY_LAYOUT must be one of {', '.join(HISTORY_LAYOUTS)}")
+    if layout == "bucketed":
+        return BucketedChatHistory(db.chat_history_buckets, max_turns)
+    return FlatChatHistory(db.chat_history)
+
+def bucket_docs(records: Iterable[dict], max_turns: int = DEFAULT_BUCKET_TURNS) -> List[dict]:
+    # Builds bucket documents in memory (benchmarks and bulk loads). Records
+    # may arrive in any order.
+    groups = {}
+    for record in records:
+        groups.setdefault((record["user_id"], record["timestamp"][:10]), []).append(_turn(record))
+    buckets = []
+    for (user_id, day), turns in groups.items():
+        turns.sort(key=lambda t: (t["timestamp"], t["id"]))
+        for start in range(0, len(turns), max_turns):
+            chunk = turns[start:start + max_turns]
+            buckets.append({
+                "user_id": user_id,
+                "day": day,
+                "closed": len(chunk) >= max_turns,
+                "count": len(chunk),
+                "first_ts": chunk[0]["timestamp"],
+                "last_ts": chunk[-1]["timestamp"],
+                "turns": chunk,
+            })
+    return buckets
+
+# ---------------------------------------------------------------------------
+# Converting an existing flat collection
+# ---------------------------------------------------------------------------
+#
+#   python chat_store.py to-buckets [--batch-size 1000] [--max-turns 200]
+#
+# Walks chat_history in _id order and appends each record to its bucket. The
+# last _id is checkpointed in the `migrations` collection, so an interrupted
+# run resumes; the batch that was in flight is first pulled back out of the
+# buckets so it is not appended twice. chat_history itself is left in place
+# until you switch CHAT_HISTORY_LAYOUT=bucketed and drop it.
+
+CONVERSION_ID = "chat_history_buckets"
+
+async def _unappend(buckets, record_ids: List[str]) -> int:
+    # Pulls the records out of their buckets, one bucket at a time, and
+    # returns how many were there. Counts and time bounds are re-derived from
+    # the remaining turns (closed buckets stay closed); emptied buckets go.
+    wanted = set(record_ids)
+    ids = list(wanted)
+    pulled = 0
+    while True:
+        before = await buckets.find_one_and_update(
+            {"turns.id": {"$in": ids}},
+            {"$pull": {"turns": {"id": {"$in": ids}}}},
+            projection={"turns.id": 1},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if before is None:
+            return pulled
+        removed = sum(turn["id"] in wanted for turn in before["turns"])
+        pulled += removed
+        await buckets.update_one({"_id": before["_id"]}, RECOUNT_BUCKET)
+        if removed == len(before["turns"]):
+            await buckets.delete_one({"_id": before["_id"], "count": {"$lte": 0}})
+
+async def to_buckets(db, args) -> None:
+    from migrations.runner import Throttle
+
+    store = BucketedChatHistory(db.chat_history_buckets, args.max_turns)
+    await store.ensure_indexes()
+    state = await db.migrations.find_one({"id": CONVERSION_ID}) or {}
+    if state.get("status") == "applied":
+        print("✓ chat_history already converted")
+        return
+    checkpoint = state.get("checkpoint")
+    processed = state.get("processed", 0)
+    throttle = Throttle(args.duty_cycle)
+    resuming = bool(state)
+    total = await db.chat_history.count_documents({})
+    print(f"Converting {total:,} chat_history records into buckets of {args.max_turns}"
+          + (f" (resuming after _id {checkpoint})" if checkpoint else ""))
+
+    started = time.perf_counter()
+    while True:
+        query = {"_id": {"$gt": checkpoint}} if checkpoint is not None else {}
+        batch = await db.chat_history.find(query).sort("_id", 1).limit(args.batch_size).to_list(args.batch_size)
+        if not batch:
+            break
+        batch_started = time.perf_counter()
+        if resuming:
+            await _unappend(store.collection, [r["id"] for r in batch])
+            resuming = False
+        # Ordered: later appends depend on the counts left by earlier ones,
+        # and each is followed by closing its bucket if that filled it.
+        ops = []
+        for r in batch:
+            ops += [UpdateOne(*store._append(r), upsert=True),
+                    UpdateOne(*store._close_full(r["user_id"], r["timestamp"][:10]))]
+        await store.collection.bulk_write(ops, ordered=True)
+        processed += len(batch)
+        checkpoint = batch[-1]["_id"]
+        await db.migrations.update_one({"id": CONVERSION_ID}, {"$set": {
+            "name": "chat_history_to_buckets",
+            "status": "running",
+            "checkpoint": checkpoint,
+            "processed": processed,
+        }}, upsert=True)
+        print(f"  {processed:,}/{total:,} ({processed / (time.perf_counter() - started):,.0f} records/s)")
+        await throttle.pause(time.perf_counter() - batch_started)
+
+    await db.migrations.update_one({"id": CONVERSION_ID}, {"$set": {
+        "status": "applied",
+        "processed": processed,
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+    }}, upsert=True)
+    buckets = await store.collection.count_documents({})
+    print(f"✓ {processed:,} records in {buckets:,} buckets; set CHAT_HISTORY_LAYOUT=bucketed to serve from them")
+
+async def main(args) -> None:
+    client = create_client()
+    db = client[os.environ['DB_NAME']]
+    try:
+        await to_buckets(db, args)
+    finally:
+        client.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert flat chat_history into per-user/day buckets.")
+    parser.add_argument("command", choices=["to-buckets"])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--max-turns", type=int,
+                        default=int(os.environ.get("CHAT_BUCKET_MAX_TURNS", DEFAULT_BUCKET_TURNS)))
+    parser.add_argument("--duty-cycle", type=float, default=0.5,
+                        help="Fraction of wall time spent writing; the rest is paused")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+from starlette.websockets import WebSocket, WebSocketState
+
+logger = logging.getLogger(__name__)
+
+# Connection bookkeeping for the /api/chat/ws transport. The socket is
+# authenticated once when it connects; after that each question is a JSON
+# text frame, several may be in flight at once, and answers stream back in
+# chunks tagged with the client's message id:
+#
+#   client -> server
+#     {"type": "ask", "id": "m1", "query": "...", "session_id": "..."}
+#     {"type": "cancel", "id": "m1"}
+#     {"type": "ping"}
+#   server -> client
+#     {"type": "ready", "user_id": ..., "heartbeat_seconds": ..., "max_in_flight": ...}
+#     {"type": "chunk", "id": "m1", "text": "..."}
+#     {"type": "done", "id": "m1", "response": "...", "session_id": ..., "record_id": ..., "timestamp": ...,
+#      "trace_id": ...}
+#     {"type": "error", "id": "m1", "status": 429, "detail": "..."}
+#     {"type": "heartbeat"}, {"type": "pong"}
+#
+# One heartbeat task per worker serves every socket, so an idle connection
+# costs its handler coroutine and a ChatConnection, nothing more. Any client
+# frame counts as activity; sockets silent for idle_seconds are closed, so
+# clients should answer heartbeats with a ping. Run uvicorn with a small
+# --ws-max-size (frames here are a few KiB) to keep per-socket buffers small.
+#
+# Browsers attach the session cookie to a WebSocket handshake from any site
+# and CORS does not apply to sockets, so the handshake checks Origin itself:
+# same-origin pages and the origins listed in CORS_ORIGINS may connect, other
+# browser pages are refused. A "*" entry does not open sockets to every site.
+# Clients that send no Origin are not browsers and authenticate with a token.
+
+CLOSE_GOING_AWAY = 1001
+CLOSE_UNSUPPORTED = 1003
+CLOSE_POLICY = 1008
+CLOSE_TRY_AGAIN = 1013
+# Session expired or revoked while the socket was open.
+CLOSE_UNAUTHORIZED = 4401
+
+class ChatConnection:
+    __slots__ = ("websocket", "user", "identity", "in_flight", "last_seen", "authenticated_at", "_send_lock")
+
+    def __init__(self, websocket: WebSocket, user, identity: str):
+        self.websocket = websocket
+        self.user = user
+        self.identity = identity
+        self.in_flight: Dict[str, asyncio.Task] = {}
+        self.last_seen = time.monotonic()
+        self.authenticated_at = time.monotonic()
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message: dict) -> bool:
+        # Frames from concurrent answers and heartbeats must not interleave.
+        async with self._send_lock:
+            if self.websocket.application_state != WebSocketState.CONNECTED:
+                return False
+            try:
+                await self.websocket.send_text(json.dumps(message, default=str))
+                return True
+            except Exception:
+                return False
+
+    async def close(self, code: int) -> None:
+        async with self._send_lock:
+            if self.websocket.application_state == WebSocketState.CONNECTED:
+                try:
+                    await self.websocket.close(code)
+                except Exception:
+                    pass
+
+class ChatSocketHub:
+    def __init__(self, max_connections: int = 20000, max_in_flight: int = 4, max_frame_bytes: int = 8192,
+                 heartbeat_seconds: float = 30.0, idle_seconds: float = 90.0, reauth_seconds: float = 300.0,
+                 allowed_origins: Iterable[str] = ()):
+        self.max_connections = max_connections
+        self.max_in_flight = max_in_flight
+        self.max_frame_bytes = max_frame_bytes
+        self.heartbeat_seconds = heartbeat_seconds
+        self.idle_seconds = idle_seconds
+        self.reauth_seconds = reauth_seconds
+        self.allowed_origins = {o.strip().rstrip("/") for o in allowed_origins if o.strip() not in ("", "*")}
+        self.connections = set()
+        self.rejected = 0
+        self.forbidden = 0
+
+    def full(self) -> bool:
+        return len(self.connections) >= self.max_connections
+
+    def origin_allowed(self, origin: Optional[str], host: Optional[str]) -> bool:
+        if origin is None:
+            return True
+        return urlsplit(origin).netloc == host or origin.rstrip("/") in self.allowed_origins
+
+    def add(self, conn: ChatConnection) -> None:
+        self.connections.add(conn)
+
+    def remove(self, conn: ChatConnection) -> None:
+        self.connections.discard(conn)
+        for task in conn.in_flight.values():
+            task.cancel()
+
+    def parse(self, frame: Optional[str]) -> dict:
+        # Raises ValueError for frames the handler should close the socket on.
+        if frame is None:
+            raise ValueError("Binary frames are not supported")
+        if len(frame) > self.max_frame_bytes:
+            raise ValueError("Frame too large")
+        try:
+            message = json.loads(frame)
+        except ValueError:
+            raise ValueError("Frames must be JSON")
+        if not isinstance(message, dict) or not isinstance(message.get("type"), str):
+            raise ValueError("Frames must be JSON objects with a type")
+        return message
+
+    def needs_reauth(self, conn: ChatConnection) -> bool:
+        return conn.user is not None and time.monotonic() - conn.authenticated_at > self.reauth_seconds
+
+    async def run(self) -> None:
+        # Started once per worker at startup.
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            cutoff = time.monotonic() - self.idle_seconds
+            conns = list(self.connections)
+            for start in range(0, len(conns), 500):
+                await asyncio.gather(*(self._beat(c, cutoff) for c in conns[start:start + 500]))
+
+    async def _beat(self, conn: ChatConnection, cutoff: float) -> None:
+        try:
+            if conn.last_seen < cutoff and not conn.in_flight:
+                await asyncio.wait_for(conn.close(CLOSE_GOING_AWAY), 5)
+            else:
+                await asyncio.wait_for(conn.send({"type": "heartbeat"}), 5)
+        except asyncio.TimeoutError:
+            # A stalled peer; it is closed once it goes idle.
+            logger.info("Heartbeat to a chat socket timed out")
+
+    async def close_all(self) -> None:
+        await asyncio.gather(*(c.close(CLOSE_GOING_AWAY) for c in list(self.connections)))
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.connections),
+            "max_connections": self.max_connections,
+            "in_flight": sum(len(c.in_flight) for c in self.connections),
+            "rejected": self.rejected,
+            "forbidden_origins": self.forbidden,
+        }
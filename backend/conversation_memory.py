@@ -0,0 +1,181 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from tenancy import current_tenant
+
+# Each turn is clipped before it is kept so a single long answer cannot blow
+# up the window; turns that leave the window are folded into the summary.
+TURN_QUERY_CHARS = 300
+TURN_RESPONSE_CHARS = 600
+SUMMARY_LINE_CHARS = 160
+# Attempts at writing a turn when other workers keep updating the session.
+APPEND_RETRIES = 3
+
+class ConversationConflict(Exception):
+    pass
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+class Conversation:
+    def __init__(self, session_id: str, user_id: Optional[str] = None,
+                 turns: Optional[List[dict]] = None, summary: str = "", version: int = 0):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.turns = turns or []
+        self.summary = summary
+        # Writes made to the stored document; 0 while it does not exist.
+        self.version = version
+        self.last_active = time.monotonic()
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "Conversation":
+        return cls(doc["session_id"], doc.get("user_id"), doc.get("turns", []), doc.get("summary", ""),
+                   doc.get("version", 1))
+
+    def to_doc(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "user_id": self.user_id,
+            "turns": self.turns,
+            "summary": self.summary,
+            "updated_at": datetime.now(timezone.utc),
+        }
+
+class ConversationStore:
+    # Bounded per-session chat memory: the last `max_turns` turns verbatim plus
+    # a rolling extractive summary capped at `summary_chars`, so the prompt
+    # section has a fixed upper size however long the conversation runs.
+    # Conversations live in an in-process LRU (the hot tier) and are written
+    # through to Mongo so other workers and restarts can pick them up. Writes
+    # are conditional on the version the hot copy was read at; when another
+    # worker got there first, the stored conversation is reloaded and the
+    # turn applied on top of it.
+    # The hot tier is partitioned by campus; when it is full the campus with
+    # the most conversations loses its least recently used one.
+    def __init__(self, collection, max_turns: int = 6, summary_chars: int = 1200,
+                 idle_seconds: int = 1800, max_sessions: int = 10000):
+        self.collection = collection
+        self.max_turns = max_turns
+        self.summary_chars = summary_chars
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max_sessions
+        self._hot: Dict[str, "OrderedDict[str, Conversation]"] = {}
+        self._size = 0
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index("session_id", unique=True)
+        # Persisted conversations expire after a week without activity.
+        await self.collection.create_index("updated_at", expireAfterSeconds=7 * 24 * 3600)
+
+    async def get(self, session_id: str, user_id: Optional[str]) -> Conversation:
+        tenant = current_tenant()
+        conv = self._hot.get(tenant, {}).get(session_id)
+        if conv is None:
+            doc = await self.collection.find_one({"session_id": session_id}, {"_id": 0})
+            conv = Conversation.from_doc(doc) if doc else Conversation(session_id, user_id)
+            self._remember(tenant, conv)
+        # Never hand one user's conversation to another caller reusing its
+        # id; the caller gets a new session instead (check conv.session_id).
+        if conv.user_id != user_id:
+            conv = Conversation(str(uuid.uuid4()), user_id)
+            self._remember(tenant, conv)
+        self._hot[tenant].move_to_end(conv.session_id)
+        conv.last_active = time.monotonic()
+        return conv
+
+    async def append(self, conv: Conversation, query: str, response: str) -> None:
+        turn = {
+            "query": _clip(query, TURN_QUERY_CHARS),
+            "response": _clip(response, TURN_RESPONSE_CHARS),
+        }
+        for _ in range(APPEND_RETRIES):
+            self._add_turn(conv, turn)
+            if await self._write(conv):
+                return
+            # Someone else wrote the session since this copy was read.
+            doc = await self.collection.find_one({"session_id": conv.session_id}, {"_id": 0})
+            if doc is None or doc.get("user_id") != conv.user_id:
+                # Expired meanwhile (start it over), or claimed by another
+                # user (start over under a new id).
+                if doc is not None:
+                    conv.session_id = str(uuid.uuid4())
+                conv.turns, conv.summary, conv.version = [], "", 0
+                continue
+            fresh = Conversation.from_doc(doc)
+            conv.turns, conv.summary, conv.version = fresh.turns, fresh.summary, fresh.version
+        raise ConversationConflict(f"Conversation {conv.session_id} kept changing while saving a turn")
+
+    async def _write(self, conv: Conversation) -> bool:
+        # Stored documents from before versioning have no version field.
+        version = {"$in": [conv.version, None]} if conv.version == 1 else conv.version
+        try:
+            result = await self.collection.update_one(
+                {"session_id": conv.session_id, "user_id": conv.user_id, "version": version},
+                {"$set": {**conv.to_doc(), "version": conv.version + 1}},
+                upsert=conv.version == 0,
+            )
+        except DuplicateKeyError:
+            # The upsert lost a race with another worker creating the session.
+            return False
+        if not result.matched_count and result.upserted_id is None:
+            return False
+        conv.version += 1
+        return True
+
+    def _add_turn(self, conv: Conversation, turn: dict) -> None:
+        conv.turns.append(dict(turn))
+        while len(conv.turns) > self.max_turns:
+            old = conv.turns.pop(0)
+            line = f"- Asked: {_clip(old['query'], SUMMARY_LINE_CHARS // 2)} | Answered: {_clip(old['response'], SUMMARY_LINE_CHARS // 2)}"
+            summary = f"{conv.summary}\n{line}" if conv.summary else line
+            # Drop the oldest summary lines once the cap is hit.
+            while len(summary) > self.summary_chars and "\n" in summary:
+                summary = summary.split("\n", 1)[1]
+            conv.summary = summary[-self.summary_chars:]
+        conv.last_active = time.monotonic()
+
+    def render(self, conv: Conversation) -> str:
+        if not conv.turns and not conv.summary:
+            return ""
+        out = "\nConversation so far:\n"
+        if conv.summary:
+            out += f"Earlier in this conversation:\n{conv.summary}\n"
+        for turn in conv.turns:
+            out += f"Student: {turn['query']}\nAssistant: {turn['response']}\n"
+        return out
+
+    def evict_idle(self) -> int:
+        # Only drops the hot copy; the Mongo document is the durable tier.
+        cutoff = time.monotonic() - self.idle_seconds
+        evicted = 0
+        for tenant, hot in list(self._hot.items()):
+            for sid in [sid for sid, conv in hot.items() if conv.last_active < cutoff]:
+                del hot[sid]
+                evicted += 1
+            if not hot:
+                del self._hot[tenant]
+        self._size -= evicted
+        return evicted
+
+    async def run_eviction(self, interval: float = 60.0) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_idle()
+
+    def _remember(self, tenant: str, conv: Conversation) -> None:
+        hot = self._hot.setdefault(tenant, OrderedDict())
+        if conv.session_id not in hot:
+            self._size += 1
+        hot[conv.session_id] = conv
+        while self._size > self.max_sessions:
+            victim = max(self._hot, key=lambda t: len(self._hot[t]))
+            self._hot[victim].popitem(last=False)
+            self._size -= 1
@@ -0,0 +1,73 @@
+from datetime import datetime
+from typing import List
+
+from bson import ObjectId
+
+# Pure CPU-bound helpers of the API that CPUPool (offload.py) may run in a
+# worker process: keep this module cheap to import and free of app state.
+# They return their result rather than relying on in-place changes, since a
+# worker process mutates a copy.
+
+def stringify_object_ids(obj):
+    # Recursively convert bson.ObjectId to str so JSON serialization succeeds.
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, dict):
+        return {k: stringify_object_ids(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [stringify_object_ids(v) for v in obj]
+    return obj
+
+def parse_timestamps(docs: List[dict], fields=("created_at",)) -> List[dict]:
+    # ISO strings as stored -> datetimes, for the response models.
+    for doc in docs:
+        for field in fields:
+            if isinstance(doc.get(field), str):
+                doc[field] = datetime.fromisoformat(doc[field])
+    return docs
+
+def faculty_rank(f: dict) -> int:
+    role = f.get("role", "").lower()
+    if "principal" in role or "coordinator" in role:
+        return 0
+    elif "hod" in role or "head" in role:
+        return 1
+    elif "professor" in role:
+        return 2
+    else:
+        return 3
+
+def sort_faculty(faculty: List[dict]) -> List[dict]:
+    faculty = parse_timestamps(faculty)
+    faculty.sort(key=faculty_rank)
+    return faculty
+
+def render_context(data: dict) -> str:
+    parts = ["You are a helpful campus assistant. Use the following campus information to answer the student's question:\n\n"]
+
+    if data.get("faqs"):
+        parts.append("FAQs:\n")
+        for faq in data["faqs"]:
+            parts.append(f"Q: {faq['question']}\nA: {faq['answer']}\n\n")
+
+    if data.get("departments"):
+        parts.append("\nDepartments:\n")
+        for dept in data["departments"]:
+            parts.append(f"- {dept['position']}: {dept['name']} (Contact: {dept['contact']})\n")
+
+    if data.get("faculty"):
+        parts.append("\nFaculty:\n")
+        for f in data["faculty"]:
+            parts.append(f"- {f['name']} - {f['role']} (Qualification: {f['qualification']}): {f['bio']} (Office: {f['office']})\n")
+
+    if data.get("events"):
+        parts.append("\nUpcoming Events:\n")
+        for event in data["events"]:
+            parts.append(f"- {event['title']}: {event['description']} (Date: {event['date']}, Location: {event['location']})\n")
+
+    if data.get("locations"):
+        parts.append("\nCampus Locations:\n")
+        for loc in data["locations"]:
+            parts.append(f"- {loc['name']} (Floor: {loc['floor']})\n")
+
+    return "".join(parts)
@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+from dateutil import parser as date_parser
+
+# Separators accepted between the start and end of an event date range, e.g.
+# "2025-03-15 to 2025-03-17". Plain "-" is not one of them because it appears
+# inside ISO dates.
+EVENT_DATE_RANGE_SEPARATORS = (" to ", " - ", " – ", " — ", " until ")
+
+def _parse_event_datetime(value: str) -> Optional[datetime]:
+    try:
+        parsed = date_parser.parse(value.strip(), fuzzy=True)
+    except (ValueError, OverflowError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+def parse_event_dates(date_str: Optional[str]):
+    # Normalize the free-form Event.date display string into (start_at, end_at)
+    # ISO strings. Either value is None when it cannot be parsed.
+    if not date_str or not date_str.strip():
+        return None, None
+    for sep in EVENT_DATE_RANGE_SEPARATORS:
+        if sep in date_str:
+            start_part, end_part = date_str.split(sep, 1)
+            start = _parse_event_datetime(start_part)
+            end = _parse_event_datetime(end_part)
+            if start:
+                if end and end < start:
+                    end = None
+                return start.isoformat(), end.isoformat() if end else None
+    start = _parse_event_datetime(date_str)
+    return (start.isoformat() if start else None), None
+
+def upcoming_events_filter(now: Optional[datetime] = None) -> dict:
+    # Date-only events parse to midnight, so anything starting today still
+    # counts as upcoming; multi-day events stay listed until their end.
+    now = now or datetime.now(timezone.utc)
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return {
+        "$or": [
+            {"start_at": {"$gte": today.isoformat()}},
+            {"end_at": {"$gte": now.isoformat()}},
+        ]
+    }
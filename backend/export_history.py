@@ -0,0 +1,223 @@
+import argparse
+import asyncio
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from chat_store import make_chat_history
+from mongo_client import create_client
+from offload import run_inline
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Chunked chat_history exports for offline analytics. Rows are read from the
+# history store (either layout, see chat_store.py) in timestamp order and
+# converted one chunk at a time, so the whole collection is never in memory.
+# `since` is exclusive and `until` inclusive: an export's `until` is the
+# `since` of the next incremental run. Converting a chunk is CPU-bound; the
+# app passes its CPUPool.run (offload.py) as `run` to keep it off the event
+# loop, scripts convert inline.
+
+EXPORT_COLUMNS = ["id", "user_id", "query", "response", "timestamp"]
+DEFAULT_CHUNK_ROWS = 10000
+
+def normalize_timestamp(value) -> str:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+def export_filter(since: Optional[str] = None, until: Optional[str] = None, user_id: Optional[str] = None) -> dict:
+    query = {}
+    bounds = {}
+    if since:
+        bounds["$gt"] = normalize_timestamp(since)
+    if until:
+        bounds["$lte"] = normalize_timestamp(until)
+    if bounds:
+        query["timestamp"] = bounds
+    if user_id:
+        query["user_id"] = user_id
+    return query
+
+async def iter_rows(history, query: dict, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+    bounds = query.get("timestamp", {})
+    cursor = history.find(query, newest_first=False, min_ts=bounds.get("$gt"), max_ts=bounds.get("$lte"))
+    cursor = cursor.batch_size(min(chunk_rows, 5000))
+    rows = []
+    async for doc in cursor:
+        rows.append(doc)
+        if len(rows) >= chunk_rows:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+async def iter_frames(history, query: dict, chunk_rows: int = DEFAULT_CHUNK_ROWS, run=run_inline):
+    async for rows in iter_rows(history, query, chunk_rows):
+        yield await run(to_frame, rows, size=len(rows))
+
+def to_frame(rows) -> pd.DataFrame:
+    frame = pd.DataFrame.from_records(rows, columns=EXPORT_COLUMNS)
+    frame["timestamp"] = pd.to_datetime(frame["timestamp"], utc=True, format="ISO8601")
+    for column in ("id", "user_id", "query", "response"):
+        frame[column] = frame[column].astype("string")
+    return frame
+
+def csv_chunk(rows, header: bool) -> str:
+    return to_frame(rows).to_csv(index=False, header=header, date_format="%Y-%m-%dT%H:%M:%S.%fZ")
+
+async def iter_csv(history, query: dict, chunk_rows: int = DEFAULT_CHUNK_ROWS, run=run_inline):
+    header = True
+    async for rows in iter_rows(history, query, chunk_rows):
+        yield await run(csv_chunk, rows, header, size=len(rows))
+        header = False
+    if header:
+        # Empty export still gets a header row.
+        yield ",".join(EXPORT_COLUMNS) + "\n"
+
+class _ByteSink:
+    # Minimal writable file for ParquetWriter; drained after every row group.
+    def __init__(self):
+        self.buffer = bytearray()
+        self.closed = False
+
+    def write(self, data):
+        self.buffer.extend(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+def _parquet_modules():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    return pa, pq
+
+def parquet_schema():
+    pa, _ = _parquet_modules()
+    return pa.schema([
+        ("id", pa.string()),
+        ("user_id", pa.string()),
+        ("query", pa.string()),
+        ("response", pa.string()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+    ])
+
+def arrow_chunk(rows):
+    pa, _ = _parquet_modules()
+    return pa.Table.from_pandas(to_frame(rows), schema=parquet_schema(), preserve_index=False)
+
+async def iter_parquet(history, query: dict, chunk_rows: int = DEFAULT_CHUNK_ROWS, run=run_inline):
+    # Each chunk becomes one row group; bytes are yielded as soon as a row
+    # group is written, and the footer comes with the final chunk. The writer
+    # (compression) cannot leave this process, so it runs local.
+    pa, pq = _parquet_modules()
+    schema = parquet_schema()
+    sink = _ByteSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+    try:
+        async for rows in iter_rows(history, query, chunk_rows):
+            table = await run(arrow_chunk, rows, size=len(rows))
+            await run(writer.write_table, table, size=table.num_rows, local=True)
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+def summarize_frame(frame: pd.DataFrame) -> dict:
+    # Per-chunk stats for CLI progress output.
+    return {
+        "rows": len(frame),
+        "users": int(frame["user_id"].nunique()),
+        "avg_query_chars": float(np.round(frame["query"].str.len().mean(), 1)) if len(frame) else 0.0,
+        "last_timestamp": frame["timestamp"].iloc[-1].isoformat() if len(frame) else None,
+    }
+
+async def export_to_file(history, path: Path, fmt: str, query: dict, chunk_rows: int) -> int:
+    # Written to a temporary file and renamed, so an interrupted run never
+    # leaves a partial export behind the watermark.
+    tmp = path.with_suffix(path.suffix + ".part")
+    rows = 0
+    if fmt == "csv":
+        with open(tmp, "w", newline="") as fh:
+            header = True
+            async for frame in iter_frames(history, query, chunk_rows):
+                frame.to_csv(fh, index=False, header=header, date_format="%Y-%m-%dT%H:%M:%S.%fZ")
+                header = False
+                rows += len(frame)
+                print(f"  {summarize_frame(frame)}")
+            if header:
+                fh.write(",".join(EXPORT_COLUMNS) + "\n")
+    else:
+        pa, pq = _parquet_modules()
+        schema = parquet_schema()
+        with pq.ParquetWriter(str(tmp), schema, compression="zstd") as writer:
+            async for frame in iter_frames(history, query, chunk_rows):
+                writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+                rows += len(frame)
+                print(f"  {summarize_frame(frame)}")
+    tmp.replace(path)
+    return rows
+
+async def export_history(args):
+    client = create_client()
+    db = client[os.environ['DB_NAME']]
+    history = make_chat_history(db, os.environ.get("CHAT_HISTORY_LAYOUT", "flat"))
+
+    state_path = Path(args.state) if args.state else None
+    since = args.since
+    if args.resume and state_path and state_path.exists():
+        since = json.loads(state_path.read_text())["watermark"]
+        print(f"Resuming after watermark {since}")
+    until = normalize_timestamp(args.until) if args.until else datetime.now(timezone.utc).isoformat()
+
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stamp = until.replace(":", "").replace("+", "_")
+    path = out_dir / f"chat_history_{stamp}.{args.format}"
+
+    print(f"Exporting chat_history ({since or 'beginning'} .. {until}] to {path}...")
+    rows = await export_to_file(history, path, args.format, export_filter(since, until, args.user_id), args.chunk_rows)
+    print(f"✓ Exported {rows:,} rows to {path}")
+
+    if state_path:
+        state_path.write_text(json.dumps({"watermark": until, "last_file": str(path), "rows": rows}))
+        print(f"✓ Watermark saved to {state_path}")
+
+    client.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export chat_history to CSV or Parquet in chunks.")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="parquet")
+    parser.add_argument("--since", help="Only rows after this ISO timestamp (exclusive)")
+    parser.add_argument("--until", help="Only rows up to this ISO timestamp (inclusive, default now)")
+    parser.add_argument("--user-id")
+    parser.add_argument("--out-dir", default="exports")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--state", default="exports/chat_history_state.json",
+                        help="Watermark file used by --resume")
+    parser.add_argument("--resume", action="store_true", help="Continue from the watermark in --state")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(export_history(parse_args()))
@@ -0,0 +1,204 @@
+import hashlib
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from pymongo.errors import BulkWriteError
+
+from offload import run_inline
+
+# MinHash signatures over character shingles of each FAQ's question and
+# answer, banded for LSH. Signatures live in their own collection so the FAQ
+# documents read by the list endpoints and chat context stay small.
+#
+# With 32 bands of 4 rows, pairs above ~0.6 estimated Jaccard almost always
+# share a band (so the default 0.7 threshold loses little recall), while
+# pairs below ~0.2 almost never do.
+
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+MAX_BUCKET_SIZE = 500
+# Members of a bigger bucket are each compared with this many of its members.
+BUCKET_SAMPLE_SIZE = 20
+# Signatures fetched per query when clustering.
+SIGNATURE_BATCH = 1000
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, (1 << 32) - 1, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, (1 << 32) - 1, size=NUM_PERM, dtype=np.uint64)
+
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+
+def normalize(text: str) -> str:
+    return " ".join(_NON_WORD.sub(" ", text.lower()).split())
+
+def shingles(text: str) -> set:
+    text = normalize(text)
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+def faq_text(faq: dict) -> str:
+    return f"{faq.get('question', '')} {faq.get('answer', '')}"
+
+def minhash(text: str) -> np.ndarray:
+    items = shingles(text)
+    if not items:
+        return np.full(NUM_PERM, _MAX_HASH, dtype=np.uint64)
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "little") for s in items],
+        dtype=np.uint64,
+    )
+    # Universal hashing (a*x + b) mod p for all permutations at once.
+    permuted = ((np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME) & _MAX_HASH
+    return permuted.min(axis=0)
+
+def band_keys(signature) -> List[str]:
+    signature = np.asarray(signature, dtype=np.uint64)
+    return [
+        f"{band}:{hashlib.blake2b(signature[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8).hexdigest()}"
+        for band in range(BANDS)
+    ]
+
+def similarity(sig_a, sig_b) -> float:
+    return float(np.mean(np.asarray(sig_a) == np.asarray(sig_b)))
+
+def signature_doc(faq: dict) -> dict:
+    signature = minhash(faq_text(faq))
+    return {"faq_id": faq["id"], "signature": [int(v) for v in signature], "bands": band_keys(signature)}
+
+def signature_docs(faqs: List[dict]) -> List[dict]:
+    return [signature_doc(faq) for faq in faqs]
+
+class FAQDuplicateIndex:
+    def __init__(self, collection, threshold: float = 0.7, run=run_inline):
+        # run: how signing and clustering of many FAQs is executed (offload.py).
+        self.collection = collection
+        self.threshold = threshold
+        self.run = run
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index("faq_id", unique=True)
+        await self.collection.create_index("bands")
+
+    async def upsert(self, faq: dict) -> dict:
+        doc = signature_doc(faq)
+        await self.collection.update_one({"faq_id": faq["id"]}, {"$set": doc}, upsert=True)
+        return doc
+
+    async def remove(self, faq_id: str) -> None:
+        await self.collection.delete_one({"faq_id": faq_id})
+
+    async def find_similar(self, faq: dict, exclude_id: Optional[str] = None) -> List[Tuple[str, float]]:
+        # Candidates are FAQs sharing at least one LSH band; only those get
+        # an exact signature comparison.
+        doc = signature_doc(faq)
+        matches = []
+        async for cand in self.collection.find({"bands": {"$in": doc["bands"]}}, {"_id": 0, "faq_id": 1, "signature": 1}):
+            if cand["faq_id"] == exclude_id:
+                continue
+            score = similarity(doc["signature"], cand["signature"])
+            if score >= self.threshold:
+                matches.append((cand["faq_id"], round(score, 3)))
+        return sorted(matches, key=lambda m: m[1], reverse=True)
+
+    async def backfill(self, faqs_collection, batch_size: int = 1000) -> int:
+        # Signs FAQs that predate the index (or were written by scripts).
+        signed = set(await self.collection.distinct("faq_id"))
+        pending, written = [], 0
+        async for faq in faqs_collection.find({}, {"_id": 0, "id": 1, "question": 1, "answer": 1}):
+            if faq["id"] in signed:
+                continue
+            pending.append(faq)
+            if len(pending) >= batch_size:
+                written += await self._sign(pending)
+                pending = []
+        if pending:
+            written += await self._sign(pending)
+        return written
+
+    async def _sign(self, faqs: List[dict]) -> int:
+        docs = await self.run(signature_docs, faqs, size=len(faqs))
+        try:
+            await self.collection.insert_many(docs, ordered=False)
+        except BulkWriteError as exc:
+            # Another worker signed some of them first (duplicate key).
+            if any(error["code"] != 11000 for error in exc.details["writeErrors"]):
+                raise
+            return exc.details["nInserted"]
+        return len(docs)
+
+    async def clusters(self) -> Tuple[List[List[Tuple[str, float]]], int]:
+        # The database groups FAQs by band key and returns only buckets with
+        # at least two members, as id lists. Only the signatures of FAQs in
+        # those buckets are loaded, packed into uint32 arrays (every value is
+        # a 32-bit hash), for exact checks of the pairs that share a bucket;
+        # union-find groups them into clusters. Also returns how many
+        # oversized buckets were only sampled.
+        buckets: Dict[str, List[str]] = {}
+        async for bucket in self.collection.aggregate([
+            {"$project": {"_id": 0, "faq_id": 1, "bands": 1}},
+            {"$unwind": "$bands"},
+            {"$group": {"_id": "$bands", "members": {"$push": "$faq_id"}, "size": {"$sum": 1}}},
+            {"$match": {"size": {"$gte": 2}}},
+        ], allowDiskUse=True):
+            buckets[bucket["_id"]] = bucket["members"]
+        candidates = sorted({faq_id for members in buckets.values() for faq_id in members})
+        signatures: Dict[str, np.ndarray] = {}
+        for start in range(0, len(candidates), SIGNATURE_BATCH):
+            batch = candidates[start:start + SIGNATURE_BATCH]
+            async for doc in self.collection.find({"faq_id": {"$in": batch}}, {"_id": 0, "faq_id": 1, "signature": 1}):
+                signatures[doc["faq_id"]] = np.asarray(doc["signature"], dtype=np.uint32)
+        return await self.run(cluster_signatures, signatures, buckets, self.threshold, size=len(signatures))
+
+def _bucket_pairs(members: List[str]):
+    if len(members) <= MAX_BUCKET_SIZE:
+        return ((a, b) for i, a in enumerate(members) for b in members[i + 1:])
+    # Huge buckets come from heavily duplicated text (empty answers, one
+    # template copied everywhere) and would make this quadratic. Each member
+    # is compared with an evenly spaced sample instead, which still puts the
+    # copies of one text in one cluster.
+    step = len(members) / BUCKET_SAMPLE_SIZE
+    sample = [members[int(i * step)] for i in range(BUCKET_SAMPLE_SIZE)]
+    return ((a, b) for a in sample for b in members if a != b)
+
+def cluster_signatures(signatures: Dict[str, np.ndarray], buckets: Dict[str, List[str]],
+                       threshold: float) -> Tuple[List[List[Tuple[str, float]]], int]:
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    best = {}
+    checked = set()
+    sampled = 0
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        sampled += len(members) > MAX_BUCKET_SIZE
+        for a, b in _bucket_pairs(members):
+            pair = (a, b) if a < b else (b, a)
+            if pair in checked:
+                continue
+            checked.add(pair)
+            score = similarity(signatures[a], signatures[b])
+            if score >= threshold:
+                parent[find(a)] = find(b)
+                best[a] = max(best.get(a, 0.0), score)
+                best[b] = max(best.get(b, 0.0), score)
+
+    groups: Dict[str, list] = {}
+    for faq_id in best:
+        groups.setdefault(find(faq_id), []).append((faq_id, round(best[faq_id], 3)))
+    return sorted(groups.values(), key=len, reverse=True), sampled
+
+def cluster_ids(clusters: Iterable[List[Tuple[str, float]]]) -> List[str]:
+    return [faq_id for cluster in clusters for faq_id, _ in cluster]
@@ -0,0 +1,130 @@
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from tenancy import current_tenant
+
+# Gemini token accounting. Every upstream call is rolled up into one document
+# per (day, user_id, intent) in `gemini_usage`, so per-day, per-user and
+# per-intent reports are small aggregations however many chats there were.
+# The same rollup backs the daily token budget: once a campus has used
+# daily_token_budget tokens (UTC day), chat switches to its over-budget mode
+# until midnight. Each worker refreshes today's total from Mongo every
+# refresh_seconds and adds its own calls in between, so the budget is soft by
+# a few seconds' worth of traffic.
+
+USAGE_DIMENSIONS = {"day": "$day", "user": "$user_id", "intent": "$intent"}
+OVER_BUDGET_MODES = ("short_context", "cache_only")
+ANONYMOUS = "anonymous"
+
+def usage_from_response(data, latency_ms: float, model: str) -> dict:
+    meta = (data.get("usageMetadata") if isinstance(data, dict) else None) or {}
+    prompt = meta.get("promptTokenCount", 0)
+    candidates = meta.get("candidatesTokenCount", 0)
+    return {
+        "model": model,
+        "prompt_tokens": prompt,
+        "candidate_tokens": candidates,
+        "total_tokens": meta.get("totalTokenCount", prompt + candidates),
+        "latency_ms": round(latency_ms, 1),
+    }
+
+def _today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+class UsageTracker:
+    def __init__(self, collection, daily_token_budget: int = 0, refresh_seconds: float = 10.0,
+                 price_per_mtok_input: float = 0.0, price_per_mtok_output: float = 0.0):
+        self.collection = collection
+        self.daily_token_budget = daily_token_budget
+        self.refresh_seconds = refresh_seconds
+        self.price_per_mtok_input = price_per_mtok_input
+        self.price_per_mtok_output = price_per_mtok_output
+        # tenant -> (day, tokens, refreshed_at)
+        self._today: Dict[str, Tuple[str, int, float]] = {}
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index([("day", 1), ("user_id", 1), ("intent", 1)], unique=True)
+
+    async def record(self, usage: dict, user_id: Optional[str], intent: str, degraded: bool = False) -> None:
+        day = _today()
+        await self.collection.update_one(
+            {"day": day, "user_id": user_id or ANONYMOUS, "intent": intent},
+            {"$inc": {
+                "requests": 1,
+                "degraded": int(degraded),
+                "prompt_tokens": usage["prompt_tokens"],
+                "candidate_tokens": usage["candidate_tokens"],
+                "total_tokens": usage["total_tokens"],
+                "latency_ms": usage["latency_ms"],
+            }},
+            upsert=True,
+        )
+        cached = self._today.get(current_tenant())
+        if cached and cached[0] == day:
+            self._today[current_tenant()] = (day, cached[1] + usage["total_tokens"], cached[2])
+
+    async def tokens_today(self) -> int:
+        day, tenant = _today(), current_tenant()
+        cached = self._today.get(tenant)
+        if cached and cached[0] == day and time.monotonic() - cached[2] < self.refresh_seconds:
+            return cached[1]
+        rows = await self.collection.aggregate([
+            {"$match": {"day": day}},
+            {"$group": {"_id": None, "tokens": {"$sum": "$total_tokens"}}},
+        ]).to_list(1)
+        tokens = rows[0]["tokens"] if rows else 0
+        self._today[tenant] = (day, tokens, time.monotonic())
+        return tokens
+
+    async def over_budget(self) -> bool:
+        return self.daily_token_budget > 0 and await self.tokens_today() >= self.daily_token_budget
+
+    async def budget_status(self) -> dict:
+        tokens = await self.tokens_today()
+        return {
+            "day": _today(),
+            "tokens_used": tokens,
+            "daily_token_budget": self.daily_token_budget or None,
+            "over_budget": self.daily_token_budget > 0 and tokens >= self.daily_token_budget,
+        }
+
+    async def summary(self, dimension: str, since: Optional[str] = None, until: Optional[str] = None,
+                      limit: int = 100) -> list:
+        # since/until are inclusive YYYY-MM-DD days. Days come back in date
+        # order, users and intents by tokens used.
+        match = {}
+        if since or until:
+            match["day"] = {**({"$gte": since} if since else {}), **({"$lte": until} if until else {})}
+        rows = await self.collection.aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": USAGE_DIMENSIONS[dimension],
+                "requests": {"$sum": "$requests"},
+                "degraded": {"$sum": "$degraded"},
+                "prompt_tokens": {"$sum": "$prompt_tokens"},
+                "candidate_tokens": {"$sum": "$candidate_tokens"},
+                "total_tokens": {"$sum": "$total_tokens"},
+                "latency_ms": {"$sum": "$latency_ms"},
+            }},
+            {"$sort": {"_id": 1} if dimension == "day" else {"total_tokens": -1}},
+            {"$limit": limit},
+        ]).to_list(limit)
+        return [self._row(dimension, row) for row in rows]
+
+    def _row(self, dimension: str, row: dict) -> dict:
+        requests = row["requests"] or 1
+        out = {
+            dimension: row["_id"],
+            "requests": row["requests"],
+            "degraded": row["degraded"],
+            "prompt_tokens": row["prompt_tokens"],
+            "candidate_tokens": row["candidate_tokens"],
+            "total_tokens": row["total_tokens"],
+            "avg_prompt_tokens": round(row["prompt_tokens"] / requests, 1),
+            "avg_latency_ms": round(row["latency_ms"] / requests, 1),
+        }
+        if self.price_per_mtok_input or self.price_per_mtok_output:
+            out["cost"] = round((row["prompt_tokens"] * self.price_per_mtok_input
+                                 + row["candidate_tokens"] * self.price_per_mtok_output) / 1_000_000, 6)
+        return out
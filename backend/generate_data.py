@@ -0,0 +1,268 @@
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+import os
+
+from dotenv import load_dotenv
+from pymongo import ReplaceOne
+
+from mongo_client import create_client
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Synthetic campus data in the same document shapes as seed_data.py, but of
+# configurable size. Everything is derived from --seed, including ids, so a
+# re-run with --upsert rewrites the same documents instead of adding new ones.
+
+ID_NAMESPACE = uuid.UUID("6f1c8c3e-3a55-4c1e-9a57-6a0f4f1d2b10")
+BASE_DATE = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+FIRST_NAMES = ["Rajesh", "Priya", "Amit", "Sarah", "Michael", "Emily", "David", "Anjali", "Rohan",
+               "Sneha", "Vikram", "Meera", "Arjun", "Kavya", "James", "Olivia", "Farhan", "Neha"]
+LAST_NAMES = ["Kumar", "Sharma", "Patel", "Johnson", "Chen", "Rodriguez", "Williams", "Iyer",
+              "Gupta", "Reddy", "Singh", "Nair", "Das", "Brown", "Khan", "Joshi"]
+SUBJECTS = ["Computer Science", "Mechanical Engineering", "Electronics", "Civil Engineering",
+            "Mathematics", "Physics", "Chemistry", "Literature", "Economics", "Business Administration"]
+ROLES = ["Principal", "Coordinator", "Professor & HOD", "Professor", "Associate Professor",
+         "Assistant Professor", "Lecturer", "Lab Instructor"]
+BUILDINGS = ["Administration Building", "Engineering Building", "Business Hall", "Science Block",
+             "Liberal Arts Building", "Academic Building", "Library Annex"]
+FLOORS = ["Ground Floor", "1st Floor", "2nd Floor", "3rd Floor", "4th Floor", "5th Floor"]
+ROOM_KINDS = ["Classroom", "Computer Lab", "Seminar Hall", "Office", "Physics Lab", "Reading Room", "Staff Room"]
+POSITIONS = ["General Secretary", "Event Secretary", "Sports Secretary", "Cultural Secretary",
+             "Technical Secretary", "Treasurer", "Class Representative", "Hostel Secretary"]
+FAQ_CATEGORIES = {
+    "Admissions": ["admission requirements", "application deadline", "entrance exam", "document verification"],
+    "Academic": ["class registration", "exam schedule", "grading policy", "course withdrawal", "attendance rules"],
+    "Financial": ["financial aid", "fee payment", "scholarships", "refund policy"],
+    "Campus Life": ["dining options", "clubs and societies", "sports facilities", "gym timings"],
+    "Housing": ["hostel allotment", "room change", "hostel curfew", "laundry service"],
+    "Campus Services": ["parking permit", "ID card replacement", "wifi access", "library membership"],
+}
+QUESTION_TEMPLATES = ["What is the {topic}?", "How does the {topic} work?", "Where can I find the {topic}?",
+                      "Who handles the {topic}?", "When is the {topic} announced?", "Can you explain the {topic}?"]
+EVENT_KINDS = ["Workshop", "Seminar", "Hackathon", "Festival", "Career Fair", "Symposium", "Guest Lecture", "Sports Meet"]
+ORGANIZERS = ["Career Services", "Student Activities", "CS Department", "Graduate School", "Sports Council", "Cultural Committee"]
+CHAT_QUESTIONS = ["where is room {n}", "when is the {event}", "who is the hod of {subject}", "what are the library hours",
+                  "how do I apply for {topic}", "what is the fee for {subject}", "is there an exam on monday",
+                  "which floor is the {room}", "contact for {position}", "tell me about {name}"]
+
+def doc_id(seed, collection, index):
+    return str(uuid.uuid5(ID_NAMESPACE, f"{seed}:{collection}:{index}"))
+
+def iso(dt):
+    return dt.isoformat()
+
+def person(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+def gen_faqs(rng, seed, count):
+    categories = list(FAQ_CATEGORIES)
+    for i in range(count):
+        category = rng.choice(categories)
+        topic = rng.choice(FAQ_CATEGORIES[category])
+        created = BASE_DATE + timedelta(minutes=rng.randrange(525600))
+        yield {
+            "id": doc_id(seed, "faqs", i),
+            "question": rng.choice(QUESTION_TEMPLATES).format(topic=topic),
+            "answer": (f"For {topic}, contact the {category} office in the {rng.choice(BUILDINGS)}. "
+                       f"Details are published on the student portal; reference #{i}."),
+            "category": category,
+            "tags": rng.sample(topic.split() + [category.lower()], k=min(2, len(topic.split()) + 1)),
+            "created_at": iso(created),
+            "updated_at": iso(created),
+        }
+
+def gen_departments(rng, seed, count):
+    for i in range(count):
+        name = person(rng)
+        yield {
+            "id": doc_id(seed, "departments", i),
+            "position": rng.choice(POSITIONS),
+            "name": name,
+            "contact": f"{name.split()[0].lower()}.{i}@college.edu",
+            "created_at": iso(BASE_DATE + timedelta(minutes=rng.randrange(525600))),
+        }
+
+def gen_faculty(rng, seed, count):
+    for i in range(count):
+        subject = rng.choice(SUBJECTS)
+        title = rng.choice(["Dr.", "Prof."])
+        yield {
+            "id": doc_id(seed, "faculty", i),
+            "name": f"{title} {person(rng)}",
+            "role": rng.choice(ROLES),
+            "qualification": f"PhD in {subject}" if title == "Dr." else f"M.Tech in {subject}",
+            "bio": f"{rng.randint(2, 30)} years of teaching and research in {subject.lower()}.",
+            "office": f"{rng.choice(BUILDINGS)}, Room {rng.randint(1, 5)}{rng.randint(0, 40):02d}",
+            "created_at": iso(BASE_DATE + timedelta(minutes=rng.randrange(525600))),
+        }
+
+def gen_events(rng, seed, count):
+    for i in range(count):
+        start = BASE_DATE + timedelta(days=rng.randrange(730))
+        kind = rng.choice(EVENT_KINDS)
+        yield {
+            "id": doc_id(seed, "events", i),
+            "title": f"{rng.choice(SUBJECTS)} {kind}",
+            "description": f"{kind} open to all students. Registration on the student portal.",
+            "date": start.date().isoformat(),
+            "start_at": iso(start),
+            "end_at": None,
+            "location": f"{rng.choice(BUILDINGS)}, {rng.choice(ROOM_KINDS)}",
+            "organizer": rng.choice(ORGANIZERS),
+            "created_at": iso(start - timedelta(days=rng.randint(7, 60))),
+        }
+
+def gen_locations(rng, seed, count):
+    for i in range(count):
+        yield {
+            "id": doc_id(seed, "locations", i),
+            "floor": rng.choice(FLOORS),
+            "name": f"{rng.choice(ROOM_KINDS)} {rng.randint(1, 5)}{i % 100:02d}",
+            "created_at": iso(BASE_DATE + timedelta(minutes=rng.randrange(525600))),
+        }
+
+def gen_users(rng, seed, count):
+    for i in range(count):
+        name = person(rng)
+        yield {
+            "id": doc_id(seed, "users", i),
+            "email": f"{name.replace(' ', '.').lower()}.{i}@student.college.edu",
+            "name": name,
+            "picture": "",
+            "is_admin": False,
+            "created_at": iso(BASE_DATE + timedelta(minutes=rng.randrange(525600))),
+        }
+
+def gen_chat_history(rng, seed, count, user_count):
+    # Users get a skewed share of messages (a few heavy users, a long tail),
+    # and timestamps advance monotonically across the whole stream.
+    ts = BASE_DATE
+    for i in range(count):
+        user_index = min(int(rng.paretovariate(1.2)) - 1, user_count - 1) if rng.random() < 0.3 else rng.randrange(user_count)
+        ts += timedelta(seconds=rng.randint(1, 90))
+        question = rng.choice(CHAT_QUESTIONS).format(
+            n=rng.randint(100, 550), event=rng.choice(EVENT_KINDS).lower(), subject=rng.choice(SUBJECTS).lower(),
+            topic=rng.choice(FAQ_CATEGORIES[rng.choice(list(FAQ_CATEGORIES))]), room=rng.choice(ROOM_KINDS).lower(),
+            position=rng.choice(POSITIONS).lower(), name=person(rng),
+        )
+        yield {
+            "id": doc_id(seed, "chat_history", i),
+            "user_id": doc_id(seed, "users", user_index),
+            "query": question,
+            "response": f"Here is what I found about '{question}'. Please check the student portal for updates.",
+            "timestamp": iso(ts),
+        }
+
+def batched(docs, size):
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def load_collection(collection, docs, total, batch_size, concurrency, upsert):
+    # At most `concurrency` batches are in flight, so memory stays bounded by
+    # batch_size * concurrency documents regardless of the total.
+    semaphore = asyncio.Semaphore(concurrency)
+    pending = set()
+    failures = []
+    written = 0
+    started = time.perf_counter()
+    last_report = 0.0
+
+    async def write(batch):
+        nonlocal written
+        try:
+            if upsert:
+                await collection.bulk_write([ReplaceOne({"id": d["id"]}, d, upsert=True) for d in batch], ordered=False)
+            else:
+                await collection.insert_many(batch, ordered=False)
+            written += len(batch)
+        finally:
+            semaphore.release()
+
+    def finished(task):
+        # Finished tasks are dropped from `pending`, so keep their errors.
+        pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            failures.append(task.exception())
+
+    for batch in batched(docs, batch_size):
+        await semaphore.acquire()
+        if failures:
+            # Stop queueing batches after the first failed one.
+            semaphore.release()
+            break
+        task = asyncio.create_task(write(batch))
+        pending.add(task)
+        task.add_done_callback(finished)
+        elapsed = time.perf_counter() - started
+        if elapsed - last_report >= 2:
+            last_report = elapsed
+            print(f"  {collection.name}: {written:,}/{total:,} ({written / elapsed:,.0f} docs/s)")
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    if failures:
+        raise failures[0]
+    elapsed = time.perf_counter() - started
+    print(f"✓ {collection.name}: {written:,} documents in {elapsed:.1f}s ({written / max(elapsed, 1e-9):,.0f} docs/s)")
+
+async def generate(args):
+    client = create_client()
+    db = client[args.db or os.environ['DB_NAME']]
+
+    plan = [
+        ("faqs", args.faqs, lambda rng: gen_faqs(rng, args.seed, args.faqs)),
+        ("departments", args.departments, lambda rng: gen_departments(rng, args.seed, args.departments)),
+        ("faculty", args.faculty, lambda rng: gen_faculty(rng, args.seed, args.faculty)),
+        ("events", args.events, lambda rng: gen_events(rng, args.seed, args.events)),
+        ("locations", args.locations, lambda rng: gen_locations(rng, args.seed, args.locations)),
+        ("users", args.users, lambda rng: gen_users(rng, args.seed, args.users)),
+        ("chat_history", args.chat_history,
+         lambda rng: gen_chat_history(rng, args.seed, args.chat_history, max(args.users, 1))),
+    ]
+
+    mode = "upsert" if args.upsert else "insert"
+    print(f"Generating synthetic campus data (seed={args.seed}, mode={mode})...")
+    if args.upsert:
+        for name, count, _ in plan:
+            if count:
+                await db[name].create_index("id", unique=True)
+    for name, count, make in plan:
+        if not count:
+            continue
+        # One RNG per collection so changing one size doesn't reshuffle the rest.
+        rng = random.Random(f"{args.seed}:{name}")
+        await load_collection(db[name], make(rng), count, args.batch_size, args.concurrency, args.upsert)
+
+    client.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate and bulk-load a synthetic campus dataset.")
+    parser.add_argument("--faqs", type=int, default=1000)
+    parser.add_argument("--departments", type=int, default=50)
+    parser.add_argument("--faculty", type=int, default=500)
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--locations", type=int, default=300)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--chat-history", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--upsert", action="store_true",
+                        help="Replace documents by id instead of inserting, so re-runs are idempotent")
+    parser.add_argument("--db", help="Target database (defaults to DB_NAME)")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(generate(parse_args()))
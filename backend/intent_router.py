@@ -0,0 +1,195 @@
+import json
+import math
+import re
+import sys
+import threading
+from collections import Counter, defaultdict, deque
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Collections that can be rendered into the chat prompt, in prompt order.
+CONTEXT_COLLECTIONS = ("faqs", "departments", "faculty", "events", "locations")
+
+# Keyword/regex rules mapping a question to the collections it needs. A query
+# may hit several intents ("where is Dr. Kumar's office" -> faculty+locations).
+INTENT_RULES = {
+    "faqs": [
+        r"\badmission", r"\bapply\b", r"\bapplication", r"\bdeadline", r"\bfees?\b",
+        r"\btuition", r"\bscholarship", r"\bfinancial aid", r"\bregist(er|ration)",
+        r"\bcourses?\b", r"\bclasses\b", r"\bexams?\b", r"\bresults?\b", r"\bhostel",
+        r"\bhousing", r"\bdorm", r"\bparking", r"\bdining", r"\bcanteen", r"\bmeal",
+        r"\bhow (do|can|should) i\b", r"\bpolicy", r"\brules?\b",
+    ],
+    "departments": [
+        r"\bsecretar", r"\bcommittee", r"\bstudent council", r"\bdepartments?\b",
+        r"\bwho (do i|should i) contact", r"\bcontact\b",
+    ],
+    "faculty": [
+        r"\bprof(essor|\.)?\b", r"\bdr\.?\s", r"\bfaculty", r"\bteachers?\b",
+        r"\blecturers?\b", r"\bhod\b", r"\bhead of", r"\bprincipal\b", r"\bstaff\b",
+        r"\bqualification", r"\bteach(es|ing)?\b",
+    ],
+    "events": [
+        r"\bevents?\b", r"\bfest(ival)?\b", r"\bworkshops?\b", r"\bseminars?\b",
+        r"\bsymposium", r"\bcareer fair", r"\bhackathon", r"\bupcoming\b",
+        r"\bwhat'?s (on|happening)\b", r"\bthis (week|weekend|month)\b",
+    ],
+    "locations": [
+        r"\bwhere\b", r"\broom\s*\w*\d+", r"\bfloor\b", r"\blocat(ed|ion)",
+        r"\bbuilding\b", r"\blab\b", r"\blibrary\b", r"\boffice\b", r"\bclassroom",
+        r"\bhow (do i|to) (get|find)\b",
+    ],
+}
+
+FALLBACK_INTENT = "fallback"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+class NaiveBayesIntentModel:
+    # Small multinomial naive Bayes classifier over query tokens. It is only
+    # consulted when no keyword rule matches, so it can stay tiny.
+    def __init__(self, priors: Dict[str, float], likelihoods: Dict[str, Dict[str, float]],
+                 unknown: Dict[str, float], threshold: float = 0.6):
+        self.priors = priors
+        self.likelihoods = likelihoods
+        self.unknown = unknown
+        self.threshold = threshold
+
+    @classmethod
+    def fit(cls, examples: Iterable[Tuple[str, str]], alpha: float = 1.0, threshold: float = 0.6):
+        label_counts = Counter()
+        token_counts: Dict[str, Counter] = defaultdict(Counter)
+        vocab = set()
+        for text, label in examples:
+            if label not in CONTEXT_COLLECTIONS:
+                raise ValueError(f"Unknown intent label: {label}")
+            label_counts[label] += 1
+            tokens = tokenize(text)
+            token_counts[label].update(tokens)
+            vocab.update(tokens)
+        if not label_counts:
+            raise ValueError("No training examples")
+
+        total = sum(label_counts.values())
+        priors = {label: math.log(count / total) for label, count in label_counts.items()}
+        likelihoods, unknown = {}, {}
+        for label in label_counts:
+            denom = sum(token_counts[label].values()) + alpha * (len(vocab) + 1)
+            likelihoods[label] = {
+                tok: math.log((count + alpha) / denom) for tok, count in token_counts[label].items()
+            }
+            unknown[label] = math.log(alpha / denom)
+        return cls(priors, likelihoods, unknown, threshold)
+
+    def predict(self, text: str) -> List[Tuple[str, float]]:
+        tokens = tokenize(text)
+        if not tokens:
+            return []
+        scores = {}
+        for label, prior in self.priors.items():
+            table = self.likelihoods[label]
+            scores[label] = prior + sum(table.get(tok, self.unknown[label]) for tok in tokens)
+        top = max(scores.values())
+        norm = sum(math.exp(s - top) for s in scores.values())
+        probs = [(label, math.exp(s - top) / norm) for label, s in scores.items()]
+        return sorted(probs, key=lambda p: p[1], reverse=True)
+
+    def save(self, path) -> None:
+        Path(path).write_text(json.dumps({
+            "priors": self.priors,
+            "likelihoods": self.likelihoods,
+            "unknown": self.unknown,
+            "threshold": self.threshold,
+        }))
+
+    @classmethod
+    def load(cls, path):
+        data = json.loads(Path(path).read_text())
+        return cls(data["priors"], data["likelihoods"], data["unknown"], data.get("threshold", 0.6))
+
+class IntentRouter:
+    def __init__(self, rules: Dict[str, List[str]] = INTENT_RULES,
+                 model: Optional[NaiveBayesIntentModel] = None):
+        self.rules = {name: [re.compile(p, re.IGNORECASE) for p in patterns] for name, patterns in rules.items()}
+        self.model = model
+
+    def classify(self, query: str) -> Tuple[str, Tuple[str, ...]]:
+        # Returns (intent label, collections to load). The label is what
+        # metrics are keyed by; unmatched queries fall back to full context.
+        matched = {name for name, patterns in self.rules.items() if any(p.search(query) for p in patterns)}
+        if not matched and self.model is not None:
+            predictions = self.model.predict(query)
+            if predictions and predictions[0][1] >= self.model.threshold:
+                matched = {predictions[0][0]}
+        if not matched:
+            return FALLBACK_INTENT, CONTEXT_COLLECTIONS
+        collections = tuple(c for c in CONTEXT_COLLECTIONS if c in matched)
+        return "+".join(collections), collections
+
+class IntentMetrics:
+    # Per-intent prompt size and latency, kept in process. Percentiles are
+    # computed over a bounded window of recent samples.
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._stats: Dict[str, dict] = {}
+
+    def record(self, intent: str, prompt_chars: int, context_ms: float, total_ms: float) -> None:
+        with self._lock:
+            stats = self._stats.get(intent)
+            if stats is None:
+                stats = self._stats[intent] = {
+                    "count": 0,
+                    "prompt_chars_total": 0,
+                    "prompt_chars": deque(maxlen=self.window),
+                    "context_ms": deque(maxlen=self.window),
+                    "total_ms": deque(maxlen=self.window),
+                }
+            stats["count"] += 1
+            stats["prompt_chars_total"] += prompt_chars
+            stats["prompt_chars"].append(prompt_chars)
+            stats["context_ms"].append(context_ms)
+            stats["total_ms"].append(total_ms)
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                intent: {
+                    "count": stats["count"],
+                    "avg_prompt_chars": round(stats["prompt_chars_total"] / stats["count"], 1),
+                    "p95_prompt_chars": percentile(stats["prompt_chars"], 95),
+                    "p50_context_ms": percentile(stats["context_ms"], 50),
+                    "p95_context_ms": percentile(stats["context_ms"], 95),
+                    "p50_total_ms": percentile(stats["total_ms"], 50),
+                    "p95_total_ms": percentile(stats["total_ms"], 95),
+                }
+                for intent, stats in self._stats.items()
+            }
+
+def percentile(values, pct: float) -> Optional[float]:
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return round(ordered[index], 2)
+
+def load_router(model_path: Optional[str] = None) -> IntentRouter:
+    model = None
+    if model_path and Path(model_path).exists():
+        model = NaiveBayesIntentModel.load(model_path)
+    return IntentRouter(model=model)
+
+if __name__ == "__main__":
+    # Train the optional model from a JSONL file of {"query": ..., "intent": ...}
+    # lines: python intent_router.py examples.jsonl intent_model.json
+    if len(sys.argv) != 3:
+        print("Usage: python intent_router.py <examples.jsonl> <model.json>")
+        sys.exit(1)
+    with open(sys.argv[1]) as fh:
+        rows = [json.loads(line) for line in fh if line.strip()]
+    trained = NaiveBayesIntentModel.fit((row["query"], row["intent"]) for row in rows)
+    trained.save(sys.argv[2])
+    print(f"✓ Trained intent model on {len(rows)} examples -> {sys.argv[2]}")
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from intent_router import percentile
+
+logger = logging.getLogger(__name__)
+
+# Event-loop lag for this worker. A probe coroutine sleeps interval_ms at a
+# time; how late each wake-up comes is the lag every other coroutine saw at
+# that moment (the last `samples` are kept for percentiles). A watchdog
+# thread checks the probe's heartbeat: once the loop has not come back for
+# block_ms, it captures the loop thread's Python stack — the code that is
+# blocking it — keeps the last `keep` of them and logs each distinct stack at
+# most once per log_seconds. The capture happens while the loop is still
+# stuck, so the stack points at the culprit rather than at whoever runs next.
+
+STACK_FRAMES = 12
+
+class LoopLagMonitor:
+    def __init__(self, enabled: bool = True, interval_ms: float = 100.0, block_ms: float = 250.0,
+                 samples: int = 3000, keep: int = 20, log_seconds: float = 60.0):
+        self.enabled = enabled
+        self.interval_ms = interval_ms
+        self.block_ms = block_ms
+        self.log_seconds = log_seconds
+        self.lags = deque(maxlen=samples)
+        self.blocks = deque(maxlen=keep)
+        self.blocked = 0
+        self.max_ms = 0.0
+        self._beat = time.monotonic()
+        self._captured: Optional[Tuple[float, dict]] = None
+        self._logged: Dict[str, float] = {}
+        self._loop_thread: Optional[int] = None
+        self._stop = threading.Event()
+
+    async def run(self) -> None:
+        # Started once per worker at startup.
+        if not self.enabled:
+            return
+        self._loop_thread = threading.get_ident()
+        if self.block_ms > 0:
+            threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        interval = self.interval_ms / 1000
+        try:
+            while True:
+                beat = self._beat = time.monotonic()
+                await asyncio.sleep(interval)
+                lag = max(0.0, (time.monotonic() - beat - interval) * 1000)
+                self.lags.append(lag)
+                self.max_ms = max(self.max_ms, lag)
+                captured, self._captured = self._captured, None
+                if captured is not None and captured[0] == beat:
+                    # The stall is over: record how long it lasted in the end.
+                    captured[1]["blocked_ms"] = round(lag, 1)
+        finally:
+            self._stop.set()
+
+    def _watch(self) -> None:
+        beat = None
+        while not self._stop.wait(self.block_ms / 4000):
+            stalled = (time.monotonic() - self._beat) * 1000 - self.interval_ms
+            if stalled < self.block_ms or self._beat == beat:
+                continue
+            # One capture per stall.
+            beat = self._beat
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.format_stack(frame)[-STACK_FRAMES:]
+            block = {
+                "at": datetime.now(timezone.utc).isoformat(),
+                "blocked_ms": round(stalled, 1),
+                "stack": [line.rstrip() for line in stack],
+            }
+            self.blocked += 1
+            self.blocks.append(block)
+            self._captured = (beat, block)
+            key = "".join(stack[-3:])
+            now = time.monotonic()
+            if len(self._logged) > 1000:
+                self._logged.clear()
+            if now - self._logged.get(key, 0.0) >= self.log_seconds:
+                self._logged[key] = now
+                logger.warning("Event loop blocked for over %.0f ms in:\n%s", stalled, "".join(stack))
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self, limit: int = 10) -> dict:
+        lags = list(self.lags)
+        return {
+            "enabled": self.enabled,
+            "interval_ms": self.interval_ms,
+            "block_threshold_ms": self.block_ms,
+            "samples": len(lags),
+            "p50_ms": percentile(lags, 50),
+            "p95_ms": percentile(lags, 95),
+            "p99_ms": percentile(lags, 99),
+            "max_ms": round(self.max_ms, 2),
+            "blocked": self.blocked,
+            "recent_blocks": list(self.blocks)[-limit:][::-1],
+        }
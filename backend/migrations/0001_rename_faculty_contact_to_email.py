@@ -0,0 +1,12 @@
+from pymongo import UpdateOne
+
+# Ported from update_faculty.py: faculty documents used to carry a `contact`
+# field, which is now `email`.
+
+DESCRIPTION = "Rename faculty.contact to faculty.email"
+COLLECTION = "faculty"
+FILTER = {"contact": {"$exists": True}}
+PROJECTION = {"_id": 1}
+
+def transform(doc):
+    return [UpdateOne({"_id": doc["_id"]}, {"$rename": {"contact": "email"}})]
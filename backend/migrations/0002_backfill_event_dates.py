@@ -0,0 +1,15 @@
+from pymongo import UpdateOne
+
+from event_dates import parse_event_dates
+
+# Events created before start_at/end_at existed only have the display string.
+# Unparseable dates get explicit nulls so they are not picked up again.
+
+DESCRIPTION = "Backfill events.start_at/end_at from the display date"
+COLLECTION = "events"
+FILTER = {"start_at": {"$exists": False}}
+PROJECTION = {"_id": 1, "date": 1}
+
+def transform(doc):
+    start_at, end_at = parse_event_dates(doc.get("date"))
+    return [UpdateOne({"_id": doc["_id"]}, {"$set": {"start_at": start_at, "end_at": end_at}})]
@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import importlib
+import os
+import re
+import socket
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from mongo_client import create_client
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Versioned data migrations. Each NNNN_name.py module in this package either
+# defines an async `migrate(db, ctx)` for one-off work, or the batched form:
+#
+#   COLLECTION  collection to walk
+#   FILTER      documents that still need migrating
+#   PROJECTION  fields transform() needs (must include _id)
+#   transform(doc) -> list of pymongo write ops for that document
+#
+# Batched migrations walk the collection in _id order and bulk_write each
+# batch. The last _id is checkpointed in the `migrations` collection, so an
+# interrupted run resumes where it stopped. Run from backend/:
+#
+#   python -m migrations.runner status
+#   python -m migrations.runner up [--dry-run] [--target 0002]
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.py$")
+LEASE_SECONDS = 120
+
+def discover():
+    found = []
+    for path in sorted(MIGRATIONS_DIR.iterdir()):
+        match = MIGRATION_FILE.match(path.name)
+        if match:
+            module = importlib.import_module(f"migrations.{path.stem}")
+            found.append((match.group(1), path.stem, module))
+    return found
+
+class Throttle:
+    # Keeps the migration to a fraction of wall time: after a batch that took
+    # t seconds it sleeps t * (1 / duty_cycle - 1), and never less than
+    # min_pause. duty_cycle=1 disables adaptive pauses.
+    def __init__(self, duty_cycle: float = 0.5, min_pause: float = 0.0):
+        self.duty_cycle = min(max(duty_cycle, 0.01), 1.0)
+        self.min_pause = min_pause
+
+    async def pause(self, batch_seconds: float) -> None:
+        delay = max(self.min_pause, batch_seconds * (1 / self.duty_cycle - 1))
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+async def acquire(db, migration_id: str, name: str, owner: str) -> dict:
+    # Claims the migration unless another runner holds a live lease. A
+    # crashed runner's lease simply expires. Check and claim are one
+    # conditional write, so two runners can never both get it.
+    now = datetime.now(timezone.utc)
+    try:
+        state = await db.migrations.find_one_and_update(
+            {
+                "id": migration_id,
+                "status": {"$ne": "applied"},
+                "$or": [
+                    {"status": {"$ne": "running"}},
+                    {"owner": owner},
+                    {"lease_until": {"$exists": False}},
+                    {"lease_until": {"$lt": now.isoformat()}},
+                ],
+            },
+            {
+                "$set": {
+                    "name": name,
+                    "status": "running",
+                    "owner": owner,
+                    "lease_until": (now + timedelta(seconds=LEASE_SECONDS)).isoformat(),
+                },
+                "$setOnInsert": {"started_at": now.isoformat(), "processed": 0, "modified": 0, "checkpoint": None},
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # The migration exists but the filter missed: applied, or leased.
+        state = None
+    if state is None:
+        state = await db.migrations.find_one({"id": migration_id})
+        if not state or state.get("status") != "applied":
+            raise RuntimeError(f"Migration {name} is being run by {state and state.get('owner')}")
+    return state
+
+async def run_batched(db, migration_id, name, module, args, owner) -> None:
+    collection = db[module.COLLECTION]
+    state = await acquire(db, migration_id, name, owner) if not args.dry_run else {}
+    if state.get("status") == "applied":
+        # Finished by another runner since the pending list was read.
+        print(f"✓ {name}: already applied")
+        return
+    checkpoint = state.get("checkpoint")
+    processed = state.get("processed", 0)
+    modified = state.get("modified", 0)
+    throttle = Throttle(args.duty_cycle, args.pause_ms / 1000)
+    remaining = await collection.count_documents(module.FILTER)
+    print(f"→ {name}: {remaining:,} documents to migrate"
+          + (f" (resuming after _id {checkpoint})" if checkpoint else ""))
+
+    started = time.perf_counter()
+    while True:
+        query = dict(module.FILTER)
+        if checkpoint is not None:
+            query = {"$and": [module.FILTER, {"_id": {"$gt": checkpoint}}]}
+        batch = await collection.find(query, module.PROJECTION).sort("_id", 1).limit(args.batch_size).to_list(args.batch_size)
+        if not batch:
+            break
+        batch_started = time.perf_counter()
+        ops = [op for doc in batch for op in module.transform(doc)]
+        if args.dry_run:
+            for op in ops[:3]:
+                print(f"  would apply: {op}")
+            print(f"  dry run: first batch of {len(batch)} documents -> {len(ops)} writes")
+            return
+        if ops:
+            result = await collection.bulk_write(ops, ordered=False)
+            modified += result.modified_count + result.upserted_count + result.deleted_count
+        processed += len(batch)
+        checkpoint = batch[-1]["_id"]
+        renewed = await db.migrations.update_one({"id": migration_id, "owner": owner}, {"$set": {
+            "checkpoint": checkpoint,
+            "processed": processed,
+            "modified": modified,
+            "lease_until": (datetime.now(timezone.utc) + timedelta(seconds=LEASE_SECONDS)).isoformat(),
+        }})
+        if not renewed.matched_count:
+            # The lease lapsed (e.g. a long pause) and another runner took over.
+            raise RuntimeError(f"Migration {name} lost its lease; the new holder resumes from its checkpoint")
+        elapsed = time.perf_counter() - started
+        print(f"  {processed:,}/{remaining:,} processed, {modified:,} modified ({processed / elapsed:,.0f} docs/s)")
+        await throttle.pause(time.perf_counter() - batch_started)
+
+    await mark_applied(db, migration_id, processed, modified)
+    print(f"✓ {name}: {processed:,} processed, {modified:,} modified")
+
+async def mark_applied(db, migration_id, processed=0, modified=0) -> None:
+    await db.migrations.update_one({"id": migration_id}, {"$set": {
+        "status": "applied",
+        "processed": processed,
+        "modified": modified,
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+    }, "$unset": {"lease_until": "", "owner": ""}})
+
+async def pending_migrations(db, target=None) -> list:
+    # (id, name, module) of every migration not applied yet, in order.
+    applied = {m["id"] async for m in db.migrations.find({"status": "applied"}, {"_id": 0, "id": 1})}
+    return [(mid, name, module) for mid, name, module in discover()
+            if mid not in applied and (not target or mid <= target)]
+
+async def up(db, args) -> None:
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    pending = await pending_migrations(db, args.target)
+    if not pending:
+        print("✓ No pending migrations")
+        return
+    for migration_id, name, module in pending:
+        print(f"{'[dry run] ' if args.dry_run else ''}{name}: {getattr(module, 'DESCRIPTION', '')}")
+        if hasattr(module, "migrate"):
+            if args.dry_run:
+                print("  dry run: custom migration, skipped")
+                continue
+            if (await acquire(db, migration_id, name, owner)).get("status") == "applied":
+                print(f"✓ {name}: already applied")
+                continue
+            await module.migrate(db, args)
+            await mark_applied(db, migration_id)
+            print(f"✓ {name}")
+        else:
+            await run_batched(db, migration_id, name, module, args, owner)
+
+async def status(db) -> None:
+    states = {m["id"]: m async for m in db.migrations.find({}, {"_id": 0})}
+    for migration_id, name, module in discover():
+        state = states.get(migration_id, {})
+        line = f"{name:<45} {state.get('status', 'pending'):<8}"
+        if state.get("processed"):
+            line += f" processed={state['processed']:,} modified={state.get('modified', 0):,}"
+        print(line)
+
+async def main(args) -> None:
+    client = create_client()
+    db = client[os.environ['DB_NAME']]
+    try:
+        await db.migrations.create_index("id", unique=True)
+        if args.command == "status":
+            await status(db)
+        else:
+            await up(db, args)
+    finally:
+        client.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Apply versioned data migrations.")
+    parser.add_argument("command", choices=["up", "status"], nargs="?", default="up")
+    parser.add_argument("--dry-run", action="store_true", help="Show what the first batch would write")
+    parser.add_argument("--target", help="Apply migrations up to and including this number, e.g. 0002")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--duty-cycle", type=float, default=0.5,
+                        help="Fraction of wall time spent writing; the rest is paused")
+    parser.add_argument("--pause-ms", type=float, default=0.0, help="Minimum pause between batches")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,119 @@
+import os
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# The one place Mongo clients are built, for the app and every script. Pool
+# and wire settings come from the environment:
+#
+#   MONGO_MAX_POOL_SIZE                 connections per server (driver default 100)
+#   MONGO_MIN_POOL_SIZE                 connections kept open when idle
+#   MONGO_WAIT_QUEUE_TIMEOUT_MS         how long a request waits for a free
+#                                       connection before failing
+#   MONGO_MAX_IDLE_TIME_MS              close pooled connections idle this long
+#   MONGO_SERVER_SELECTION_TIMEOUT_MS
+#   MONGO_COMPRESSORS                   e.g. "zstd,snappy,zlib" in preference
+#                                       order; zstd needs `zstandard`, snappy
+#                                       `python-snappy` (the driver skips
+#                                       unavailable ones with a warning)
+#   MONGO_ZLIB_COMPRESSION_LEVEL
+#
+# Reads can be routed per workload. Auth and everything that writes stays on
+# the primary; reference-data lists and admin analytics may go elsewhere:
+#
+#   MONGO_READ_PREFERENCE_REFERENCE     e.g. secondaryPreferred
+#   MONGO_READ_PREFERENCE_ANALYTICS     e.g. secondary
+#   MONGO_MAX_STALENESS_SECONDS         bound on secondary lag (>= 90)
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+_INT_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+    "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+    "MONGO_ZLIB_COMPRESSION_LEVEL": "zlibCompressionLevel",
+}
+
+def client_options(environ=os.environ) -> dict:
+    options = {"appname": environ.get("MONGO_APP_NAME", "campus-chatbot")}
+    for variable, option in _INT_OPTIONS.items():
+        if environ.get(variable):
+            options[option] = int(environ[variable])
+    if environ.get("MONGO_COMPRESSORS"):
+        options["compressors"] = environ["MONGO_COMPRESSORS"]
+    return options
+
+def create_client(url: Optional[str] = None, **overrides) -> AsyncIOMotorClient:
+    url = url or os.environ.get("MONGO_URL")
+    if not url:
+        raise RuntimeError("MONGO_URL not set in environment")
+    return AsyncIOMotorClient(url, **{**client_options(), **overrides})
+
+def read_preference(name: str, max_staleness: int = -1):
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference {name!r}; use one of {', '.join(READ_PREFERENCES)}")
+    if name == "primary":
+        return Primary()
+    return READ_PREFERENCES[name](max_staleness=max_staleness)
+
+def routed_database(db, workload: str):
+    # Same database, with the read preference configured for `workload`.
+    name = os.environ.get(f"MONGO_READ_PREFERENCE_{workload.upper()}", "primary")
+    staleness = int(os.environ.get("MONGO_MAX_STALENESS_SECONDS", "-1"))
+    return db.client.get_database(db.name, read_preference=read_preference(name, staleness))
+
+# ---------------------------------------------------------------------------
+# Per-route time budgets
+# ---------------------------------------------------------------------------
+# "METHOD /path/prefix=ms" pairs; the longest matching prefix wins and 0
+# means no budget. The budget is a deadline for all Mongo work in the
+# request (pymongo sends the remaining time as maxTimeMS), so routes that
+# wait on Gemini or stream large responses are left out by default.
+
+DEFAULT_ROUTE_BUDGETS_MS = ",".join([
+    "GET /api/auth/user=1000",
+    "GET /api/faqs=2000",
+    "GET /api/departments=2000",
+    "GET /api/faculty=2000",
+    "GET /api/events=2000",
+    "GET /api/locations=2000",
+    "GET /api/chat/history=2000",
+    "GET /api/admin/all-queries=5000",
+    "GET /api/admin/slow-ops=5000",
+])
+
+def parse_route_budgets(spec: str) -> Dict[Tuple[str, str], float]:
+    budgets = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        route, _, ms = item.rpartition("=")
+        method, _, prefix = route.strip().partition(" ")
+        if not prefix or not ms:
+            raise ValueError(f"Bad route budget {item!r}; expected 'METHOD /path=ms'")
+        budgets[(method.upper(), prefix.strip())] = float(ms)
+    return budgets
+
+class RouteBudgets:
+    def __init__(self, spec: str = DEFAULT_ROUTE_BUDGETS_MS):
+        self.budgets = parse_route_budgets(spec)
+
+    def seconds_for(self, method: str, path: str) -> Optional[float]:
+        best, best_len = None, -1
+        for (budget_method, prefix), ms in self.budgets.items():
+            if budget_method == method and (path == prefix or path.startswith(prefix.rstrip("/") + "/")) \
+                    and len(prefix) > best_len:
+                best, best_len = ms, len(prefix)
+        return best / 1000 if best else None
@@ -0,0 +1,91 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+# CPU-bound steps (context rendering, timestamp conversion of large reads,
+# FAQ signature rebuilds, stream validation, export chunks) run inline when
+# their input is small and in a worker pool from min_items items up, so one
+# big request does not stall every other coroutine on the worker. CPU_POOL:
+#
+#   thread   default. Data is handed over for free; pure-Python work still
+#            holds the GIL, but the interpreter switches back to the event
+#            loop every sys.getswitchinterval() (5 ms), which bounds the
+#            stall. numpy, pandas and pyarrow release the GIL for most work.
+#   process  real parallelism, paid for by pickling arguments and results.
+#            Workers are spawned and import only the called function's
+#            module, so only module-level functions of cheap modules may be
+#            sent (cpu_tasks.py, faq_dedup.py, export_history.py — never
+#            server.py). Calls that need this process pass local=True and
+#            use the thread pool.
+#   off      everything inline.
+
+POOL_KINDS = ("thread", "process", "off")
+
+async def run_inline(fn, *args, size: int = 0, local: bool = False):
+    # Same signature as CPUPool.run, for callers without a pool (scripts).
+    return fn(*args)
+
+class CPUPool:
+    def __init__(self, kind: str = "thread", workers: Optional[int] = None, min_items: int = 500):
+        if kind not in POOL_KINDS:
+            raise ValueError(f"CPU_POOL must be one of {', '.join(POOL_KINDS)}")
+        self.kind = kind
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.min_items = min_items
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._stats: Dict[str, dict] = {}
+
+    def _executor(self, local: bool) -> Executor:
+        # Created on first use, so workers that never offload start none.
+        if self.kind == "process" and not local:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._processes
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(self.workers, thread_name_prefix="cpu")
+        return self._threads
+
+    async def run(self, fn, *args, size: int = 0, local: bool = False):
+        # fn(*args), in the pool when size (items of input) is large enough.
+        # Threads see the caller's context (tenant, trace), as with
+        # asyncio.to_thread; worker processes do not.
+        stats = self._stats.setdefault(fn.__name__, {"inline": 0, "offloaded": 0, "offloaded_ms": 0.0})
+        if self.kind == "off" or size < self.min_items:
+            stats["inline"] += 1
+            return fn(*args)
+        in_process = self.kind == "process" and not local
+        call = functools.partial(fn, *args) if in_process else \
+            functools.partial(contextvars.copy_context().run, fn, *args)
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor(local), call)
+        except BrokenProcessPool:
+            # A worker died (OOM, signal); the next call starts a fresh pool.
+            self._processes = None
+            raise
+        finally:
+            stats["offloaded"] += 1
+            stats["offloaded_ms"] += (time.perf_counter() - started) * 1000
+
+    def shutdown(self) -> None:
+        for executor in (self._threads, self._processes):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self._threads = self._processes = None
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "min_items": self.min_items,
+            "calls": {
+                name: {**s, "offloaded_ms": round(s["offloaded_ms"], 1)} for name, s in sorted(self._stats.items())
+            },
+        }
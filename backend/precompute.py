@@ -0,0 +1,226 @@
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from faq_dedup import normalize
+from rate_limit import SchedulerQueueFull
+from retention import claim_lease
+from tenancy import current_tenant
+
+logger = logging.getLogger(__name__)
+
+# Answers for the most frequent questions, generated ahead of peak load.
+# Every interval_seconds one worker (the `answer_precompute` lease in
+# job_leases) ranks the normalized questions asked in the last lookback_days
+# and, inside the off-peak window (UTC hours), asks Gemini for the top_n
+# through the normal prompt path, at most `concurrency` at a time. Outside
+# the window it only regenerates entries that went stale.
+#
+# An entry is keyed by its normalized question and stores the version of the
+# reference data it was answered from: a fingerprint of the rendered context
+# for the question's intent. chat serves an entry only while the current
+# context has the same fingerprint, so any FAQ, event or other change that
+# would alter the prompt (including events dropping out of "upcoming") makes
+# it stale at once. A live answer to a stale question replaces the entry.
+# Entries are context-free, so they only answer the first message of a
+# conversation; follow-ups still go to Gemini with the conversation.
+
+PRECOMPUTED_COLLECTION = "precomputed_answers"
+LEASE_NAME = "answer_precompute"
+# Gemini usage of precomputation is reported under this user id.
+PRECOMPUTE_USER = "precompute"
+
+def question_key(query: str) -> str:
+    return normalize(query)
+
+def context_version(context: str) -> str:
+    return hashlib.sha1(context.encode("utf-8")).hexdigest()[:16]
+
+def parse_window(spec: str) -> Optional[Tuple[int, int]]:
+    # "2-6" is 02:00-06:00 UTC, "22-4" wraps midnight, "" means any time.
+    if not spec.strip():
+        return None
+    start, _, end = spec.partition("-")
+    return int(start) % 24, int(end) % 24
+
+def in_window(window: Optional[Tuple[int, int]], hour: int) -> bool:
+    if window is None:
+        return True
+    start, end = window
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+class PrecomputedAnswers:
+    def __init__(self, collection, cache, history, leases,
+                 prepare: Callable[[str], Awaitable[Tuple[str, str, str]]],
+                 generate: Callable[[str, str], Awaitable[Tuple[Optional[str], Optional[dict]]]],
+                 on_change: Callable[[], Awaitable[None]],
+                 top_n: int = 0, min_count: int = 3, lookback_days: int = 14, concurrency: int = 2,
+                 interval_seconds: float = 900.0, window: str = "2-6",
+                 busy: Optional[Callable[[], bool]] = None):
+        # prepare(query) -> (intent, version, prompt); generate(prompt, intent)
+        # -> (text, usage), usage None when there is no answer worth keeping.
+        self.collection = collection
+        self.cache = cache
+        self.history = history
+        self.leases = leases
+        self.prepare = prepare
+        self.generate = generate
+        self.on_change = on_change
+        self.top_n = top_n
+        self.min_count = min_count
+        self.lookback_days = lookback_days
+        self.concurrency = concurrency
+        self.interval_seconds = interval_seconds
+        self.window = parse_window(window)
+        self.busy = busy
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.served = 0
+        self.stale = 0
+        self.last_run: Optional[dict] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.top_n > 0
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index("key", unique=True)
+
+    async def entries(self) -> Dict[str, dict]:
+        # All of the campus's entries, cached like reference data.
+        cached = self.cache.get(PRECOMPUTED_COLLECTION, "all")
+        if cached is not None:
+            return cached
+        generation = self.cache.generation(PRECOMPUTED_COLLECTION)
+        entries = await self._load()
+        self.cache.set(PRECOMPUTED_COLLECTION, "all", entries, generation=generation)
+        return entries
+
+    async def _load(self) -> Dict[str, dict]:
+        return {doc["key"]: doc async for doc in self.collection.find({}, {"_id": 0})}
+
+    async def lookup(self, query: str, version: str) -> Optional[dict]:
+        entry = (await self.entries()).get(question_key(query))
+        if entry is None:
+            return None
+        if entry["version"] != version:
+            self.stale += 1
+            return None
+        self.served += 1
+        return entry
+
+    async def refresh(self, query: str, intent: str, version: str, response: str, usage: dict) -> None:
+        # Write-through from a live answer to a precomputed question whose
+        # entry is stale; other questions are left to the job.
+        key = question_key(query)
+        entry = (await self.entries()).get(key)
+        if entry is None or entry["version"] == version:
+            return
+        await self._store(key, entry["query"], intent, version, response, usage)
+        await self.on_change()
+
+    async def _store(self, key: str, query: str, intent: str, version: str, response: str, usage: dict,
+                     asked: Optional[int] = None) -> None:
+        fields = {
+            "query": query,
+            "intent": intent,
+            "version": version,
+            "response": response,
+            "usage": usage,
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+        }
+        if asked is not None:
+            fields["asked"] = asked
+        await self.collection.update_one({"key": key}, {"$set": fields}, upsert=True)
+
+    async def top_questions(self) -> List[Tuple[str, str, int]]:
+        # (key, question as most often asked, times asked), most asked first.
+        since = (datetime.now(timezone.utc) - timedelta(days=self.lookback_days)).isoformat()
+        counts, samples = {}, {}
+        for row in await self.history.query_counts(since, self.top_n * 5):
+            key = question_key(row["_id"] or "")
+            if key:
+                counts[key] = counts.get(key, 0) + row["count"]
+                samples.setdefault(key, row["_id"].strip())
+        ranked = sorted(((k, samples[k], n) for k, n in counts.items() if n >= self.min_count), key=lambda r: -r[2])
+        return ranked[:self.top_n]
+
+    async def run_once(self, off_peak: bool) -> dict:
+        # For the bound campus. Off peak the ranking is redone and questions
+        # that left the top are dropped; otherwise only stale entries are
+        # regenerated.
+        entries = await self._load()
+        targets = {key: (entry["query"], None) for key, entry in entries.items()}
+        dropped = 0
+        if off_peak:
+            targets = {key: (query, asked) for key, query, asked in await self.top_questions()}
+            gone = [key for key in entries if key not in targets]
+            if gone:
+                dropped = (await self.collection.delete_many({"key": {"$in": gone}})).deleted_count
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(
+            self._answer(semaphore, key, query, asked, entries.get(key)) for key, (query, asked) in targets.items()
+        ))
+        if any(results) or dropped:
+            await self.on_change()
+        return {"tenant": current_tenant(), "questions": len(targets), "generated": sum(results), "dropped": dropped}
+
+    async def _answer(self, semaphore, key: str, query: str, asked: Optional[int], entry: Optional[dict]) -> bool:
+        async with semaphore:
+            while self.busy and self.busy():
+                await asyncio.sleep(1)
+            intent, version, prompt = await self.prepare(query)
+            if entry and entry["version"] == version:
+                if asked is not None and entry.get("asked") != asked:
+                    await self.collection.update_one({"key": key}, {"$set": {"asked": asked}})
+                return False
+            try:
+                response, usage = await self.generate(prompt, intent)
+            except SchedulerQueueFull:
+                return False
+            if usage is None:
+                return False
+            await self._store(key, query, intent, version, response, usage, asked)
+            return True
+
+    async def run(self, for_each_tenant) -> None:
+        # Started once per worker at startup; for_each_tenant runs a
+        # coroutine function once per campus with that campus bound.
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            if not self.enabled or not await claim_lease(self.leases, LEASE_NAME, self.owner, self.interval_seconds):
+                continue
+            started = datetime.now(timezone.utc)
+            off_peak = in_window(self.window, started.hour)
+            tenants = []
+
+            async def one():
+                tenants.append(await self.run_once(off_peak))
+
+            try:
+                await for_each_tenant(one)
+            except Exception:
+                logger.exception("Answer precomputation failed")
+            self.last_run = {
+                "started_at": started.isoformat(),
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+                "off_peak": off_peak,
+                "generated": sum(t["generated"] for t in tenants),
+                "tenants": tenants,
+            }
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "top_n": self.top_n,
+            "window_utc": "%d-%d" % self.window if self.window else None,
+            "concurrency": self.concurrency,
+            "interval_seconds": self.interval_seconds,
+            "served": self.served,
+            "stale": self.stale,
+            "last_run": self.last_run,
+        }
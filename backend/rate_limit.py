@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone, timedelta
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+class RateLimit(NamedTuple):
+    capacity: int
+    per_seconds: float
+
+    @property
+    def refill_rate(self) -> float:
+        return self.capacity / self.per_seconds
+
+    @classmethod
+    def parse(cls, spec: str) -> "RateLimit":
+        # "20/60" -> 20 requests per 60 seconds, refilled continuously.
+        count, _, seconds = spec.partition("/")
+        return cls(int(count), float(seconds or 60))
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    # Seconds until the next token is available (when blocked) or until the
+    # bucket is full again (when allowed).
+    reset_after: float
+
+    def headers(self) -> Dict[str, str]:
+        out = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            out["Retry-After"] = str(max(1, math.ceil(self.reset_after)))
+        return out
+
+def _result(tokens: float, allowed: bool, limit: RateLimit) -> RateLimitResult:
+    if allowed:
+        reset_after = (limit.capacity - tokens) / limit.refill_rate
+    else:
+        reset_after = (1 - tokens) / limit.refill_rate
+    return RateLimitResult(allowed, limit.capacity, int(tokens), reset_after)
+
+class MemoryRateLimiter:
+    # Token buckets kept in this process. Buckets that have had time to refill
+    # completely carry no information, so they are dropped when the table
+    # grows past max_keys.
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    async def hit(self, key: str, limit: RateLimit) -> RateLimitResult:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (float(limit.capacity), now))
+        tokens = min(limit.capacity, tokens + (now - updated) * limit.refill_rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._prune(now, limit)
+        return _result(tokens, allowed, limit)
+
+    def _prune(self, now: float, limit: RateLimit) -> None:
+        full_after = limit.per_seconds
+        stale = [k for k, (_, updated) in self._buckets.items() if now - updated >= full_after]
+        for k in stale:
+            del self._buckets[k]
+
+class MongoRateLimiter:
+    # Shared token buckets for multi-worker deployments. The refill-and-take is
+    # a single pipeline update, so concurrent workers cannot double-spend.
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index("key", unique=True)
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def hit(self, key: str, limit: RateLimit) -> RateLimitResult:
+        now = time.time()
+        refilled = {
+            "$min": [
+                limit.capacity,
+                {"$add": [
+                    {"$ifNull": ["$tokens", limit.capacity]},
+                    {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated", now]}]}, limit.refill_rate]},
+                ]},
+            ]
+        }
+        pipeline = [
+            {"$set": {"tokens": refilled, "updated": now}},
+            {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+            {"$set": {
+                "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                "expires_at": datetime.now(timezone.utc) + timedelta(seconds=limit.per_seconds),
+            }},
+        ]
+        try:
+            doc = await self.collection.find_one_and_update(
+                {"key": key}, pipeline, upsert=True, return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError:
+            # Concurrent first hits for a new key both tried to insert its
+            # bucket; the loser now finds it and updates it.
+            doc = await self.collection.find_one_and_update(
+                {"key": key}, pipeline, upsert=True, return_document=ReturnDocument.AFTER)
+        return _result(doc["tokens"], doc["allowed"], limit)
+
+class SchedulerQueueFull(Exception):
+    pass
+
+class FairScheduler:
+    # Caps concurrent upstream calls at `capacity`. Once saturated, waiters
+    # are queued per identity and slots are handed out round-robin across
+    # identities, so one client with many queued requests only gets every
+    # n-th slot instead of all of them.
+    def __init__(self, capacity: int, max_queued_per_identity: int = 5):
+        self.capacity = capacity
+        self.max_queued_per_identity = max_queued_per_identity
+        self.active = 0
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    @asynccontextmanager
+    async def slot(self, identity: str):
+        await self._acquire(identity)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, identity: str) -> None:
+        if self.active < self.capacity and not self._queues:
+            self.active += 1
+            return
+        queue = self._queues.get(identity)
+        if queue is None:
+            queue = self._queues[identity] = deque()
+        if len(queue) >= self.max_queued_per_identity:
+            if not queue:
+                del self._queues[identity]
+            raise SchedulerQueueFull(identity)
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        try:
+            # The releasing request hands its slot over, so `active` is
+            # already accounted for when this resolves.
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            else:
+                self._discard(identity, waiter)
+            raise
+
+    def _release(self) -> None:
+        while self._queues:
+            identity, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(identity)
+            else:
+                del self._queues[identity]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _discard(self, identity: str, waiter) -> None:
+        queue = self._queues.get(identity)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            pass
+        if not queue:
+            del self._queues[identity]
+
+_warned_untrusted_proxy = False
+
+def forwarded_hop(value: Optional[str], proxy_hops: int) -> Optional[str]:
+    # Proxies append to X-Forwarded-* headers, so only the last proxy_hops
+    # entries were written by our own proxies; anything before them came from
+    # the client. Returns the entry the outermost of those proxies added (the
+    # rightmost untrusted hop), or None when the header is missing or shorter
+    # than the proxy chain.
+    if not value or proxy_hops <= 0:
+        return None
+    entries = [entry.strip() for entry in value.split(",")]
+    return entries[-proxy_hops] if len(entries) >= proxy_hops else None
+
+def client_identity(request, user, proxy_hops: int = 0) -> str:
+    # proxy_hops is the number of proxies in front of the app. With 0 the
+    # peer address is used, which uvicorn already resolves to the client when
+    # it runs with FORWARDED_ALLOW_IPS.
+    global _warned_untrusted_proxy
+    if user:
+        return f"user:{user.id}"
+    forwarded = request.headers.get("x-forwarded-for")
+    host = forwarded_hop(forwarded, proxy_hops)
+    if forwarded and not proxy_hops and not _warned_untrusted_proxy:
+        _warned_untrusted_proxy = True
+        logger.warning("Requests arrive through a proxy: unless uvicorn runs with FORWARDED_ALLOW_IPS or "
+                       "TRUSTED_PROXY_HOPS is set, all anonymous clients share one rate-limit bucket per proxy")
+    if host is None:
+        host = request.client.host if request.client else "unknown"
+    return f"ip:{host}"
@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import socket
+import sys
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from bson import Binary
+from dotenv import load_dotenv
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from chat_store import DEFAULT_BUCKET_TURNS, make_chat_history
+from migrations.runner import Throttle
+from mongo_client import create_client
+from tenancy import TenantConfig, bind_tenant, current_tenant, scoped_database
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+# Chat history retention. With CHAT_RETENTION_DAYS > 0 a background job moves
+# records older than that out of the history store (either layout, see
+# chat_store.py) in batches, oldest first, for every campus. Where they go is
+# CHAT_ARCHIVE_TARGET:
+#
+#   collection  `chat_history_archive`, one document per batch holding the
+#               records as zlib-compressed JSON lines (see decode_block)
+#   file        CHAT_ARCHIVE_DIR/<tenant>/chat_history_<YYYY-MM>.jsonl.gz,
+#               one gzip member appended per batch; files stay on the host
+#               that ran the job, so use a shared mount with several hosts
+#   none        deleted without a copy
+#
+# A batch is archived before it is removed, so a crash in between archives it
+# again on the next run: blocks are keyed by their record ids and skipped if
+# already present, files may hold the batch twice. The job sleeps between
+# batches to stay within its duty cycle and waits while the worker is busy
+# answering chats. One worker at a time holds the `chat_retention` lease in
+# job_leases; the others skip the run.
+#
+# Bulk purges (the admin purge endpoint) use the same batched deletes without
+# archiving.
+
+ARCHIVE_TARGETS = ("collection", "file", "none")
+ARCHIVE_COLLECTION = "chat_history_archive"
+LEASE_NAME = "chat_retention"
+# Records per archive block; keeps compressed blocks far below 16 MB.
+BLOCK_RECORDS = 1000
+
+def encode_block(records: List[dict]) -> bytes:
+    lines = "\n".join(json.dumps(r, default=str, sort_keys=True) for r in records)
+    return zlib.compress(lines.encode("utf-8"), 6)
+
+def decode_block(data: bytes) -> List[dict]:
+    return [json.loads(line) for line in zlib.decompress(data).decode("utf-8").splitlines()]
+
+class CollectionArchive:
+    target = "collection"
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index([("first_ts", 1)])
+
+    async def write(self, records: List[dict]) -> None:
+        for start in range(0, len(records), BLOCK_RECORDS):
+            block = records[start:start + BLOCK_RECORDS]
+            ids = sorted(r["id"] for r in block)
+            # Compressing a block takes a few ms; keep it off the event loop.
+            data = await asyncio.to_thread(encode_block, block)
+            try:
+                await self.collection.insert_one({
+                    "_id": hashlib.sha1("\n".join(ids).encode("utf-8")).hexdigest(),
+                    "first_ts": min(r["timestamp"] for r in block),
+                    "last_ts": max(r["timestamp"] for r in block),
+                    "count": len(block),
+                    "archived_at": datetime.now(timezone.utc).isoformat(),
+                    "data": Binary(data),
+                })
+            except DuplicateKeyError:
+                # Archived by a run that stopped before removing the batch.
+                pass
+
+    def read(self, since: Optional[str] = None, until: Optional[str] = None):
+        query = {}
+        if since:
+            query["last_ts"] = {"$gte": since}
+        if until:
+            query["first_ts"] = {"$lte": until}
+        return self.collection.find(query).sort("first_ts", 1)
+
+class FileArchive:
+    target = "file"
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    async def ensure_indexes(self) -> None:
+        pass
+
+    async def write(self, records: List[dict]) -> None:
+        by_month = {}
+        for record in records:
+            by_month.setdefault(record["timestamp"][:7], []).append(record)
+        directory = self.directory / current_tenant()
+        for month, rows in by_month.items():
+            await asyncio.to_thread(self._append, directory / f"chat_history_{month}.jsonl.gz", rows)
+
+    def _append(self, path: Path, rows: List[dict]) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "ab") as fh:
+            fh.write(gzip.compress("".join(json.dumps(r, default=str) + "\n" for r in rows).encode("utf-8")))
+            fh.flush()
+            os.fsync(fh.fileno())
+
+def make_archive(target: str, db, directory: Path):
+    if target not in ARCHIVE_TARGETS:
+        raise ValueError(f"CHAT_ARCHIVE_TARGET must be one of {', '.join(ARCHIVE_TARGETS)}")
+    if target == "collection":
+        return CollectionArchive(db[ARCHIVE_COLLECTION])
+    if target == "file":
+        return FileArchive(directory)
+    return None
+
+async def claim_lease(collection, name: str, owner: str, seconds: float) -> bool:
+    # True while `owner` holds the lease; an expired lease can be taken over.
+    now = datetime.now(timezone.utc)
+    try:
+        doc = await collection.find_one_and_update(
+            {"_id": name, "$or": [{"owner": owner}, {"lease_until": {"$lt": now.isoformat()}}]},
+            {"$set": {"owner": owner, "lease_until": (now + timedelta(seconds=seconds)).isoformat()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # Held by someone else: the filter missed and the upsert collided.
+        return False
+    return doc is not None
+
+async def purge_history(history, query: dict, batch_size: int = 1000, throttle: Optional[Throttle] = None) -> int:
+    # Deletes every record matching the flat-record query, one batch at a
+    # time, and returns how many were removed.
+    bounds = query.get("timestamp", {})
+    deleted = 0
+    while True:
+        started = time.perf_counter()
+        batch = await history.find(query, newest_first=False, limit=batch_size,
+                                   min_ts=bounds.get("$gt"), max_ts=bounds.get("$lte")).to_list(batch_size)
+        if not batch:
+            return deleted
+        removed = await history.delete_records(batch)
+        deleted += removed
+        if removed == 0:
+            # Someone else deleted them first; avoid spinning on a stale read.
+            return deleted
+        if throttle:
+            await throttle.pause(time.perf_counter() - started)
+
+class RetentionJob:
+    def __init__(self, history, archive, leases, retention_days: int = 0, batch_size: int = 1000,
+                 duty_cycle: float = 0.2, interval_seconds: float = 3600.0, lease_seconds: float = 300.0,
+                 busy: Optional[Callable[[], bool]] = None):
+        self.history = history
+        self.archive = archive
+        self.leases = leases
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.duty_cycle = duty_cycle
+        self.interval_seconds = interval_seconds
+        self.lease_seconds = lease_seconds
+        self.busy = busy
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.last_run: Optional[dict] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.retention_days > 0
+
+    def cutoff(self) -> str:
+        return (datetime.now(timezone.utc) - timedelta(days=self.retention_days)).isoformat()
+
+    async def claim(self) -> bool:
+        return await claim_lease(self.leases, LEASE_NAME, self.owner, self.lease_seconds)
+
+    async def run_once(self) -> dict:
+        # Archives and removes the bound campus's expired records.
+        cutoff = self.cutoff()
+        throttle = Throttle(self.duty_cycle)
+        archived = 0
+        while True:
+            while self.busy and self.busy():
+                await asyncio.sleep(1)
+            if not await self.claim():
+                break
+            started = time.perf_counter()
+            records, handle = await self.history.expired(cutoff, self.batch_size)
+            if not records:
+                break
+            if self.archive:
+                await self.archive.write(records)
+            await self.history.drop_expired(handle)
+            archived += len(records)
+            await throttle.pause(time.perf_counter() - started)
+        return {"tenant": current_tenant(), "cutoff": cutoff, "archived": archived}
+
+    async def run(self, for_each_tenant) -> None:
+        # Started once per worker at startup; for_each_tenant runs a
+        # coroutine function once per campus with that campus bound.
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            if not self.enabled or not await self.claim():
+                continue
+            started = datetime.now(timezone.utc)
+            tenants = []
+
+            async def one():
+                tenants.append(await self.run_once())
+
+            try:
+                await for_each_tenant(one)
+            except Exception:
+                logger.exception("Chat retention run failed")
+            self.last_run = {
+                "started_at": started.isoformat(),
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+                "archived": sum(t["archived"] for t in tenants),
+                "tenants": tenants,
+            }
+            logger.info("Chat retention archived %s records", self.last_run["archived"])
+
+    def status(self) -> dict:
+        return {
+            "retention_days": self.retention_days or None,
+            "archive_target": self.archive.target if self.archive else "none",
+            "batch_size": self.batch_size,
+            "duty_cycle": self.duty_cycle,
+            "interval_seconds": self.interval_seconds,
+            "last_run": self.last_run,
+        }
+
+# ---------------------------------------------------------------------------
+# Command line
+# ---------------------------------------------------------------------------
+#
+#   python retention.py run [--days N] [--tenant T]
+#   python retention.py dump [--since ISO] [--until ISO] [--tenant T] > archived.jsonl
+#
+# `run` does one pass now (ignoring the lease interval, not the lease), using
+# the same CHAT_* settings as the app. `dump` writes records from the archive
+# collection as JSON lines.
+
+def _job(db, shared, args) -> RetentionJob:
+    history = make_chat_history(db, os.environ.get("CHAT_HISTORY_LAYOUT", "flat"),
+                                int(os.environ.get("CHAT_BUCKET_MAX_TURNS", DEFAULT_BUCKET_TURNS)))
+    archive = make_archive(os.environ.get("CHAT_ARCHIVE_TARGET", "collection"), db,
+                           Path(os.environ.get("CHAT_ARCHIVE_DIR", ROOT_DIR / "archive")))
+    return RetentionJob(history, archive, shared.job_leases, retention_days=args.days,
+                        batch_size=args.batch_size, duty_cycle=args.duty_cycle)
+
+async def main(args) -> None:
+    client = create_client()
+    config = TenantConfig.from_env()
+    shared = client[config.db_name]
+    db = scoped_database(shared, config)
+    tenants = [args.tenant] if args.tenant else (config.tenants if config.enabled else [None])
+    try:
+        for tenant in tenants:
+            with bind_tenant(tenant):
+                if args.command == "dump":
+                    async for block in CollectionArchive(db[ARCHIVE_COLLECTION]).read(args.since, args.until):
+                        for record in decode_block(block["data"]):
+                            if (not args.since or record["timestamp"] >= args.since) and \
+                                    (not args.until or record["timestamp"] <= args.until):
+                                sys.stdout.write(json.dumps(record) + "\n")
+                    continue
+                if args.days <= 0:
+                    raise SystemExit("Set CHAT_RETENTION_DAYS or pass --days")
+                job = _job(db, shared, args)
+                if not await job.claim():
+                    raise SystemExit("Another worker is running chat retention; try again later")
+                if job.archive:
+                    await job.archive.ensure_indexes()
+                result = await job.run_once()
+                print(f"✓ {result['tenant']}: archived {result['archived']:,} records older than {result['cutoff']}")
+    finally:
+        client.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Archive old chat history, or dump the archive.")
+    parser.add_argument("command", choices=["run", "dump"])
+    parser.add_argument("--days", type=int, default=int(os.environ.get("CHAT_RETENTION_DAYS", "0")))
+    parser.add_argument("--tenant", help="Only this campus (default: all, or none with tenancy off)")
+    parser.add_argument("--since")
+    parser.add_argument("--until")
+    parser.add_argument("--batch-size", type=int, default=int(os.environ.get("CHAT_RETENTION_BATCH_SIZE", "1000")))
+    parser.add_argument("--duty-cycle", type=float,
+                        default=float(os.environ.get("CHAT_RETENTION_DUTY_CYCLE", "0.2")),
+                        help="Fraction of wall time spent archiving; the rest is paused")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
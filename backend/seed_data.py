@@ -1,17 +1,18 @@
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 from pathlib import Path
 import os
 import uuid
 from datetime import datetime, timezone
 
+from event_dates import parse_event_dates
+from mongo_client import create_client
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 async def seed_data():
-    mongo_url = os.environ['MONGO_URL']
-    client = AsyncIOMotorClient(mongo_url)
+    client = create_client()
     db = client[os.environ['DB_NAME']]
     
     print("Seeding sample campus data...")
@@ -206,6 +207,9 @@ async def seed_data():
         }
     ]
     
+    for event in events:
+        event["start_at"], event["end_at"] = parse_event_dates(event["date"])
+
     # Sample Locations
     locations = [
         {
@@ -1,17 +1,51 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, Response
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Query, WebSocket
 from dotenv import load_dotenv
-from bson import ObjectId
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.datastructures import Headers
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+import json
+import math
 import os
+import asyncio
 import logging
+import time
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from typing import List, Literal, Optional, Tuple
 import uuid
 from datetime import datetime, timezone, timedelta
 import httpx
+import pymongo
+from pymongo.errors import PyMongoError
+
+from cache_sync import WATCHED_COLLECTIONS, CacheInvalidator, LocalCache
+from chat_store import DEFAULT_BUCKET_TURNS, make_chat_history
+from chat_ws import CLOSE_POLICY, CLOSE_TRY_AGAIN, CLOSE_UNAUTHORIZED, CLOSE_UNSUPPORTED, ChatConnection, ChatSocketHub
+from conversation_memory import ConversationConflict, ConversationStore
+from cpu_tasks import parse_timestamps, render_context, sort_faculty, stringify_object_ids
+from event_dates import parse_event_dates, upcoming_events_filter
+from export_history import export_filter, iter_csv, iter_parquet, normalize_timestamp, parquet_schema
+from faq_dedup import FAQDuplicateIndex, cluster_ids, shingles
+from gemini_usage import OVER_BUDGET_MODES, UsageTracker, usage_from_response
+from intent_router import IntentMetrics, load_router
+from loop_monitor import LoopLagMonitor
+from migrations.runner import pending_migrations
+from mongo_client import DEFAULT_ROUTE_BUDGETS_MS, RouteBudgets, create_client, routed_database
+from offload import CPUPool
+from precompute import PRECOMPUTE_USER, PRECOMPUTED_COLLECTION, PrecomputedAnswers, context_version
+from slow_ops import SlowOperationListener, ensure_log_collection, request_context
+from tenancy import TenantConfig, bind_tenant, scoped_database, tenant_context, unscoped
+from tracing import MongoSpanListener, Tracer, make_exporter
+from rate_limit import (
+    FairScheduler,
+    MemoryRateLimiter,
+    MongoRateLimiter,
+    RateLimit,
+    SchedulerQueueFull,
+    client_identity,
+    forwarded_hop,
+)
+from retention import RetentionJob, make_archive, purge_history
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / ".env")
@@ -23,23 +57,136 @@ def clean_mongo(doc):
     doc.pop("_id", None)
     return doc
 
-def stringify_object_ids(obj):
-    # Recursively convert bson.ObjectId to str so JSON serialization succeeds.
-    if isinstance(obj, ObjectId):
-        return str(obj)
-    if isinstance(obj, dict):
-        return {k: stringify_object_ids(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [stringify_object_ids(v) for v in obj]
-    return obj
+# Streaming reads: documents are pulled from the Motor cursor in batches and
+# written out as they are serialized, so memory stays flat regardless of how
+# many rows the query returns.
+STREAM_BATCH_SIZE = 500
+STREAM_CHUNK_BYTES = 64 * 1024
+
+def serialize_documents(model, docs) -> List[str]:
+    return [model(**doc).model_dump_json() for doc in docs]
+
+async def _document_batches(cursor):
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= STREAM_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def stream_documents(cursor, model, ndjson: bool = False):
+    cursor = cursor.batch_size(STREAM_BATCH_SIZE)
+    chunk = [] if ndjson else ["["]
+    size = 0
+    first = True
+    async for batch in _document_batches(cursor):
+        # Validation is the CPU-heavy part of a big stream; the models live
+        # here, so it stays in this process.
+        for item in await cpu_pool.run(serialize_documents, model, batch, size=len(batch), local=True):
+            if ndjson:
+                chunk.append(item + "\n")
+            else:
+                chunk.append(item if first else "," + item)
+            first = False
+            size += len(item) + 1
+            if size >= STREAM_CHUNK_BYTES:
+                yield "".join(chunk)
+                chunk, size = [], 0
+    if not ndjson:
+        chunk.append("]")
+    if chunk:
+        yield "".join(chunk)
+
+def streaming_response(cursor, model, output: str) -> StreamingResponse:
+    ndjson = output == "ndjson"
+    return StreamingResponse(
+        stream_documents(cursor, model, ndjson),
+        media_type="application/x-ndjson" if ndjson else "application/json",
+    )
 
-# MongoDB connection
-mongo_url = os.environ.get("MONGO_URL")
-if not mongo_url:
-    raise RuntimeError("MONGO_URL not set in environment")
+# Event-loop lag and the pool for CPU-heavy steps; see loop_monitor.py and
+# offload.py.
+loop_monitor = LoopLagMonitor(
+    enabled=os.environ.get("LOOP_MONITOR_ENABLED", "true").lower() == "true",
+    interval_ms=float(os.environ.get("LOOP_LAG_INTERVAL_MS", "100")),
+    block_ms=float(os.environ.get("LOOP_BLOCK_THRESHOLD_MS", "250")),
+    log_seconds=float(os.environ.get("LOOP_BLOCK_LOG_SECONDS", "60")),
+)
+cpu_pool = CPUPool(
+    kind=os.environ.get("CPU_POOL", "thread"),
+    workers=int(os.environ.get("CPU_POOL_WORKERS", "0")) or None,
+    min_items=int(os.environ.get("CPU_OFFLOAD_MIN_ITEMS", "500")),
+)
 
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get("DB_NAME", "campus_chatbot")]
+# MongoDB connection (pool, compression and read routing: see mongo_client.py)
+SLOW_OP_LOG_ENABLED = os.environ.get("SLOW_OP_LOG_ENABLED", "true").lower() == "true"
+slow_op_listener = SlowOperationListener(
+    threshold_ms=float(os.environ.get("SLOW_OP_THRESHOLD_MS", "100")),
+    explain_interval=float(os.environ.get("SLOW_OP_EXPLAIN_INTERVAL_SECONDS", "60")),
+)
+# Per-request traces; see tracing.py.
+tracer = Tracer(
+    enabled=os.environ.get("TRACE_ENABLED", "true").lower() == "true",
+    sample_rate=float(os.environ.get("TRACE_SAMPLE_RATE", "0.01")),
+    slow_ms=float(os.environ.get("TRACE_SLOW_MS", "2000")),
+    exporter=make_exporter(os.environ.get("TRACE_EXPORTER", "none")),
+    keep=int(os.environ.get("TRACE_KEEP_SLOWEST", "100")),
+)
+client = create_client(event_listeners=([slow_op_listener] if SLOW_OP_LOG_ENABLED else [])
+                       + ([MongoSpanListener()] if tracer.enabled else []))
+# Campus data goes through tenant-scoped handles (see tenancy.py); with
+# TENANCY_MODE=off they are plain databases. shared_db holds operational
+# collections common to all campuses.
+tenants = TenantConfig.from_env()
+shared_db = client[tenants.db_name]
+db = scoped_database(shared_db, tenants)
+# Auth and writes use `db` (primary). Uncached reference-data lists and admin
+# analytics may be served from secondaries.
+reference_db = scoped_database(routed_database(shared_db, "reference"), tenants)
+analytics_db = scoped_database(routed_database(shared_db, "analytics"), tenants)
+route_budgets = RouteBudgets(os.environ.get("MONGO_ROUTE_BUDGETS_MS", DEFAULT_ROUTE_BUDGETS_MS))
+
+FAQ_DUPLICATE_MODE = os.environ.get("FAQ_DUPLICATE_MODE", "warn")
+faq_duplicates = FAQDuplicateIndex(
+    db.faq_signatures, threshold=float(os.environ.get("FAQ_DUPLICATE_THRESHOLD", "0.7")), run=cpu_pool.run
+)
+
+# flat (one document per message) or bucketed (per user/day); see chat_store.py
+CHAT_HISTORY_LAYOUT = os.environ.get("CHAT_HISTORY_LAYOUT", "flat")
+CHAT_BUCKET_MAX_TURNS = int(os.environ.get("CHAT_BUCKET_MAX_TURNS", DEFAULT_BUCKET_TURNS))
+chat_history = make_chat_history(db, CHAT_HISTORY_LAYOUT, CHAT_BUCKET_MAX_TURNS)
+# Same store for the admin list and export, read with the analytics routing.
+analytics_history = make_chat_history(analytics_db, CHAT_HISTORY_LAYOUT, CHAT_BUCKET_MAX_TURNS)
+
+# Per-worker cache of reference data and auth lookups, invalidated across
+# workers by change streams or version polling; see cache_sync.py.
+# Entries are kept per campus and share one budget; see LocalCache.
+local_cache = LocalCache(
+    ttl_seconds=float(os.environ.get("CACHE_TTL_SECONDS", "300")),
+    max_entries=int(os.environ.get("CACHE_MAX_ENTRIES", "50000")),
+)
+cache_sync = CacheInvalidator(
+    shared_db,
+    local_cache,
+    mode=os.environ.get("CACHE_SYNC_MODE", "auto"),
+    poll_interval=float(os.environ.get("CACHE_POLL_INTERVAL_SECONDS", "1")),
+    collections=WATCHED_COLLECTIONS + (PRECOMPUTED_COLLECTION,),
+    tenants=tenants,
+)
+
+async def cached_find_one(collection: str, key: str, query: dict) -> Optional[dict]:
+    # Returned documents are shared with the cache; callers must not mutate them.
+    doc = local_cache.get(collection, key)
+    if doc is not None:
+        return doc
+    generation = local_cache.generation(collection)
+    doc = await db[collection].find_one(query)
+    if doc:
+        doc_id = str(doc.pop("_id"))
+        local_cache.set(collection, key, doc, doc_id=doc_id, generation=generation)
+    return doc
 
 # Create the main app
 app = FastAPI()
@@ -136,6 +283,8 @@ class Event(BaseModel):
     date: str
     location: str
     organizer: str
+    start_at: Optional[datetime] = None
+    end_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class EventCreate(BaseModel):
@@ -174,6 +323,9 @@ class ChatMessage(BaseModel):
     query: str
     response: str
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    intent: Optional[str] = None
+    # Gemini token counts and upstream latency for this answer.
+    usage: Optional[dict] = None
 
 class ChatQuery(BaseModel):
     query: str
@@ -182,10 +334,15 @@ class ChatQuery(BaseModel):
 class ChatResponse(BaseModel):
     response: str
     session_id: str
+    # Set only when the exchange was persisted (authenticated users), so the
+    # client can ask /chat/history for entries after this one.
+    id: Optional[str] = None
+    timestamp: Optional[datetime] = None
 
 # -------------------------------
 # Auth helpers (with projection)
 # -------------------------------
+@tracer.traced("auth.get_current_user")
 async def get_current_user(request: Request) -> Optional[User]:
     session_token = request.cookies.get("session_token")
     if not session_token:
@@ -195,7 +352,7 @@ async def get_current_user(request: Request) -> Optional[User]:
     if not session_token:
         return None
 
-    session = await db.sessions.find_one({"session_token": session_token}, {"_id": 0})
+    session = await cached_find_one("sessions", session_token, {"session_token": session_token})
     if not session:
         return None
 
@@ -210,7 +367,7 @@ async def get_current_user(request: Request) -> Optional[User]:
     except Exception:
         return None
 
-    user = await db.users.find_one({"id": session["user_id"]}, {"_id": 0})
+    user = await cached_find_one("users", session["user_id"], {"id": session["user_id"]})
     if not user:
         return None
     return User(**user)
@@ -230,22 +387,26 @@ async def require_admin(request: Request) -> User:
 # -------------------------------
 # Auth routes
 # -------------------------------
+def cookie_path(request: Request) -> str:
+    # Campuses resolved by path prefix each get their own session cookie.
+    return request.scope.get("tenant_prefix") or "/"
+
 @api_router.post("/auth/session")
 async def create_session(request: Request, response: Response):
     session_id = request.headers.get("x-session-id")
     if not session_id:
         raise HTTPException(status_code=400, detail="Session ID required in x-session-id header")
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        try:
-            resp = await client.get(
-                "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-                headers={"X-Session-ID": session_id},
-            )
-            resp.raise_for_status()
-            data = resp.json()
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Failed to get session data: {str(e)}")
+    try:
+        resp = await http_client.get(
+            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
+            headers={"X-Session-ID": session_id},
+            timeout=15.0,
+        )
+        resp.raise_for_status()
+        data = resp.json()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to get session data: {str(e)}")
 
     user_data = {
         "id": str(data.get("id")),
@@ -281,7 +442,7 @@ async def create_session(request: Request, response: Response):
         httponly=True,
         secure=True,
         samesite="none",
-        path="/",
+        path=cookie_path(request),
         max_age=60 * 60 * 24 * 7,
     )
 
@@ -301,43 +462,74 @@ async def logout(request: Request, response: Response):
     session_token = request.cookies.get("session_token")
     if session_token:
         await db.sessions.delete_one({"session_token": session_token})
-    response.delete_cookie(key="session_token", path="/")
+        await cache_sync.touch("sessions")
+    response.delete_cookie(key="session_token", path=cookie_path(request))
     return {"message": "Logged out successfully"}
 
 # -------------------------------
 # FAQ routes
 # -------------------------------
 @api_router.get("/faqs", response_model=List[FAQ])
-async def get_faqs(category: Optional[str] = None):
+async def get_faqs(
+    category: Optional[str] = None,
+    stream: bool = False,
+    output: Literal["json", "ndjson"] = Query("json", alias="format"),
+):
     query = {"category": category} if category else {}
-    faqs = await db.faqs.find(query, {"_id": 0}).to_list(1000)
-    for faq in faqs:
-        if isinstance(faq.get("created_at"), str):
-            faq["created_at"] = datetime.fromisoformat(faq["created_at"])
-        if isinstance(faq.get("updated_at"), str):
-            faq["updated_at"] = datetime.fromisoformat(faq["updated_at"])
-    return faqs
+    if stream or output == "ndjson":
+        # Streamed reads are not capped at 1000.
+        return streaming_response(reference_db.faqs.find(query, {"_id": 0}), FAQ, output)
+    faqs = await reference_db.faqs.find(query, {"_id": 0}).to_list(1000)
+    return await cpu_pool.run(parse_timestamps, faqs, ("created_at", "updated_at"), size=len(faqs))
+
+async def check_faq_duplicates(faq: dict, response: Response, allow_duplicate: bool) -> None:
+    # In "reject" mode near-duplicates fail with 409 unless the admin passes
+    # allow_duplicate=true; in "warn" mode they are listed in a header.
+    matches = await faq_duplicates.find_similar(faq, exclude_id=faq.get("id"))
+    if not matches:
+        return
+    if FAQ_DUPLICATE_MODE == "reject" and not allow_duplicate:
+        raise HTTPException(status_code=409, detail={
+            "message": "Near-duplicate FAQ exists",
+            "duplicates": [{"id": faq_id, "similarity": score} for faq_id, score in matches[:10]],
+        })
+    response.headers["X-Near-Duplicates"] = ",".join(f"{faq_id}:{score}" for faq_id, score in matches[:10])
 
 @api_router.post("/faqs", response_model=FAQ)
-async def create_faq(faq_data: FAQCreate, request: Request):
+async def create_faq(faq_data: FAQCreate, request: Request, response: Response, allow_duplicate: bool = False):
     await require_admin(request)
     faq = FAQ(**faq_data.model_dump())
     doc = faq.model_dump()
+    await check_faq_duplicates(doc, response, allow_duplicate)
     doc["created_at"] = doc["created_at"].isoformat()
     doc["updated_at"] = doc["updated_at"].isoformat()
     await db.faqs.insert_one(doc)
+    await cache_sync.touch("faqs")
+    await faq_duplicates.upsert(doc)
     return faq
 
 @api_router.put("/faqs/{faq_id}", response_model=FAQ)
-async def update_faq(faq_id: str, faq_update: FAQUpdate, request: Request):
+async def update_faq(
+    faq_id: str,
+    faq_update: FAQUpdate,
+    request: Request,
+    response: Response,
+    allow_duplicate: bool = False,
+):
     await require_admin(request)
     existing_faq = await db.faqs.find_one({"id": faq_id}, {"_id": 0})
     if not existing_faq:
         raise HTTPException(status_code=404, detail="FAQ not found")
     update_data = {k: v for k, v in faq_update.model_dump().items() if v is not None}
+    text_changed = "question" in update_data or "answer" in update_data
+    if text_changed:
+        await check_faq_duplicates({**existing_faq, **update_data}, response, allow_duplicate)
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     await db.faqs.update_one({"id": faq_id}, {"$set": update_data})
+    await cache_sync.touch("faqs")
     updated_faq = await db.faqs.find_one({"id": faq_id}, {"_id": 0})
+    if text_changed:
+        await faq_duplicates.upsert(updated_faq)
     if isinstance(updated_faq["created_at"], str):
         updated_faq["created_at"] = datetime.fromisoformat(updated_faq["created_at"])
     if isinstance(updated_faq["updated_at"], str):
@@ -350,18 +542,34 @@ async def delete_faq(faq_id: str, request: Request):
     result = await db.faqs.delete_one({"id": faq_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="FAQ not found")
+    await cache_sync.touch("faqs")
+    await faq_duplicates.remove(faq_id)
     return {"message": "FAQ deleted successfully"}
 
+@api_router.get("/admin/faqs/duplicates")
+async def get_faq_duplicates(request: Request, response: Response):
+    # Clusters of near-duplicate FAQs across the whole collection.
+    # X-Sampled-Buckets counts the heavily duplicated LSH buckets whose
+    # members were checked against a sample rather than pairwise.
+    await require_admin(request)
+    clusters, sampled = await faq_duplicates.clusters()
+    if sampled:
+        logger.warning("FAQ duplicate report sampled %s oversized LSH buckets", sampled)
+        response.headers["X-Sampled-Buckets"] = str(sampled)
+    ids = cluster_ids(clusters)
+    faqs = {f["id"]: f async for f in analytics_db.faqs.find({"id": {"$in": ids}}, {"_id": 0, "id": 1, "question": 1, "category": 1})}
+    return [
+        [{**faqs.get(faq_id, {"id": faq_id}), "similarity": score} for faq_id, score in cluster]
+        for cluster in clusters
+    ]
+
 # -------------------------------
 # Department, Faculty, Event, Location routes
 # -------------------------------
 @api_router.get("/departments", response_model=List[Department])
 async def get_departments():
-    departments = await db.departments.find({}, {"_id": 0}).to_list(1000)
-    for dept in departments:
-        if isinstance(dept.get("created_at"), str):
-            dept["created_at"] = datetime.fromisoformat(dept["created_at"])
-    return departments
+    departments = await reference_db.departments.find({}, {"_id": 0}).to_list(1000)
+    return await cpu_pool.run(parse_timestamps, departments, size=len(departments))
 
 @api_router.post("/departments", response_model=Department)
 async def create_department(dept_data: DepartmentCreate, request: Request):
@@ -370,6 +578,7 @@ async def create_department(dept_data: DepartmentCreate, request: Request):
     doc = department.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
     await db.departments.insert_one(doc)
+    await cache_sync.touch("departments")
     return department
 
 @api_router.put("/departments/{dept_id}", response_model=Department)
@@ -381,6 +590,7 @@ async def update_department(dept_id: str, dept_update: DepartmentUpdate, request
     update_data = {k: v for k, v in dept_update.model_dump().items() if v is not None}
     if update_data:
         await db.departments.update_one({"id": dept_id}, {"$set": update_data})
+        await cache_sync.touch("departments")
     updated_dept = await db.departments.find_one({"id": dept_id}, {"_id": 0})
     if isinstance(updated_dept["created_at"], str):
         updated_dept["created_at"] = datetime.fromisoformat(updated_dept["created_at"])
@@ -392,26 +602,13 @@ async def delete_department(dept_id: str, request: Request):
     result = await db.departments.delete_one({"id": dept_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Department not found")
+    await cache_sync.touch("departments")
     return {"message": "Department deleted successfully"}
 
 @api_router.get("/faculty", response_model=List[Faculty])
 async def get_faculty():
-    faculty = await db.faculty.find({}, {"_id": 0}).to_list(1000)
-    for f in faculty:
-        if isinstance(f.get("created_at"), str):
-            f["created_at"] = datetime.fromisoformat(f["created_at"])
-    def sort_key(f):
-        role = f.get("role", "").lower()
-        if "principal" in role or "coordinator" in role:
-            return 0
-        elif "hod" in role or "head" in role:
-            return 1
-        elif "professor" in role:
-            return 2
-        else:
-            return 3
-    faculty.sort(key=sort_key)
-    return faculty
+    faculty = await reference_db.faculty.find({}, {"_id": 0}).to_list(1000)
+    return await cpu_pool.run(sort_faculty, faculty, size=len(faculty))
 
 @api_router.post("/faculty", response_model=Faculty)
 async def create_faculty(faculty_data: FacultyCreate, request: Request):
@@ -420,6 +617,7 @@ async def create_faculty(faculty_data: FacultyCreate, request: Request):
     doc = faculty.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
     await db.faculty.insert_one(doc)
+    await cache_sync.touch("faculty")
     return faculty
 
 @api_router.put("/faculty/{faculty_id}", response_model=Faculty)
@@ -431,6 +629,7 @@ async def update_faculty(faculty_id: str, faculty_update: FacultyUpdate, request
     update_data = {k: v for k, v in faculty_update.model_dump().items() if v is not None}
     if update_data:
         await db.faculty.update_one({"id": faculty_id}, {"$set": update_data})
+        await cache_sync.touch("faculty")
     updated_faculty = await db.faculty.find_one({"id": faculty_id}, {"_id": 0})
     if isinstance(updated_faculty["created_at"], str):
         updated_faculty["created_at"] = datetime.fromisoformat(updated_faculty["created_at"])
@@ -442,15 +641,22 @@ async def delete_faculty(faculty_id: str, request: Request):
     result = await db.faculty.delete_one({"id": faculty_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Faculty not found")
+    await cache_sync.touch("faculty")
     return {"message": "Faculty deleted successfully"}
 
+EVENT_TIMESTAMPS = ("created_at", "start_at", "end_at")
+
+def _event_from_doc(event):
+    return parse_timestamps([event], EVENT_TIMESTAMPS)[0]
+
 @api_router.get("/events", response_model=List[Event])
-async def get_events():
-    events = await db.events.find({}, {"_id": 0}).to_list(1000)
-    for event in events:
-        if isinstance(event.get("created_at"), str):
-            event["created_at"] = datetime.fromisoformat(event["created_at"])
-    return events
+async def get_events(upcoming: bool = False, limit: int = Query(1000, ge=1, le=1000)):
+    if upcoming:
+        cursor = reference_db.events.find(upcoming_events_filter(), {"_id": 0}).sort("start_at", 1)
+    else:
+        cursor = reference_db.events.find({}, {"_id": 0})
+    events = await cursor.to_list(limit)
+    return await cpu_pool.run(parse_timestamps, events, EVENT_TIMESTAMPS, size=len(events))
 
 @api_router.post("/events", response_model=Event)
 async def create_event(event_data: EventCreate, request: Request):
@@ -458,8 +664,10 @@ async def create_event(event_data: EventCreate, request: Request):
     event = Event(**event_data.model_dump())
     doc = event.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
+    doc["start_at"], doc["end_at"] = parse_event_dates(event.date)
     await db.events.insert_one(doc)
-    return event
+    await cache_sync.touch("events")
+    return _event_from_doc(clean_mongo(doc))
 
 @api_router.put("/events/{event_id}", response_model=Event)
 async def update_event(event_id: str, event_update: EventUpdate, request: Request):
@@ -468,12 +676,13 @@ async def update_event(event_id: str, event_update: EventUpdate, request: Reques
     if not existing_event:
         raise HTTPException(status_code=404, detail="Event not found")
     update_data = {k: v for k, v in event_update.model_dump().items() if v is not None}
+    if "date" in update_data:
+        update_data["start_at"], update_data["end_at"] = parse_event_dates(update_data["date"])
     if update_data:
         await db.events.update_one({"id": event_id}, {"$set": update_data})
+        await cache_sync.touch("events")
     updated_event = await db.events.find_one({"id": event_id}, {"_id": 0})
-    if isinstance(updated_event["created_at"], str):
-        updated_event["created_at"] = datetime.fromisoformat(updated_event["created_at"])
-    return Event(**updated_event)
+    return Event(**_event_from_doc(updated_event))
 
 @api_router.delete("/events/{event_id}")
 async def delete_event(event_id: str, request: Request):
@@ -481,15 +690,13 @@ async def delete_event(event_id: str, request: Request):
     result = await db.events.delete_one({"id": event_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Event not found")
+    await cache_sync.touch("events")
     return {"message": "Event deleted successfully"}
 
 @api_router.get("/locations", response_model=List[Location])
 async def get_locations():
-    locations = await db.locations.find({}, {"_id": 0}).to_list(1000)
-    for loc in locations:
-        if isinstance(loc.get("created_at"), str):
-            loc["created_at"] = datetime.fromisoformat(loc["created_at"])
-    return locations
+    locations = await reference_db.locations.find({}, {"_id": 0}).to_list(1000)
+    return await cpu_pool.run(parse_timestamps, locations, size=len(locations))
 
 @api_router.post("/locations", response_model=Location)
 async def create_location(location_data: LocationCreate, request: Request):
@@ -498,6 +705,7 @@ async def create_location(location_data: LocationCreate, request: Request):
     doc = location.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
     await db.locations.insert_one(doc)
+    await cache_sync.touch("locations")
     return location
 
 @api_router.put("/locations/{location_id}", response_model=Location)
@@ -509,6 +717,7 @@ async def update_location(location_id: str, location_update: LocationUpdate, req
     update_data = {k: v for k, v in location_update.model_dump().items() if v is not None}
     if update_data:
         await db.locations.update_one({"id": location_id}, {"$set": update_data})
+        await cache_sync.touch("locations")
     updated_location = await db.locations.find_one({"id": location_id}, {"_id": 0})
     if isinstance(updated_location["created_at"], str):
         updated_location["created_at"] = datetime.fromisoformat(updated_location["created_at"])
@@ -520,137 +729,779 @@ async def delete_location(location_id: str, request: Request):
     result = await db.locations.delete_one({"id": location_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Location not found")
+    await cache_sync.touch("locations")
     return {"message": "Location deleted successfully"}
 
 # -------------------------------
-# Chat (Gemini) route
+# Chat context
 # -------------------------------
-@api_router.post("/chat/query", response_model=ChatResponse)
-async def chat_query(query_data: ChatQuery, request: Request):
-    user = await get_current_user(request)
-
-    faqs = await db.faqs.find({}, {"_id": 0}).to_list(1000)
-    departments = await db.departments.find({}, {"_id": 0}).to_list(100)
-    faculty = await db.faculty.find({}, {"_id": 0}).to_list(100)
-    events = await db.events.find({}, {"_id": 0}).to_list(100)
-    locations = await db.locations.find({}, {"_id": 0}).to_list(100)
-
-    context = "You are a helpful campus assistant. Use the following campus information to answer the student's question:\n\n"
-
-    if faqs:
-        context += "FAQs:\n"
-        for faq in faqs[:20]:
-            context += f"Q: {faq['question']}\nA: {faq['answer']}\n\n"
-
-    if departments:
-        context += "\nDepartments:\n"
-        for dept in departments:
-            context += f"- {dept['position']}: {dept['name']} (Contact: {dept['contact']})\n"
-
-    if faculty:
-        context += "\nFaculty:\n"
-        for f in faculty[:10]:
-            context += f"- {f['name']} - {f['role']} (Qualification: {f['qualification']}): {f['bio']} (Office: {f['office']})\n"
+# How many documents of each collection go into the prompt.
+CONTEXT_LIMITS = {"faqs": 20, "departments": 100, "faculty": 10, "events": 10, "locations": 15}
+
+intent_router = load_router(os.environ.get("INTENT_MODEL_PATH"))
+intent_metrics = IntentMetrics()
+
+# Per-identity chat limits ("<requests>/<seconds>") and the cap on concurrent
+# upstream Gemini calls shared fairly between identities once saturated.
+CHAT_RATE_LIMIT_USER = RateLimit.parse(os.environ.get("CHAT_RATE_LIMIT_USER", "20/60"))
+CHAT_RATE_LIMIT_ANON = RateLimit.parse(os.environ.get("CHAT_RATE_LIMIT_ANON", "5/60"))
+# Anonymous callers are limited per client address. Behind an ingress or
+# load balancer that address is the proxy's, so every anonymous user would
+# share one bucket. Preferably run uvicorn with FORWARDED_ALLOW_IPS set to
+# the proxies' addresses: it then resolves the real client itself. Otherwise
+# set TRUSTED_PROXY_HOPS to the number of proxies in front of the app; the
+# client is the X-Forwarded-For entry the outermost one appended, never the
+# leftmost entry, which the client can write. Off by default: trusting the
+# headers without a proxy lets anyone pick their own key (and campus).
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "0"))
+
+if os.environ.get("RATE_LIMIT_STORE", "memory") == "mongo":
+    chat_rate_limiter = MongoRateLimiter(db.rate_limits)
+else:
+    chat_rate_limiter = MemoryRateLimiter()
+
+gemini_scheduler = FairScheduler(
+    capacity=int(os.environ.get("GEMINI_MAX_CONCURRENCY", "16")),
+    max_queued_per_identity=int(os.environ.get("GEMINI_MAX_QUEUED_PER_USER", "3")),
+)
 
-    if events:
-        context += "\nUpcoming Events:\n"
-        for event in events[:10]:
-            context += f"- {event['title']}: {event['description']} (Date: {event['date']}, Location: {event['location']})\n"
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
+GEMINI_BASE_URL = os.environ.get("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com")
+
+# Token accounting and the per-campus daily budget; see gemini_usage.py.
+# Over budget, chat either keeps calling Gemini with a trimmed prompt
+# (short_context) or answers from cached FAQs only (cache_only).
+gemini_usage = UsageTracker(
+    db.gemini_usage,
+    daily_token_budget=int(os.environ.get("GEMINI_DAILY_TOKEN_BUDGET", "0")),
+    price_per_mtok_input=float(os.environ.get("GEMINI_PRICE_PER_MTOK_INPUT", "0")),
+    price_per_mtok_output=float(os.environ.get("GEMINI_PRICE_PER_MTOK_OUTPUT", "0")),
+)
+OVER_BUDGET_MODE = os.environ.get("GEMINI_OVER_BUDGET_MODE", "short_context")
+if OVER_BUDGET_MODE not in OVER_BUDGET_MODES:
+    raise ValueError(f"GEMINI_OVER_BUDGET_MODE must be one of {', '.join(OVER_BUDGET_MODES)}")
+OVER_BUDGET_CONTEXT_ITEMS = int(os.environ.get("GEMINI_OVER_BUDGET_CONTEXT_ITEMS", "3"))
+OVER_BUDGET_MESSAGE = ("Today's assistant usage limit has been reached. "
+                       "Please check the FAQs or try again tomorrow.")
+FAQ_MATCH_THRESHOLD = 0.3
+
+# One pooled client for upstream calls (Gemini, the auth provider), so
+# requests reuse warm keep-alive connections instead of a new TLS handshake
+# each time. Sized so every Gemini slot can hold a connection.
+http_client = httpx.AsyncClient(
+    timeout=60.0,
+    limits=httpx.Limits(
+        max_connections=gemini_scheduler.capacity + 8,
+        max_keepalive_connections=gemini_scheduler.capacity,
+        keepalive_expiry=float(os.environ.get("UPSTREAM_KEEPALIVE_SECONDS", "60")),
+    ),
+)
 
-    if locations:
-        context += "\nCampus Locations:\n"
-        for loc in locations[:15]:
-            context += f"- {loc['name']} (Floor: {loc['floor']})\n"
+conversations = ConversationStore(
+    db.conversations,
+    max_turns=int(os.environ.get("CHAT_MEMORY_TURNS", "6")),
+    summary_chars=int(os.environ.get("CHAT_MEMORY_SUMMARY_CHARS", "1200")),
+    idle_seconds=int(os.environ.get("CHAT_MEMORY_IDLE_SECONDS", "1800")),
+)
 
-    session_id = query_data.session_id or str(uuid.uuid4())
+async def _load_context_collection(name: str):
+    cached = local_cache.get(name, "context")
+    if cached is not None:
+        return cached
+    generation = local_cache.generation(name)
+    if name == "events":
+        cursor = db.events.find(upcoming_events_filter(), {"_id": 0}).sort("start_at", 1)
+    else:
+        cursor = db[name].find({}, {"_id": 0})
+    docs = await cursor.to_list(CONTEXT_LIMITS[name])
+    local_cache.set(name, "context", docs, generation=generation)
+    return docs
+
+async def load_context_data(collections) -> dict:
+    results = await asyncio.gather(*(_load_context_collection(name) for name in collections))
+    return dict(zip(collections, results))
+
+def faq_answer(query: str, faqs) -> Optional[str]:
+    # Closest FAQ by shingle overlap with its question, if close enough.
+    wanted = shingles(query)
+    best, best_score = None, 0.0
+    for faq in faqs or []:
+        have = shingles(faq["question"])
+        score = len(wanted & have) / len(wanted | have) if wanted and have else 0.0
+        if score > best_score:
+            best, best_score = faq, score
+    return best["answer"] if best and best_score >= FAQ_MATCH_THRESHOLD else None
 
-    GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-    GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
+# -------------------------------
+# Chat (Gemini) route
+# -------------------------------
+def _gemini_text(data) -> str:
+    if not isinstance(data, dict):
+        return str(data)
+    if data.get("candidates"):
+        cand = data["candidates"][0]
+        content = cand.get("content") or {}
+        if isinstance(content, list):
+            content = content[0] if content else {}
+        parts = content.get("parts") or [{}]
+        return cand.get("output") or parts[0].get("text") or cand.get("text") or str(cand)
+    if isinstance(data.get("outputs"), list) and data["outputs"]:
+        return str(data["outputs"][0])
+    return str(data)
+
+@tracer.traced("gemini.generate")
+async def call_gemini(prompt: str) -> Tuple[str, Optional[dict]]:
+    # Returns the reply and its usage (None when no answer came back).
+    if not GEMINI_API_KEY:
+        return "AI model not configured. Please set GEMINI_API_KEY in environment.", None
+    url = f"{GEMINI_BASE_URL}/v1beta/models/{GEMINI_MODEL}:generateContent"
+    headers = {"Content-Type": "application/json", "x-goog-api-key": GEMINI_API_KEY}
+    payload = {"contents": [{"parts": [{"text": prompt}]}]}
 
+    started = time.perf_counter()
+    try:
+        resp = await http_client.post(url, json=payload, headers=headers)
+        resp.raise_for_status()
+        data = resp.json()
+        return _gemini_text(data), usage_from_response(data, (time.perf_counter() - started) * 1000, GEMINI_MODEL)
+    except httpx.HTTPStatusError as exc:
+        return f"Gemini API error: {exc.response.text}", None
+    except Exception as exc:
+        return f"Failed to call Gemini: {str(exc)}", None
+
+@tracer.traced("gemini.stream")
+async def stream_gemini(prompt: str, on_chunk) -> Tuple[str, Optional[dict]]:
+    # call_gemini over streamGenerateContent (server-sent events): each text
+    # piece is handed to on_chunk as it arrives. The last event carries the
+    # usage totals.
     if not GEMINI_API_KEY:
-        response_text = "AI model not configured. Please set GEMINI_API_KEY in environment."
-    else:
-        prompt = context + "\n\nStudent question: " + query_data.query + "\n\nAnswer:"
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
-        headers = {"Content-Type": "application/json", "x-goog-api-key": GEMINI_API_KEY}
-        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        return "AI model not configured. Please set GEMINI_API_KEY in environment.", None
+    url = f"{GEMINI_BASE_URL}/v1beta/models/{GEMINI_MODEL}:streamGenerateContent?alt=sse"
+    headers = {"Content-Type": "application/json", "x-goog-api-key": GEMINI_API_KEY}
+    payload = {"contents": [{"parts": [{"text": prompt}]}]}
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            try:
-                resp = await client.post(url, json=payload, headers=headers)
+    started = time.perf_counter()
+    pieces, last = [], None
+    try:
+        async with http_client.stream("POST", url, json=payload, headers=headers) as resp:
+            if resp.is_error:
+                await resp.aread()
                 resp.raise_for_status()
-                data = resp.json()
-                response_text = None
-                if isinstance(data, dict):
-                    if "candidates" in data and data["candidates"]:
-                        cand = data["candidates"][0]
-                        response_text = (
-                            cand.get("output")
-                            or (cand.get("content", [{}])[0].get("parts", [{}])[0].get("text")
-                                if cand.get("content")
-                                else None)
-                            or cand.get("text")
-                        )
-                    elif "outputs" in data and isinstance(data["outputs"], list) and data["outputs"]:
-                        response_text = str(data["outputs"][0])
-                    else:
-                        response_text = str(data)
-                else:
-                    response_text = str(data)
-            except httpx.HTTPStatusError as exc:
-                response_text = f"Gemini API error: {exc.response.text}"
-            except Exception as exc:
-                response_text = f"Failed to call Gemini: {str(exc)}"
+            async for line in resp.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                last = json.loads(line[5:])
+                candidate = (last.get("candidates") or [{}])[0]
+                text = "".join(part.get("text", "") for part in (candidate.get("content") or {}).get("parts", []))
+                if text:
+                    pieces.append(text)
+                    await on_chunk(text)
+    except httpx.HTTPStatusError as exc:
+        return f"Gemini API error: {exc.response.text}", None
+    except Exception as exc:
+        return f"Failed to call Gemini: {str(exc)}", None
+    return "".join(pieces), usage_from_response(last, (time.perf_counter() - started) * 1000, GEMINI_MODEL)
+
+@tracer.traced("chat.build_context")
+async def build_context(query: str, degraded: bool = False) -> Tuple[str, Optional[str], str]:
+    # (intent, reference-data version, context for the prompt). The version
+    # fingerprints the full context even when it is trimmed; it is None while
+    # answer precomputation is off, and the full context is then only
+    # rendered when it is the one sent.
+    intent, collections = intent_router.classify(query)
+    data = await load_context_data(collections)
+    trimmed = degraded and OVER_BUDGET_MODE == "short_context"
+    version = context = None
+    if precomputed_answers.enabled or not trimmed:
+        context = await cpu_pool.run(render_context, data, size=sum(len(docs) for docs in data.values()))
+        version = context_version(context) if precomputed_answers.enabled else None
+    if trimmed:
+        data = {name: docs[:OVER_BUDGET_CONTEXT_ITEMS] for name, docs in data.items()}
+        context = await cpu_pool.run(render_context, data, size=sum(len(docs) for docs in data.values()))
+    return intent, version, context
+
+async def precompute_answer(prompt: str, intent: str) -> Tuple[Optional[str], Optional[dict]]:
+    # Used by the precomputation job; waits for a Gemini slot like any user.
+    if await gemini_usage.over_budget():
+        return None, None
+    async with gemini_scheduler.slot(PRECOMPUTE_USER):
+        response_text, usage = await call_gemini(prompt)
+    if usage:
+        await gemini_usage.record(usage, PRECOMPUTE_USER, intent)
+    return response_text, usage
+
+async def _prepare_precomputed(query: str) -> Tuple[str, str, str]:
+    intent, version, context = await build_context(query)
+    return intent, version, context + "\n\nStudent question: " + query + "\n\nAnswer:"
+
+# Answers for the most asked questions, generated off-peak; see precompute.py.
+precomputed_answers = PrecomputedAnswers(
+    db[PRECOMPUTED_COLLECTION],
+    local_cache,
+    analytics_history,
+    shared_db.job_leases,
+    prepare=_prepare_precomputed,
+    generate=precompute_answer,
+    on_change=lambda: cache_sync.touch(PRECOMPUTED_COLLECTION),
+    top_n=int(os.environ.get("PRECOMPUTE_TOP_N", "0")),
+    min_count=int(os.environ.get("PRECOMPUTE_MIN_COUNT", "3")),
+    lookback_days=int(os.environ.get("PRECOMPUTE_LOOKBACK_DAYS", "14")),
+    concurrency=int(os.environ.get("PRECOMPUTE_CONCURRENCY", "2")),
+    interval_seconds=float(os.environ.get("PRECOMPUTE_INTERVAL_SECONDS", "900")),
+    window=os.environ.get("PRECOMPUTE_HOURS_UTC", "2-6"),
+    # Users are waiting for Gemini slots: leave them to the users.
+    busy=lambda: gemini_scheduler.queued > 0,
+)
 
+async def run_chat(query: str, session_id: Optional[str], user: Optional[User], identity: str,
+                   on_chunk=None) -> ChatResponse:
+    # The chat pipeline behind POST /chat/query and /chat/ws; callers apply
+    # the rate limit. With on_chunk the answer is streamed from Gemini.
+    # Raises SchedulerQueueFull when the identity has too many calls queued.
+    started = time.perf_counter()
+    degraded = await gemini_usage.over_budget()
+    intent, version, context = await build_context(query, degraded)
+    context_ms = (time.perf_counter() - started) * 1000
+
+    session_id = session_id or str(uuid.uuid4())
+    conversation = await conversations.get(session_id, user.id if user else None)
+    # Precomputed answers are context-free, so only for a conversation's
+    # first message.
+    first_message = not conversation.turns and not conversation.summary
+    if not degraded:
+        context += conversations.render(conversation)
+
+    prompt = context + "\n\nStudent question: " + query + "\n\nAnswer:"
+    precomputed = None
+    if first_message and precomputed_answers.enabled:
+        precomputed = await precomputed_answers.lookup(query, version)
+    if precomputed:
+        response_text, usage = precomputed["response"], None
+        if on_chunk:
+            await on_chunk(response_text)
+    elif degraded and OVER_BUDGET_MODE == "cache_only":
+        faqs = (await load_context_data(["faqs"]))["faqs"]
+        response_text = faq_answer(query, faqs) or OVER_BUDGET_MESSAGE
+        usage = usage_from_response(None, 0.0, None)
+        if on_chunk:
+            await on_chunk(response_text)
+    else:
+        with tracer.span("chat.gemini", intent=intent) as span:
+            waiting = time.perf_counter()
+            async with gemini_scheduler.slot(identity):
+                if span:
+                    span.attributes["queue_ms"] = round((time.perf_counter() - waiting) * 1000, 1)
+                if on_chunk:
+                    response_text, usage = await stream_gemini(prompt, on_chunk)
+                else:
+                    response_text, usage = await call_gemini(prompt)
+            if span and usage:
+                span.attributes.update(prompt_tokens=usage["prompt_tokens"], candidate_tokens=usage["candidate_tokens"])
+        if usage and first_message and not degraded and precomputed_answers.enabled:
+            await precomputed_answers.refresh(query, intent, version, response_text, usage)
+    if usage:
+        await gemini_usage.record(usage, user.id if user else None, intent, degraded)
+
+    chat_record = None
     if user:
         chat_record = {
             "id": str(uuid.uuid4()),
             "user_id": user.id,
-            "query": query_data.query,
+            "query": query,
             "response": response_text,
             "timestamp": datetime.now(timezone.utc).isoformat(),
+            "intent": intent,
         }
-        await db.chat_history.insert_one(chat_record)
+        if usage:
+            chat_record["usage"] = usage
+        with tracer.span("chat_history.insert", layout=chat_history.layout):
+            await chat_history.insert(chat_record)
 
+    try:
+        await conversations.append(conversation, query, response_text)
+    except ConversationConflict:
+        # The answer is generated and saved; losing one turn of memory beats
+        # failing the request.
+        logger.warning("Dropped a turn from conversation %s after repeated write conflicts",
+                       conversation.session_id)
+    # A session id owned by someone else was replaced with a new one.
+    session_id = conversation.session_id
+    intent_metrics.record(intent, len(prompt), context_ms, (time.perf_counter() - started) * 1000)
+    if chat_record:
+        return ChatResponse(
+            response=response_text,
+            session_id=session_id,
+            id=chat_record["id"],
+            timestamp=datetime.fromisoformat(chat_record["timestamp"]),
+        )
     return ChatResponse(response=response_text, session_id=session_id)
 
+@api_router.post("/chat/query", response_model=ChatResponse)
+async def chat_query(query_data: ChatQuery, request: Request, response: Response):
+    user = await get_current_user(request)
+    identity = client_identity(request, user, TRUSTED_PROXY_HOPS)
+    limit = CHAT_RATE_LIMIT_USER if user else CHAT_RATE_LIMIT_ANON
+    rate = await chat_rate_limiter.hit(identity, limit)
+    if not rate.allowed:
+        raise HTTPException(status_code=429, detail="Rate limit exceeded", headers=rate.headers())
+    response.headers.update(rate.headers())
+    try:
+        return await run_chat(query_data.query, query_data.session_id, user, identity)
+    except SchedulerQueueFull:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many pending requests, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+
+# -------------------------------
+# Chat over WebSocket
+# -------------------------------
+# Protocol and limits: see chat_ws.py.
+chat_sockets = ChatSocketHub(
+    max_connections=int(os.environ.get("WS_MAX_CONNECTIONS", "20000")),
+    max_in_flight=int(os.environ.get("WS_MAX_IN_FLIGHT", "4")),
+    max_frame_bytes=int(os.environ.get("WS_MAX_FRAME_BYTES", "8192")),
+    heartbeat_seconds=float(os.environ.get("WS_HEARTBEAT_SECONDS", "30")),
+    idle_seconds=float(os.environ.get("WS_IDLE_SECONDS", "90")),
+    reauth_seconds=float(os.environ.get("WS_REAUTH_SECONDS", "300")),
+    allowed_origins=os.environ.get("CORS_ORIGINS", "*").split(","),
+)
+
+async def answer_over_socket(conn: ChatConnection, message_id: str, query: str, session_id: Optional[str]):
+    request_context.set({"route": "WS /api/chat/ws", "request_id": message_id, "tenant": tenant_context.get()})
+    with tracer.trace("WS /api/chat/ws ask", request_id=message_id, tenant=tenant_context.get()) as trace:
+        try:
+            if chat_sockets.needs_reauth(conn):
+                # Sessions can be revoked while the socket is open.
+                conn.user = await get_current_user(conn.websocket)
+                conn.authenticated_at = time.monotonic()
+                if conn.user is None:
+                    await conn.send({"type": "error", "id": message_id, "status": 401, "detail": "Session expired"})
+                    await conn.close(CLOSE_UNAUTHORIZED)
+                    return
+            limit = CHAT_RATE_LIMIT_USER if conn.user else CHAT_RATE_LIMIT_ANON
+            rate = await chat_rate_limiter.hit(conn.identity, limit)
+            if not rate.allowed:
+                await conn.send({"type": "error", "id": message_id, "status": 429, "detail": "Rate limit exceeded",
+                                 "retry_after": max(1, math.ceil(rate.reset_after))})
+                return
+
+            async def on_chunk(text: str):
+                await conn.send({"type": "chunk", "id": message_id, "text": text})
+
+            result = await run_chat(query, session_id, conn.user, conn.identity, on_chunk)
+            await conn.send({"type": "done", "id": message_id, "response": result.response,
+                             "session_id": result.session_id, "record_id": result.id,
+                             "timestamp": result.timestamp.isoformat() if result.timestamp else None,
+                             "trace_id": trace.trace_id if trace else None})
+        except SchedulerQueueFull:
+            await conn.send({"type": "error", "id": message_id, "status": 429,
+                             "detail": "Too many pending requests, please retry shortly", "retry_after": 1})
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.exception("Chat over WebSocket failed")
+            if trace:
+                trace.root.error = repr(exc)
+            await conn.send({"type": "error", "id": message_id, "status": 500, "detail": "Internal Server Error"})
+
+@api_router.websocket("/chat/ws")
+async def chat_socket(websocket: WebSocket):
+    if chat_sockets.full():
+        chat_sockets.rejected += 1
+        await websocket.close(CLOSE_TRY_AGAIN)
+        return
+    if not chat_sockets.origin_allowed(websocket.headers.get("origin"), websocket.headers.get("host")):
+        # Another site's page riding the student's session cookie.
+        chat_sockets.forbidden += 1
+        await websocket.close(CLOSE_POLICY)
+        return
+    # The only session/user lookup for the life of the socket (until reauth).
+    user = await get_current_user(websocket)
+    await websocket.accept()
+    conn = ChatConnection(websocket, user, client_identity(websocket, user, TRUSTED_PROXY_HOPS))
+    chat_sockets.add(conn)
+    try:
+        await conn.send({"type": "ready", "user_id": user.id if user else None,
+                         "heartbeat_seconds": chat_sockets.heartbeat_seconds,
+                         "max_in_flight": chat_sockets.max_in_flight})
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                break
+            conn.last_seen = time.monotonic()
+            try:
+                message = chat_sockets.parse(frame.get("text"))
+            except ValueError as exc:
+                await conn.send({"type": "error", "status": 400, "detail": str(exc)})
+                await conn.close(CLOSE_POLICY if frame.get("text") is not None else CLOSE_UNSUPPORTED)
+                break
+
+            kind, message_id = message["type"], message.get("id")
+            if kind == "ping":
+                await conn.send({"type": "pong"})
+            elif kind == "cancel":
+                task = conn.in_flight.get(message_id)
+                if task:
+                    task.cancel()
+                    await conn.send({"type": "error", "id": message_id, "status": 499, "detail": "Cancelled"})
+            elif kind != "ask":
+                await conn.send({"type": "error", "id": message_id, "status": 400, "detail": f"Unknown type {kind!r}"})
+            elif not isinstance(message_id, str) or not message_id or len(message_id) > 64:
+                await conn.send({"type": "error", "status": 400, "detail": "ask needs a string id"})
+            elif not isinstance(message.get("query"), str) or not message["query"].strip():
+                await conn.send({"type": "error", "id": message_id, "status": 400, "detail": "ask needs a query"})
+            elif message_id in conn.in_flight:
+                await conn.send({"type": "error", "id": message_id, "status": 409, "detail": "Duplicate message id"})
+            elif len(conn.in_flight) >= chat_sockets.max_in_flight:
+                await conn.send({"type": "error", "id": message_id, "status": 429,
+                                 "detail": "Too many messages in flight on this connection"})
+            else:
+                session_id = message.get("session_id") if isinstance(message.get("session_id"), str) else None
+                task = asyncio.create_task(answer_over_socket(conn, message_id, message["query"], session_id))
+                conn.in_flight[message_id] = task
+                task.add_done_callback(lambda _, mid=message_id: conn.in_flight.pop(mid, None))
+    finally:
+        chat_sockets.remove(conn)
+
+async def _history_cursor(user_id: str, value: str) -> tuple:
+    # `since`/`before` accept either an ISO timestamp or a chat record id.
+    # Returns a (timestamp, id) keyset position; id breaks timestamp ties.
+    try:
+        ts = datetime.fromisoformat(value)
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return ts.astimezone(timezone.utc).isoformat(), None
+    except ValueError:
+        pass
+    record = await chat_history.find_one(value, user_id)
+    if not record:
+        raise HTTPException(status_code=400, detail="Unknown history cursor")
+    return record["timestamp"], record["id"]
+
+def _keyset_filter(op: str, timestamp: str, record_id: Optional[str]) -> dict:
+    if record_id is None:
+        return {"timestamp": {op: timestamp}}
+    return {
+        "$or": [
+            {"timestamp": {op: timestamp}},
+            {"timestamp": timestamp, "id": {op: record_id}},
+        ]
+    }
+
 @api_router.get("/chat/history", response_model=List[ChatMessage])
-async def get_chat_history(request: Request):
+async def get_chat_history(
+    request: Request,
+    since: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+):
+    # Newest first. `since` returns only entries after a known one (for
+    # incremental sync); `before` pages backwards through older entries.
     user = await require_auth(request)
-    history = await db.chat_history.find({"user_id": user.id}, {"_id": 0}).sort("timestamp", -1).to_list(50)
-    for msg in history:
-        if isinstance(msg.get("timestamp"), str):
-            msg["timestamp"] = datetime.fromisoformat(msg["timestamp"])
-    return history
+    query = {"user_id": user.id}
+    clauses = []
+    min_ts = max_ts = None
+    if since:
+        min_ts, since_id = await _history_cursor(user.id, since)
+        clauses.append(_keyset_filter("$gt", min_ts, since_id))
+    if before:
+        max_ts, before_id = await _history_cursor(user.id, before)
+        clauses.append(_keyset_filter("$lt", max_ts, before_id))
+    if clauses:
+        query["$and"] = clauses
+    cursor = chat_history.find(query, limit=limit, min_ts=min_ts, max_ts=max_ts)
+    history = await cursor.to_list(limit)
+    return await cpu_pool.run(parse_timestamps, history, ("timestamp",), size=len(history))
 
 @api_router.get("/admin/all-queries", response_model=List[ChatMessage])
-async def get_all_queries(request: Request):
+async def get_all_queries(
+    request: Request,
+    limit: int = Query(200, ge=0),
+    stream: bool = False,
+    output: Literal["json", "ndjson"] = Query("json", alias="format"),
+):
+    # limit=0 means no limit, and is only allowed for streamed reads.
+    await require_admin(request)
+    if stream or output == "ndjson":
+        return streaming_response(analytics_history.find({}, limit=limit), ChatMessage, output)
+    if limit == 0 or limit > 1000:
+        raise HTTPException(status_code=400, detail="Use stream=true for more than 1000 rows")
+    history = await analytics_history.find({}, limit=limit).to_list(limit)
+    return await cpu_pool.run(parse_timestamps, history, ("timestamp",), size=len(history))
+
+@api_router.get("/admin/export/chat-history")
+async def export_chat_history(
+    request: Request,
+    output: Literal["csv", "parquet"] = Query("csv", alias="format"),
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    user_id: Optional[str] = None,
+):
+    # Streams chat_history in timestamp order. The X-Export-Watermark header
+    # is the inclusive upper bound used; pass it as `since` next time for an
+    # incremental export.
+    await require_admin(request)
+    try:
+        until = normalize_timestamp(until) if until else datetime.now(timezone.utc).isoformat()
+        query = export_filter(since, until, user_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since/until must be ISO timestamps")
+    if output == "parquet":
+        try:
+            parquet_schema()
+        except RuntimeError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        body, media_type = iter_parquet(analytics_history, query, run=cpu_pool.run), "application/vnd.apache.parquet"
+    else:
+        body, media_type = iter_csv(analytics_history, query, run=cpu_pool.run), "text/csv"
+    filename = f"chat_history_{until[:10]}.{output}"
+    return StreamingResponse(body, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "X-Export-Watermark": until,
+    })
+
+# Retention: records older than CHAT_RETENTION_DAYS (0 keeps everything) are
+# archived and removed by a background job; see retention.py.
+retention = RetentionJob(
+    chat_history,
+    make_archive(os.environ.get("CHAT_ARCHIVE_TARGET", "collection"), db,
+                 Path(os.environ.get("CHAT_ARCHIVE_DIR", ROOT_DIR / "archive"))),
+    shared_db.job_leases,
+    retention_days=int(os.environ.get("CHAT_RETENTION_DAYS", "0")),
+    batch_size=int(os.environ.get("CHAT_RETENTION_BATCH_SIZE", "1000")),
+    duty_cycle=float(os.environ.get("CHAT_RETENTION_DUTY_CYCLE", "0.2")),
+    interval_seconds=float(os.environ.get("CHAT_RETENTION_INTERVAL_SECONDS", "3600")),
+    # Chats queued for a Gemini slot: the worker is saturated, so wait.
+    busy=lambda: gemini_scheduler.queued > 0,
+)
+PURGE_BATCH_SIZE = int(os.environ.get("CHAT_PURGE_BATCH_SIZE", "1000"))
+
+class ChatPurge(BaseModel):
+    # Same bounds as the export: since exclusive, until inclusive, so an
+    # export's X-Export-Watermark can be passed as `until` to purge exactly
+    # what was exported.
+    since: Optional[str] = None
+    until: Optional[str] = None
+    user_id: Optional[str] = None
+    ids: Optional[List[str]] = Field(None, max_length=10000)
+
+@api_router.post("/admin/queries/purge")
+async def purge_queries(purge: ChatPurge, request: Request):
+    await require_admin(request)
+    if not (purge.since or purge.until or purge.user_id or purge.ids):
+        raise HTTPException(status_code=400, detail="Give since, until, user_id or ids")
+    try:
+        query = export_filter(purge.since, purge.until, purge.user_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since/until must be ISO timestamps")
+    if purge.ids:
+        query["id"] = {"$in": purge.ids}
+    deleted = await purge_history(chat_history, query, PURGE_BATCH_SIZE)
+    logger.info("Admin purged %s chat records matching %s", deleted, query)
+    return {"deleted": deleted}
+
+@api_router.get("/admin/traces")
+async def get_traces(request: Request, limit: int = Query(20, ge=1, le=100)):
+    # This worker's slowest recent traces; ask again for another worker's.
+    await require_admin(request)
+    traces = tracer.slowest(limit, tenant_context.get() if tenants.enabled else None)
+    return {**tracer.status(), "traces": [t.summary() for t in traces]}
+
+@api_router.get("/admin/traces/{trace_id}")
+async def get_trace(trace_id: str, request: Request):
+    await require_admin(request)
+    trace = tracer.find(trace_id)
+    if trace is None or (tenants.enabled and trace.root.attributes.get("tenant") != tenant_context.get()):
+        raise HTTPException(status_code=404, detail="Trace not found on this worker")
+    return trace.to_dict()
+
+@api_router.get("/admin/loop")
+async def get_loop_stats(request: Request, limit: int = Query(10, ge=1, le=50)):
+    # This worker's event-loop lag, recent blocking stacks and offloaded work.
+    await require_admin(request)
+    return {**loop_monitor.stats(limit), "cpu_pool": cpu_pool.stats()}
+
+@api_router.get("/admin/precomputed")
+async def get_precomputed(request: Request):
+    await require_admin(request)
+    entries = sorted((await precomputed_answers.entries()).values(), key=lambda e: -(e.get("asked") or 0))
+    return {**precomputed_answers.status(), "entries": entries}
+
+@api_router.get("/admin/retention")
+async def get_retention(request: Request):
     await require_admin(request)
-    history = await db.chat_history.find({}, {"_id": 0}).sort("timestamp", -1).to_list(200)
-    for msg in history:
-        if isinstance(msg.get("timestamp"), str):
-            msg["timestamp"] = datetime.fromisoformat(msg["timestamp"])
-    return history
+    return retention.status()
 
 @api_router.delete("/admin/queries/{query_id}")
 async def delete_query(query_id: str, request: Request):
     await require_admin(request)
-    result = await db.chat_history.delete_one({"id": query_id})
-    if result.deleted_count == 0:
+    if not await chat_history.delete(query_id):
         raise HTTPException(status_code=404, detail="Query not found")
     return {"message": "Query deleted successfully"}
 
+@api_router.get("/admin/metrics/intents")
+async def get_intent_metrics(request: Request):
+    await require_admin(request)
+    return intent_metrics.snapshot()
+
+@api_router.get("/admin/usage/budget")
+async def get_usage_budget(request: Request):
+    await require_admin(request)
+    return {**await gemini_usage.budget_status(), "over_budget_mode": OVER_BUDGET_MODE}
+
+@api_router.get("/admin/usage/{dimension}")
+async def get_usage(
+    request: Request,
+    dimension: Literal["day", "user", "intent"],
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    # Gemini calls and tokens grouped by UTC day, user or intent; since and
+    # until are inclusive YYYY-MM-DD days.
+    await require_admin(request)
+    for value in (since, until):
+        if value:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                raise HTTPException(status_code=400, detail="since/until must be YYYY-MM-DD")
+    return await gemini_usage.summary(dimension, since, until, limit)
+
+@api_router.get("/admin/chat/ws")
+async def get_chat_socket_status(request: Request):
+    await require_admin(request)
+    return chat_sockets.stats()
+
+@api_router.get("/admin/cache")
+async def get_cache_status(request: Request):
+    await require_admin(request)
+    return cache_sync.status()
+
+@api_router.get("/admin/slow-ops")
+async def get_slow_ops(
+    request: Request,
+    collection: Optional[str] = None,
+    route: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+):
+    # Worst offenders first from the capped slow-operation log.
+    await require_admin(request)
+    query = {}
+    if collection:
+        query["collection"] = collection
+    if route:
+        query["route"] = route
+    if tenants.enabled:
+        # The log is shared; campus admins see their own requests.
+        query["tenant"] = tenant_context.get()
+    ops = await unscoped(analytics_db).slow_ops.find(query, {"_id": 0}).sort("duration_ms", -1).to_list(limit)
+    return await cpu_pool.run(stringify_object_ids, ops, size=len(ops))
+
 @api_router.post("/admin/make-admin/{user_id}")
 async def make_admin(user_id: str, request: Request):
     await require_admin(request)
     result = await db.users.update_one({"id": user_id}, {"$set": {"is_admin": True}})
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    await cache_sync.touch("users")
     return {"message": "User is now an admin"}
 
+# -------------------------------
+# Health
+# -------------------------------
+# Liveness only says the process is serving; readiness stays false until
+# warm-up has finished, so load balancers only route to warm workers.
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    state = getattr(app.state, "warmup", None)
+    if not state or not state["ready"]:
+        return JSONResponse(status_code=503, content={
+            "ready": False,
+            "phase": state and state["phase"],
+            "error": state and state["error"],
+        })
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), READINESS_PING_TIMEOUT)
+    except Exception as exc:
+        return JSONResponse(status_code=503, content={"ready": False, "error": f"mongo: {exc}"})
+    return {"ready": True, "startup_ms": state["total_ms"], "phases_ms": state["phases_ms"],
+            "pending_migrations": state.get("pending_migrations", [])}
+
 # Include router and middleware
 app.include_router(api_router)
 
+@app.middleware("http")
+async def bind_request_context(request: Request, call_next):
+    # Lets the slow-operation listener attribute Mongo calls to a request,
+    # and traces it (tracing.py).
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    route = f"{request.method} {request.url.path}"
+    request_context.set({"route": route, "request_id": request_id, "tenant": tenant_context.get()})
+    with tracer.trace(route, request_id, request.headers.get("traceparent"), tenant=tenant_context.get()) as trace:
+        response = await call_next(request)
+        if trace:
+            trace.root.attributes["http.status_code"] = response.status_code
+            if response.status_code >= 500:
+                trace.root.error = f"HTTP {response.status_code}"
+            response.headers["X-Trace-ID"] = trace.trace_id
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+@app.middleware("http")
+async def apply_mongo_budget(request: Request, call_next):
+    # Deadline for all Mongo work in the request; see mongo_client.py.
+    # Streamed reads are exempt since their cursors outlive the handler.
+    budget = route_budgets.seconds_for(request.method, request.url.path)
+    if budget is None or request.query_params.get("stream") == "true" or request.query_params.get("format") == "ndjson":
+        return await call_next(request)
+    with pymongo.timeout(budget):
+        return await call_next(request)
+
+class TenantMiddleware:
+    # Binds each request or WebSocket to a campus (see tenancy.py); in path
+    # mode the /<tenant> prefix is stripped before routing. Plain ASGI so it
+    # covers WebSockets, which "http" middleware never sees. Health probes
+    # are campus-independent.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or not tenants.enabled \
+                or scope["path"] in ("/healthz", "/readyz"):
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        # Same trust rule as client addresses: only a hop our proxies added.
+        host = forwarded_hop(headers.get("x-forwarded-host"), TRUSTED_PROXY_HOPS) or headers.get("host", "")
+        tenant, path, prefix = tenants.resolve(host, scope["path"])
+        if tenant is None:
+            if scope["type"] == "websocket":
+                await receive()  # websocket.connect
+                return await send({"type": "websocket.close", "code": CLOSE_POLICY})
+            return await JSONResponse(status_code=404, content={"detail": "Unknown campus"})(scope, receive, send)
+        token = tenant_context.set(tenant)
+        try:
+            await self.app({**scope, "path": path, "tenant_prefix": prefix}, receive, send)
+        finally:
+            tenant_context.reset(token)
+
+app.add_middleware(TenantMiddleware)
+
+@app.exception_handler(PyMongoError)
+async def mongo_error_handler(request: Request, exc: PyMongoError):
+    if exc.timeout:
+        return JSONResponse(status_code=503, content={"detail": "Database time budget exceeded"},
+                            headers={"Retry-After": "1"})
+    logger.exception("Database error", exc_info=exc)
+    return JSONResponse(status_code=500, content={"detail": "Internal Server Error"})
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -666,8 +1517,126 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# -------------------------------
+# Startup
+# -------------------------------
+WARMUP_MONGO_CONNECTIONS = int(os.environ.get("WARMUP_MONGO_CONNECTIONS", "4"))
+WARMUP_RETRY_SECONDS = float(os.environ.get("WARMUP_RETRY_SECONDS", "5"))
+READINESS_PING_TIMEOUT = float(os.environ.get("READINESS_PING_TIMEOUT_SECONDS", "2"))
+
+async def warm_mongo():
+    # Concurrent pings make the driver open several pooled connections now
+    # rather than on the first requests.
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(WARMUP_MONGO_CONNECTIONS)))
+
+async def for_each_tenant(fn):
+    # Runs per-campus startup work with that campus bound.
+    if not tenants.enabled:
+        return await fn()
+    for tenant in tenants.tenants:
+        with bind_tenant(tenant):
+            await fn()
+
+async def ensure_tenant_indexes():
+    await db.events.create_index("start_at")
+    await db.events.create_index("end_at")
+    await chat_history.ensure_indexes()
+    await conversations.ensure_indexes()
+    await faq_duplicates.ensure_indexes()
+    await faq_duplicates.backfill(db.faqs)
+    await gemini_usage.ensure_indexes()
+    if retention.enabled and retention.archive:
+        await retention.archive.ensure_indexes()
+    await precomputed_answers.ensure_indexes()
+    if isinstance(chat_rate_limiter, MongoRateLimiter):
+        await chat_rate_limiter.ensure_indexes()
+
+async def ensure_indexes():
+    await for_each_tenant(ensure_tenant_indexes)
+    if SLOW_OP_LOG_ENABLED:
+        await ensure_log_collection(shared_db, size_mb=int(os.environ.get("SLOW_OP_LOG_SIZE_MB", "16")))
+
+async def check_migrations():
+    # Migrations are applied by hand (python -m migrations.runner up). Until
+    # then the data may be missing fields the API filters on, e.g. events
+    # without start_at never count as upcoming, so say so loudly.
+    pending = [name for _, name, _ in await pending_migrations(shared_db)]
+    app.state.warmup["pending_migrations"] = pending
+    if pending:
+        logger.warning("Pending data migrations: %s. Run `python -m migrations.runner up` from backend/; "
+                       "until then affected records may be missing from API results", ", ".join(pending))
+
+async def preload_reference_data():
+    # Fills the chat-context cache for every collection (and campus).
+    await for_each_tenant(lambda: load_context_data(list(CONTEXT_LIMITS)))
+
+async def warm_upstream():
+    # Opens a keep-alive connection to Gemini. A failure here is logged, not
+    # fatal: chat degrades to error replies but the rest of the API works.
+    if not GEMINI_API_KEY:
+        return
+    try:
+        await http_client.get(f"{GEMINI_BASE_URL}/v1beta/models/{GEMINI_MODEL}",
+                              headers={"x-goog-api-key": GEMINI_API_KEY}, timeout=5.0)
+    except httpx.HTTPError as exc:
+        logger.warning("Could not pre-connect to Gemini: %s", exc)
+
+WARMUP_PHASES = [
+    ("mongo", warm_mongo),
+    ("indexes", ensure_indexes),
+    ("migrations", check_migrations),
+    ("preload", preload_reference_data),
+    ("upstream", warm_upstream),
+]
+
+async def warm_up():
+    # Runs in the background so /healthz answers while the worker warms up;
+    # a failed phase (e.g. Mongo not reachable yet) restarts the sequence.
+    state = app.state.warmup = {"ready": False, "phase": None, "error": None, "attempts": 0, "phases_ms": {}}
+    started = time.perf_counter()
+    while True:
+        state["attempts"] += 1
+        try:
+            for name, phase in WARMUP_PHASES:
+                state["phase"] = name
+                phase_started = time.perf_counter()
+                await phase()
+                state["phases_ms"][name] = round((time.perf_counter() - phase_started) * 1000, 1)
+            break
+        except Exception as exc:
+            state["error"] = f"{state['phase']}: {exc}"
+            logger.exception("Warm-up failed during %s, retrying in %ss", state["phase"], WARMUP_RETRY_SECONDS)
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+    state.update(ready=True, phase=None, error=None, total_ms=round((time.perf_counter() - started) * 1000, 1))
+    logger.info("Worker ready after %.0f ms warm-up %s", state["total_ms"], state["phases_ms"])
+
+async def wait_until_ready(timeout: float = 60.0) -> None:
+    await asyncio.wait_for(asyncio.shield(app.state.warmup_task), timeout)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    app.state.warmup_task = asyncio.create_task(warm_up())
+    app.state.background_tasks = [
+        asyncio.create_task(conversations.run_eviction()),
+        asyncio.create_task(cache_sync.run()),
+        asyncio.create_task(chat_sockets.run()),
+        asyncio.create_task(retention.run(for_each_tenant)),
+        asyncio.create_task(precomputed_answers.run(for_each_tenant)),
+        asyncio.create_task(tracer.run()),
+        asyncio.create_task(loop_monitor.run()),
+    ]
+    if SLOW_OP_LOG_ENABLED:
+        app.state.background_tasks.append(asyncio.create_task(slow_op_listener.run(shared_db)))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in getattr(app.state, "background_tasks", []) + [getattr(app.state, "warmup_task", None)]:
+        if task:
+            task.cancel()
+    await chat_sockets.close_all()
+    await http_client.aclose()
+    loop_monitor.stop()
+    cpu_pool.shutdown()
     client.close()
 
 
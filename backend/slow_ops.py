@@ -0,0 +1,160 @@
+import asyncio
+import contextvars
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo import monitoring
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+# Set per HTTP request by the app middleware. Motor runs pymongo calls on an
+# executor with a copy of the caller's context, so the command listener can
+# see which request issued each operation.
+request_context: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("request_context", default=None)
+
+# Commands worth explaining; everything else (auth, ping, inserts, ...) is
+# ignored even when slow.
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+
+# Driver-added fields that must not be passed back into explain.
+_COMMAND_META_FIELDS = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "autocommit",
+                        "startTransaction", "readConcern", "writeConcern", "maxTimeMS"}
+
+def query_shape(value):
+    # Keep field names and operators, replace literals with 1, so
+    # {"user_id": "abc", "timestamp": {"$gt": "..."}} and every other user's
+    # version of the same query group together.
+    if isinstance(value, dict):
+        return {k: query_shape(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [query_shape(v) for v in value[:1]]
+    return 1
+
+def _command_filter(name: str, command: dict):
+    if name in ("find", "count", "distinct"):
+        return command.get("filter", command.get("query"))
+    if name == "findAndModify":
+        return command.get("query")
+    if name == "aggregate":
+        return command.get("pipeline")
+    if name == "update":
+        return [u.get("q") for u in command.get("updates", [])[:1]]
+    if name == "delete":
+        return [d.get("q") for d in command.get("deletes", [])[:1]]
+    return None
+
+class SlowOperationListener(monitoring.CommandListener):
+    # Records operations slower than threshold_ms. The listener itself only
+    # hands records to the event loop; explain and persistence happen in
+    # run(), off the request path.
+    def __init__(self, threshold_ms: float = 100.0, log_collection: str = "slow_ops",
+                 explain_interval: float = 60.0, max_pending: int = 1000):
+        self.threshold_ms = threshold_ms
+        self.log_collection = log_collection
+        self.explain_interval = explain_interval
+        self.max_pending = max_pending
+        self._inflight = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._last_explained = {}
+
+    def started(self, event):
+        if event.command_name not in EXPLAINABLE_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        if collection == self.log_collection:
+            return
+        if len(self._inflight) > self.max_pending:
+            return
+        self._inflight[(event.request_id, event.connection_id)] = (
+            event.database_name, collection, dict(event.command), request_context.get()
+        )
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool):
+        started = self._inflight.pop((event.request_id, event.connection_id), None)
+        if started is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.threshold_ms or self._loop is None:
+            return
+        database, collection, command, ctx = started
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(duration_ms, 2),
+            "database": database,
+            "collection": collection,
+            "command": event.command_name,
+            "filter_shape": query_shape(_command_filter(event.command_name, command)),
+            "sort": dict(command["sort"]) if command.get("sort") else None,
+            "route": (ctx or {}).get("route"),
+            "request_id": (ctx or {}).get("request_id"),
+            "tenant": (ctx or {}).get("tenant"),
+            "failed": failed,
+        }
+        # May be called from a Motor executor thread.
+        self._loop.call_soon_threadsafe(self._enqueue, record, command)
+
+    def _enqueue(self, record, command):
+        try:
+            self._queue.put_nowait((record, command))
+        except asyncio.QueueFull:
+            pass
+
+    async def run(self, db) -> None:
+        # Started once per worker at startup with the app's database.
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        while True:
+            record, command = await self._queue.get()
+            try:
+                record["plan"] = await self._explain(db.client[record["database"]], record, command)
+                await db[self.log_collection].insert_one(record)
+            except Exception:
+                logger.exception("Failed to record slow operation")
+
+    async def _explain(self, database, record, command):
+        # One explain per query shape per interval is enough to see the plan;
+        # explaining every slow call would add load when Mongo is already slow.
+        key = (record["collection"], record["command"], repr(record["filter_shape"]), repr(record["sort"]))
+        now = time.monotonic()
+        if now - self._last_explained.get(key, -self.explain_interval) < self.explain_interval:
+            return None
+        self._last_explained[key] = now
+        if len(self._last_explained) > 10000:
+            self._last_explained.clear()
+        explainable = {k: v for k, v in command.items() if k not in _COMMAND_META_FIELDS}
+        result = await database.command({"explain": explainable, "verbosity": "queryPlanner"})
+        planner = result.get("queryPlanner", {})
+        return {
+            "winning_plan": planner.get("winningPlan"),
+            "rejected_plans": len(planner.get("rejectedPlans", [])),
+            "stages": _plan_stages(planner.get("winningPlan")),
+        }
+
+def _plan_stages(plan) -> list:
+    # Flatten the winning plan into e.g. ["LIMIT", "FETCH", "IXSCAN"] so a
+    # COLLSCAN or in-memory SORT stands out in the admin view.
+    stages = []
+    while isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0] or plan.get("queryPlan")
+    return stages
+
+async def ensure_log_collection(db, name: str = "slow_ops", size_mb: int = 16) -> None:
+    if name not in await db.list_collection_names():
+        try:
+            await db.create_collection(name, capped=True, size=size_mb * 1024 * 1024)
+        except CollectionInvalid:
+            # Another worker created it first.
+            pass
+    await db[name].create_index([("duration_ms", -1)])
@@ -0,0 +1,322 @@
+import argparse
+import asyncio
+import contextvars
+import os
+import re
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Serving several campuses from one deployment. TENANCY_MODE picks how their
+# data is kept apart:
+#
+#   off       one campus, collections and indexes as before (the default)
+#   field     shared collections; every document carries tenant_id, every
+#             query is filtered on it and every index is led by it
+#   database  one database per campus, named <DB_NAME>_<tenant>
+#
+# TENANTS lists the campus ids. Each request is bound to one of them by
+# TENANT_RESOLUTION:
+#
+#   host      the Host header, looked up in TENANT_HOSTS
+#             ("chat.north.edu=north,chat.south.edu=south"), else its first
+#             label (north.chat.example.edu) if that is a known campus
+#   path      a leading /<tenant> segment (/north/api/faqs), stripped before
+#             routing
+#
+# The app reads and writes through scoped_database(), which applies the
+# campus bound to the current request (or to a bind_tenant() block in
+# background work) on every call. Operational collections (cache_versions,
+# slow_ops, migrations, job_leases) stay in DB_NAME and are shared.
+# Migrations and the seed scripts act on DB_NAME; in database mode run them
+# once per campus with DB_NAME=<DB_NAME>_<tenant>, and in field mode tag what
+# they wrote with `python tenancy.py adopt <tenant>` (see the bottom of this
+# file).
+
+TENANCY_MODES = ("off", "field", "database")
+TENANT_RESOLUTIONS = ("host", "path")
+DEFAULT_TENANT = "default"
+TENANT_FIELD = "tenant_id"
+# Invalidation target for changes that cannot be attributed to one campus.
+ALL_TENANTS = "*"
+# Campus data, scoped per tenant. Everything else stays shared.
+TENANT_COLLECTIONS = (
+    "faqs", "departments", "faculty", "events", "locations", "users", "sessions",
+    "chat_history", "chat_history_buckets", "chat_history_archive", "conversations", "faq_signatures",
+    "rate_limits", "gemini_usage", "precomputed_answers",
+)
+
+_TENANT_ID = re.compile(r"^[a-z0-9][a-z0-9_-]{0,31}$")
+
+tenant_context = contextvars.ContextVar("tenant_context", default=None)
+
+def current_tenant() -> str:
+    return tenant_context.get() or DEFAULT_TENANT
+
+@contextmanager
+def bind_tenant(tenant: str):
+    token = tenant_context.set(tenant)
+    try:
+        yield
+    finally:
+        tenant_context.reset(token)
+
+def _bound_tenant() -> str:
+    tenant = tenant_context.get()
+    if tenant is None:
+        raise RuntimeError("No campus is bound to this request")
+    return tenant
+
+class TenantConfig:
+    def __init__(self, mode: str = "off", tenants=(), resolution: str = "host",
+                 hosts: Optional[Dict[str, str]] = None, db_name: str = "campus_chatbot"):
+        if mode not in TENANCY_MODES:
+            raise ValueError(f"TENANCY_MODE must be one of {', '.join(TENANCY_MODES)}")
+        if resolution not in TENANT_RESOLUTIONS:
+            raise ValueError(f"TENANT_RESOLUTION must be one of {', '.join(TENANT_RESOLUTIONS)}")
+        self.mode = mode
+        self.tenants = tuple(tenants)
+        self.resolution = resolution
+        self.hosts = {host.lower(): tenant for host, tenant in (hosts or {}).items()}
+        self.db_name = db_name
+        if self.enabled and not self.tenants:
+            raise ValueError("TENANTS must list the campus ids when TENANCY_MODE is not off")
+        for tenant in self.tenants + tuple(self.hosts.values()):
+            if not _TENANT_ID.match(tenant) or tenant not in self.tenants:
+                raise ValueError(f"Bad or unlisted campus id {tenant!r}")
+
+    @classmethod
+    def from_env(cls, environ=os.environ) -> "TenantConfig":
+        hosts = {}
+        for item in filter(None, (part.strip() for part in environ.get("TENANT_HOSTS", "").split(","))):
+            host, _, tenant = item.partition("=")
+            hosts[host.strip()] = tenant.strip()
+        return cls(
+            mode=environ.get("TENANCY_MODE", "off"),
+            tenants=[t.strip() for t in environ.get("TENANTS", "").split(",") if t.strip()],
+            resolution=environ.get("TENANT_RESOLUTION", "host"),
+            hosts=hosts,
+            db_name=environ.get("DB_NAME", "campus_chatbot"),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def database_name(self, tenant: str) -> str:
+        return f"{self.db_name}_{tenant}" if self.mode == "database" else self.db_name
+
+    def tenant_for_database(self, name: str) -> Optional[str]:
+        prefix = f"{self.db_name}_"
+        tenant = name[len(prefix):] if name.startswith(prefix) else None
+        return tenant if tenant in self.tenants else None
+
+    def resolve(self, host: str, path: str) -> Tuple[Optional[str], str, str]:
+        # -> (tenant, path to route, stripped prefix)
+        if self.resolution == "path":
+            first, _, rest = path[1:].partition("/")
+            if first in self.tenants:
+                return first, "/" + rest, "/" + first
+            return None, path, ""
+        host = (host or "").split(":")[0].lower()
+        tenant = self.hosts.get(host)
+        if tenant is None and host.split(".")[0] in self.tenants:
+            tenant = host.split(".")[0]
+        return tenant, path, ""
+
+# ---------------------------------------------------------------------------
+# Scoped database handles
+# ---------------------------------------------------------------------------
+
+def _scope(filter: Optional[dict]) -> dict:
+    return {**(filter or {}), TENANT_FIELD: _bound_tenant()}
+
+def _hide(projection):
+    # Keeps tenant_id out of find results unless specific fields were asked for.
+    if projection is None:
+        return {TENANT_FIELD: 0}
+    if isinstance(projection, dict) and not any(v for k, v in projection.items() if k != "_id"):
+        return {**projection, TENANT_FIELD: 0}
+    return projection
+
+class FieldScopedCollection:
+    # The subset of the Motor collection API the app uses, with tenant_id
+    # added to every filter, document and index. Anything else (bulk_write,
+    # watch, drop, ...) must go through .unscoped deliberately.
+    def __init__(self, collection):
+        self.unscoped = collection
+
+    @property
+    def name(self) -> str:
+        return self.unscoped.name
+
+    def __getattr__(self, attr):
+        raise AttributeError(f"{attr} is not tenant-scoped; use .unscoped.{attr} explicitly")
+
+    def find(self, filter=None, projection=None, *args, **kwargs):
+        return self.unscoped.find(_scope(filter), _hide(projection), *args, **kwargs)
+
+    async def find_one(self, filter=None, projection=None, *args, **kwargs):
+        return await self.unscoped.find_one(_scope(filter), _hide(projection), *args, **kwargs)
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        return self.unscoped.aggregate([{"$match": _scope(None)}, *pipeline], *args, **kwargs)
+
+    async def count_documents(self, filter, *args, **kwargs):
+        return await self.unscoped.count_documents(_scope(filter), *args, **kwargs)
+
+    async def distinct(self, key, filter=None, *args, **kwargs):
+        return await self.unscoped.distinct(key, _scope(filter), *args, **kwargs)
+
+    async def insert_one(self, document, *args, **kwargs):
+        return await self.unscoped.insert_one({**document, TENANT_FIELD: _bound_tenant()}, *args, **kwargs)
+
+    async def insert_many(self, documents, *args, **kwargs):
+        tenant = _bound_tenant()
+        return await self.unscoped.insert_many([{**d, TENANT_FIELD: tenant} for d in documents], *args, **kwargs)
+
+    # Upserts pick tenant_id up from the equality in the scoped filter.
+    async def update_one(self, filter, update, *args, **kwargs):
+        return await self.unscoped.update_one(_scope(filter), update, *args, **kwargs)
+
+    async def update_many(self, filter, update, *args, **kwargs):
+        return await self.unscoped.update_many(_scope(filter), update, *args, **kwargs)
+
+    async def replace_one(self, filter, replacement, *args, **kwargs):
+        scoped = _scope(filter)
+        return await self.unscoped.replace_one(scoped, {**replacement, TENANT_FIELD: scoped[TENANT_FIELD]},
+                                               *args, **kwargs)
+
+    async def find_one_and_update(self, filter, update, *args, **kwargs):
+        return await self.unscoped.find_one_and_update(_scope(filter), update, *args, **kwargs)
+
+    async def find_one_and_delete(self, filter, *args, **kwargs):
+        return await self.unscoped.find_one_and_delete(_scope(filter), *args, **kwargs)
+
+    async def delete_one(self, filter, *args, **kwargs):
+        return await self.unscoped.delete_one(_scope(filter), *args, **kwargs)
+
+    async def delete_many(self, filter, *args, **kwargs):
+        return await self.unscoped.delete_many(_scope(filter), *args, **kwargs)
+
+    async def create_index(self, keys, **kwargs):
+        # Led by tenant_id so every scoped query can use it, and unique
+        # indexes become unique per campus. TTL indexes must stay single-field.
+        if "expireAfterSeconds" not in kwargs:
+            keys = [(TENANT_FIELD, 1)] + ([(keys, 1)] if isinstance(keys, str) else list(keys))
+        return await self.unscoped.create_index(keys, **kwargs)
+
+class FieldScopedDatabase:
+    def __init__(self, db):
+        self.unscoped = db
+        self._collections: Dict[str, FieldScopedCollection] = {}
+
+    def __getitem__(self, name: str) -> FieldScopedCollection:
+        if name not in self._collections:
+            self._collections[name] = FieldScopedCollection(self.unscoped[name])
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> FieldScopedCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+class PerTenantCollection:
+    # Resolves to the bound campus's database on every attribute access, so
+    # the same handle can be kept in module-level stores.
+    def __init__(self, database: "PerTenantDatabase", name: str):
+        self._database = database
+        self.name = name
+
+    @property
+    def unscoped(self):
+        return self._database.unscoped[self.name]
+
+    def __getattr__(self, attr):
+        return getattr(self._database.for_tenant(_bound_tenant())[self.name], attr)
+
+class PerTenantDatabase:
+    def __init__(self, db, config: TenantConfig):
+        self.unscoped = db
+        self.config = config
+        self._databases = {}
+        self._collections: Dict[str, PerTenantCollection] = {}
+
+    def for_tenant(self, tenant: str):
+        # Same client and read preference as the DB_NAME handle.
+        if tenant not in self._databases:
+            self._databases[tenant] = self.unscoped.client.get_database(
+                self.config.database_name(tenant), read_preference=self.unscoped.read_preference)
+        return self._databases[tenant]
+
+    def __getitem__(self, name: str) -> PerTenantCollection:
+        if name not in self._collections:
+            self._collections[name] = PerTenantCollection(self, name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> PerTenantCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+def scoped_database(db, config: TenantConfig):
+    if config.mode == "field":
+        return FieldScopedDatabase(db)
+    if config.mode == "database":
+        return PerTenantDatabase(db, config)
+    return db
+
+def unscoped(db):
+    # The shared DB_NAME handle behind a scoped one.
+    return getattr(db, "unscoped", db)
+
+# ---------------------------------------------------------------------------
+# Adopting existing data
+# ---------------------------------------------------------------------------
+#
+#   python tenancy.py adopt <tenant> [--mode field|database]
+#
+# Moves single-campus data in DB_NAME under <tenant>. field: documents
+# without tenant_id are tagged in place. database: each campus collection is
+# copied into <DB_NAME>_<tenant> with $out (DB_NAME is left untouched). Start
+# the app afterwards so it builds the campus indexes.
+
+async def adopt(db, config: TenantConfig, tenant: str) -> None:
+    for name in TENANT_COLLECTIONS:
+        if config.mode == "field":
+            result = await db[name].update_many({TENANT_FIELD: {"$exists": False}}, {"$set": {TENANT_FIELD: tenant}})
+            print(f"✓ {name}: tagged {result.modified_count} documents")
+        else:
+            target = config.database_name(tenant)
+            await db[name].aggregate([{"$out": {"db": target, "coll": name}}]).to_list(None)
+            print(f"✓ {name}: copied {await db.client[target][name].count_documents({}):,} documents to {target}")
+
+async def main(args) -> None:
+    from mongo_client import create_client
+
+    config = TenantConfig.from_env()
+    config = TenantConfig(args.mode or config.mode, config.tenants, config.resolution, config.hosts, config.db_name)
+    if not config.enabled:
+        raise SystemExit("Set TENANCY_MODE (or --mode) to field or database")
+    if args.tenant not in config.tenants:
+        raise SystemExit(f"{args.tenant!r} is not listed in TENANTS")
+    client = create_client()
+    try:
+        await adopt(client[config.db_name], config, args.tenant)
+    finally:
+        client.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Move single-campus data under one tenant.")
+    parser.add_argument("command", choices=["adopt"])
+    parser.add_argument("tenant")
+    parser.add_argument("--mode", choices=["field", "database"])
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
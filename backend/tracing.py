@@ -0,0 +1,362 @@
+import asyncio
+import contextvars
+import functools
+import heapq
+import json
+import logging
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Per-request tracing. Every HTTP request and every WebSocket question gets a
+# trace; spans cover auth, each Mongo command (via a driver listener, like
+# slow_ops.py), context building, the Gemini call and the chat_history write.
+# Spans nest through a context variable, and Motor runs driver calls with a
+# copy of the caller's context, so Mongo spans land under the span that
+# issued them.
+#
+# Recording is cheap and always on (TRACE_ENABLED=false turns it off); what
+# gets exported is decided when the trace ends:
+#
+#   TRACE_SAMPLE_RATE  fraction of traces exported (default 0.01); an
+#                      incoming W3C traceparent header's sampled flag wins
+#   TRACE_SLOW_MS      traces at least this slow are always exported
+#   TRACE_EXPORTER     none (default), console (one log line per trace),
+#                      file (JSON lines in TRACE_FILE) or otlp (OTLP/HTTP
+#                      JSON to OTEL_EXPORTER_OTLP_ENDPOINT, e.g.
+#                      http://collector:4318)
+#
+# Each worker also keeps its slowest recent traces, exported or not, for
+# /api/admin/traces. Responses carry X-Trace-ID next to X-Request-ID.
+
+TRACE_EXPORTERS = ("none", "console", "file", "otlp")
+# Spans kept per trace; the rest are counted in `dropped_spans`.
+MAX_SPANS_PER_TRACE = 500
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("current_trace", default=None)
+current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+def _new_id(hex_chars: int) -> str:
+    return "%0*x" % (hex_chars, random.getrandbits(hex_chars * 4))
+
+class Span:
+    __slots__ = ("span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: Optional[dict] = None,
+                 start_ns: Optional[int] = None):
+        self.span_id = _new_id(16)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 2),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+class Trace:
+    __slots__ = ("trace_id", "request_id", "sampled", "root", "spans", "dropped_spans")
+
+    def __init__(self, trace_id: str, request_id: str, sampled: bool, root: Span):
+        self.trace_id = trace_id
+        self.request_id = request_id
+        self.sampled = sampled
+        self.root = root
+        self.spans: List[Span] = [root]
+        self.dropped_spans = 0
+
+    def add(self, span: Span) -> None:
+        # Also called from Motor's executor threads; list.append is atomic.
+        if len(self.spans) < MAX_SPANS_PER_TRACE:
+            self.spans.append(span)
+        else:
+            self.dropped_spans += 1
+
+    def summary(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "request_id": self.request_id,
+            "name": self.root.name,
+            "start_ns": self.root.start_ns,
+            "duration_ms": round(self.root.duration_ms, 2),
+            "spans": len(self.spans),
+            "error": self.root.error,
+            **{k: v for k, v in self.root.attributes.items() if k in ("tenant", "http.status_code")},
+        }
+
+    def to_dict(self) -> dict:
+        return {**self.summary(), "dropped_spans": self.dropped_spans,
+                "span_tree": [s.to_dict() for s in sorted(self.spans, key=lambda s: s.start_ns)]}
+
+class Tracer:
+    def __init__(self, enabled: bool = True, sample_rate: float = 0.01, slow_ms: float = 2000.0,
+                 exporter=None, keep: int = 100, keep_seconds: float = 3600.0, max_pending: int = 1000):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.exporter = exporter
+        self.keep = keep
+        self.keep_seconds = keep_seconds
+        self.max_pending = max_pending
+        # Min-heap of (duration_ms, seq, finished_at, trace): the slowest
+        # `keep` traces, oldest dropped after keep_seconds.
+        self._slowest = []
+        self._seq = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self.exported = 0
+        self.dropped = 0
+
+    @contextmanager
+    def trace(self, name: str, request_id: str, traceparent: Optional[str] = None, **attributes):
+        if not self.enabled:
+            yield None
+            return
+        match = _TRACEPARENT.match(traceparent or "")
+        if match:
+            trace_id, parent_id, sampled = match.group(1), match.group(2), match.group(3) == "01"
+        else:
+            trace_id, parent_id, sampled = _new_id(32), None, random.random() < self.sample_rate
+        attributes = {k: v for k, v in attributes.items() if v is not None}
+        trace = Trace(trace_id, request_id, sampled, Span(name, parent_id, dict(attributes, request_id=request_id)))
+        trace_token, span_token = current_trace.set(trace), current_span.set(trace.root)
+        try:
+            yield trace
+        except BaseException as exc:
+            trace.root.error = repr(exc)
+            raise
+        finally:
+            current_span.reset(span_token)
+            current_trace.reset(trace_token)
+            trace.root.end_ns = time.time_ns()
+            self._finish(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        trace = current_trace.get()
+        if trace is None:
+            yield None
+            return
+        parent = current_span.get()
+        span = Span(name, parent.span_id if parent else None, attributes)
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.error = repr(exc)
+            raise
+        finally:
+            current_span.reset(token)
+            span.end_ns = time.time_ns()
+            trace.add(span)
+
+    def traced(self, name: str):
+        # Decorator form of span() for coroutine functions.
+        def decorate(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return await fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def _finish(self, trace: Trace) -> None:
+        duration = trace.root.duration_ms
+        now = time.monotonic()
+        if len(self._slowest) >= self.keep:
+            # Old entries must not hold slots that newer slow traces need.
+            self._slowest = [e for e in self._slowest if now - e[2] < self.keep_seconds]
+            heapq.heapify(self._slowest)
+        self._seq += 1
+        entry = (duration, self._seq, now, trace)
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, entry)
+        elif duration > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+        if self.exporter and self._queue is not None and (trace.sampled or duration >= self.slow_ms):
+            try:
+                self._queue.put_nowait(trace)
+            except asyncio.QueueFull:
+                self.dropped += 1
+
+    def slowest(self, limit: int = 20, tenant: Optional[str] = None) -> List[Trace]:
+        now = time.monotonic()
+        traces = [e[3] for e in sorted(self._slowest, reverse=True) if now - e[2] < self.keep_seconds]
+        if tenant is not None:
+            traces = [t for t in traces if t.root.attributes.get("tenant") == tenant]
+        return traces[:limit]
+
+    def find(self, trace_id: str) -> Optional[Trace]:
+        return next((e[3] for e in self._slowest if e[3].trace_id == trace_id), None)
+
+    async def run(self, batch_size: int = 100, flush_seconds: float = 5.0) -> None:
+        # Started once per worker at startup; exports in batches.
+        if not self.exporter:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + flush_seconds
+            while len(batch) < batch_size and (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self.exporter.export(batch)
+                self.exported += len(batch)
+            except Exception:
+                logger.exception("Failed to export %s traces", len(batch))
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "exporter": self.exporter.name if self.exporter else "none",
+            "sample_rate": self.sample_rate,
+            "slow_ms": self.slow_ms,
+            "exported": self.exported,
+            "dropped": self.dropped,
+        }
+
+class MongoSpanListener(monitoring.CommandListener):
+    # One span per Mongo command issued inside a trace. Runs on whichever
+    # thread the driver uses, with the issuing request's context.
+    def __init__(self):
+        self._inflight: Dict[tuple, tuple] = {}
+
+    def started(self, event):
+        trace = current_trace.get()
+        if trace is None:
+            return
+        parent = current_span.get()
+        span = Span(f"mongo.{event.command_name}", parent.span_id if parent else None, {
+            "db.system": "mongodb",
+            "db.name": event.database_name,
+            "db.operation": event.command_name,
+            "db.mongodb.collection": event.command.get(event.command_name),
+        })
+        self._inflight[(event.request_id, event.connection_id)] = (trace, span)
+
+    def succeeded(self, event):
+        self._finish(event, None)
+
+    def failed(self, event):
+        self._finish(event, getattr(event, "failure", None) or "failed")
+
+    def _finish(self, event, error):
+        started = self._inflight.pop((event.request_id, event.connection_id), None)
+        if started is None:
+            return
+        trace, span = started
+        span.end_ns = span.start_ns + event.duration_micros * 1000
+        if error:
+            span.error = str(error)
+        trace.add(span)
+
+# ---------------------------------------------------------------------------
+# Exporters
+# ---------------------------------------------------------------------------
+
+class ConsoleExporter:
+    name = "console"
+
+    async def export(self, traces: List[Trace]) -> None:
+        for trace in traces:
+            logger.info("trace %s", json.dumps(trace.to_dict(), default=str))
+
+class FileExporter:
+    name = "file"
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    async def export(self, traces: List[Trace]) -> None:
+        lines = "".join(json.dumps(t.to_dict(), default=str) + "\n" for t in traces)
+        await asyncio.to_thread(self._append, lines)
+
+    def _append(self, lines: str) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(lines)
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+class OTLPExporter:
+    # OTLP/HTTP with the JSON encoding, so no collector SDK is needed.
+    name = "otlp"
+
+    def __init__(self, endpoint: str, service_name: str, headers: Optional[dict] = None):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.client = httpx.AsyncClient(timeout=10.0, headers=headers)
+
+    def _span(self, trace: Trace, span: Span) -> dict:
+        out = {
+            "traceId": trace.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            # Root spans are server spans, Mongo and Gemini calls client spans.
+            "kind": 2 if span is trace.root else (3 if span.name.startswith(("mongo.", "gemini.")) else 1),
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns or span.start_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items() if v is not None],
+            "status": {"code": 2, "message": span.error} if span.error else {},
+        }
+        if span.parent_id:
+            out["parentSpanId"] = span.parent_id
+        return out
+
+    async def export(self, traces: List[Trace]) -> None:
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{
+                "scope": {"name": "campus-assistant"},
+                "spans": [self._span(t, s) for t in traces for s in t.spans],
+            }],
+        }]}
+        resp = await self.client.post(self.url, json=body)
+        resp.raise_for_status()
+
+def make_exporter(name: str, environ=os.environ):
+    if name not in TRACE_EXPORTERS:
+        raise ValueError(f"TRACE_EXPORTER must be one of {', '.join(TRACE_EXPORTERS)}")
+    if name == "console":
+        return ConsoleExporter()
+    if name == "file":
+        return FileExporter(Path(environ.get("TRACE_FILE", "traces.jsonl")))
+    if name == "otlp":
+        # OTEL_EXPORTER_OTLP_HEADERS: "key=value,key2=value2", e.g. an API key.
+        headers = dict(pair.split("=", 1) for pair in environ.get("OTEL_EXPORTER_OTLP_HEADERS", "").split(",") if "=" in pair)
+        return OTLPExporter(environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318"),
+                            environ.get("OTEL_SERVICE_NAME", "campus-assistant"), headers)
+    return None
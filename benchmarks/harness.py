@@ -0,0 +1,157 @@
+import asyncio
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+# Shared setup for the offline benchmarks: a fake Gemini endpoint with
+# configurable latency, the FastAPI app wired to a local Mongo (or an
+# in-memory stand-in), seeded data and ready-made admin/student sessions.
+
+def make_fake_gemini(latency_ms: float = 800.0, jitter_ms: float = 200.0) -> FastAPI:
+    fake = FastAPI()
+    rng = random.Random(0)
+
+    @fake.post("/v1beta/models/{model}:generateContent")
+    async def generate(model: str, request: Request):
+        body = await request.json()
+        prompt = body["contents"][0]["parts"][0]["text"]
+        await asyncio.sleep(max(0.0, latency_ms + rng.uniform(-jitter_ms, jitter_ms)) / 1000)
+        prompt_tokens = len(prompt) // 4
+        return {
+            "candidates": [{"content": {"parts": [{"text": f"Synthetic answer ({model})."}], "role": "model"}}],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": 8,
+                "totalTokenCount": prompt_tokens + 8,
+            },
+        }
+
+    @fake.get("/v1beta/models/{model}")
+    async def model_info(model: str):
+        # Hit once by the app's warm-up to open a connection.
+        return {"name": f"models/{model}"}
+
+    return fake
+
+async def start_fake_gemini(latency_ms: float, jitter_ms: float):
+    # Runs on the benchmark's own loop; returns (base_url, server).
+    config = uvicorn.Config(make_fake_gemini(latency_ms, jitter_ms), host="127.0.0.1", port=0,
+                            log_level="warning", lifespan="off")
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    server.task = task
+    return f"http://127.0.0.1:{port}", server
+
+async def stop_fake_gemini(server) -> None:
+    server.should_exit = True
+    await server.task
+
+def app_env(mongo_url=None, db_name="campus_chatbot_bench", gemini_url=None) -> dict:
+    # The environment load_app() imports the server with. Tests apply it with
+    # monkeypatch.setenv first so it is undone afterwards.
+    env = {
+        "MONGO_URL": mongo_url or "mongodb://127.0.0.1:27017",
+        "DB_NAME": db_name,
+        "GEMINI_API_KEY": "benchmark",
+        # All simulated clients share one address and a couple of sessions, so
+        # the per-identity chat limits would otherwise dominate the measurements.
+        "CHAT_RATE_LIMIT_USER": os.environ.get("CHAT_RATE_LIMIT_USER", "1000000/1"),
+        "CHAT_RATE_LIMIT_ANON": os.environ.get("CHAT_RATE_LIMIT_ANON", "1000000/1"),
+        "GEMINI_MAX_QUEUED_PER_USER": os.environ.get("GEMINI_MAX_QUEUED_PER_USER", "100000"),
+    }
+    if gemini_url:
+        env["GEMINI_BASE_URL"] = gemini_url
+    if not mongo_url:
+        # mongomock has no capped collections, command monitoring or
+        # change streams.
+        env["SLOW_OP_LOG_ENABLED"] = "false"
+        env["CACHE_SYNC_MODE"] = "poll"
+    return env
+
+def load_app(mongo_url=None, db_name="campus_chatbot_bench", gemini_url=None):
+    # Imports backend/server.py with the benchmark's environment. Without a
+    # mongo_url the app runs against mongomock-motor (pip install -r
+    # backend/requirements-dev.txt), which is fine for comparing app overhead
+    # but not for judging Mongo-side behaviour.
+    os.environ.update(app_env(mongo_url, db_name, gemini_url))
+    import server
+
+    if not mongo_url:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("No --mongo-url given and mongomock-motor is not installed")
+        server.client = AsyncMongoMockClient()
+        server.shared_db = server.db = server.client[db_name]
+        server.reference_db = server.analytics_db = server.db
+        server.conversations.collection = server.db.conversations
+        server.faq_duplicates.collection = server.db.faq_signatures
+        server.chat_history.collection = server.db[server.chat_history.collection.name]
+        server.analytics_history.collection = server.chat_history.collection
+        server.cache_sync.db = server.db
+        server.gemini_usage.collection = server.db.gemini_usage
+        server.retention.leases = server.db.job_leases
+        server.precomputed_answers.collection = server.db.precomputed_answers
+        server.precomputed_answers.history = server.chat_history
+        server.precomputed_answers.leases = server.db.job_leases
+        if hasattr(server.retention.archive, "collection"):
+            server.retention.archive.collection = server.db.chat_history_archive
+    return server
+
+async def seed(db, sizes: dict, seed: int = 42) -> None:
+    import generate_data
+
+    generators = {
+        "faqs": generate_data.gen_faqs,
+        "departments": generate_data.gen_departments,
+        "faculty": generate_data.gen_faculty,
+        "events": generate_data.gen_events,
+        "locations": generate_data.gen_locations,
+    }
+    for name, gen in generators.items():
+        await db[name].delete_many({})
+        count = sizes.get(name, 0)
+        if count:
+            rng = random.Random(f"{seed}:{name}")
+            for batch in generate_data.batched(gen(rng, seed, count), 1000):
+                await db[name].insert_many(batch)
+
+async def create_session(db, is_admin: bool) -> str:
+    user_id = str(uuid.uuid4())
+    token = str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
+    await db.users.insert_one({
+        "id": user_id,
+        "email": f"bench-{user_id}@example.edu",
+        "name": "Bench Admin" if is_admin else "Bench Student",
+        "picture": "",
+        "is_admin": is_admin,
+        "created_at": now.isoformat(),
+    })
+    await db.sessions.insert_one({
+        "session_token": token,
+        "user_id": user_id,
+        "expires_at": (now + timedelta(days=1)).isoformat(),
+        "created_at": now.isoformat(),
+    })
+    return token
+
+def app_client(app) -> httpx.AsyncClient:
+    # In-process ASGI transport: measures the app, not the network stack.
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120.0)
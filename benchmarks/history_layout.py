@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import harness  # noqa: F401  (puts backend/ on sys.path)
+from chat_store import BucketedChatHistory, FlatChatHistory, bucket_docs
+from generate_data import batched, gen_chat_history
+from intent_router import percentile
+from mongo_client import create_client
+
+# Flat vs bucketed chat_history at millions of messages: document count, data
+# and index sizes from collStats, plus per-user read latency for the heaviest
+# users (first page, and a `before` page from the middle of their history).
+# Needs a real MongoDB; both layouts are loaded from the same generated
+# stream into a scratch database that is dropped afterwards.
+
+async def load_flat(store, records, batch_size):
+    for batch in batched(records, batch_size):
+        await store.collection.insert_many(batch, ordered=False)
+
+async def load_bucketed(store, records, batch_size):
+    # The generated stream is in timestamp order, so a day's buckets can be
+    # built and written as soon as the next day starts.
+    day, pending = None, []
+    async def flush():
+        for batch in batched(bucket_docs(pending, store.max_turns), batch_size):
+            await store.collection.insert_many(batch, ordered=False)
+
+    for record in records:
+        if record["timestamp"][:10] != day and pending:
+            await flush()
+            pending = []
+        day = record["timestamp"][:10]
+        pending.append(record)
+    if pending:
+        await flush()
+
+async def collection_stats(db, store) -> dict:
+    stats = await db.command("collStats", store.collection.name)
+    return {
+        "documents": stats["count"],
+        "data_mb": round(stats["size"] / 1024 / 1024, 1),
+        "avg_doc_bytes": stats.get("avgObjSize", 0),
+        "storage_mb": round(stats["storageSize"] / 1024 / 1024, 1),
+        "index_mb": round(stats["totalIndexSize"] / 1024 / 1024, 1),
+        "indexes_mb": {name: round(size / 1024 / 1024, 2) for name, size in stats["indexSizes"].items()},
+    }
+
+async def timed_reads(store, users, mid_points, page_size) -> dict:
+    first, middle = [], []
+    for user_id in users:
+        started = time.perf_counter()
+        await store.find({"user_id": user_id}, limit=page_size).to_list(page_size)
+        first.append((time.perf_counter() - started) * 1000)
+
+        ts = mid_points[user_id]
+        started = time.perf_counter()
+        await store.find({"user_id": user_id, "timestamp": {"$lt": ts}}, limit=page_size, max_ts=ts).to_list(page_size)
+        middle.append((time.perf_counter() - started) * 1000)
+    return {
+        "first_page": {"p50_ms": percentile(first, 50), "p95_ms": percentile(first, 95)},
+        "middle_page": {"p50_ms": percentile(middle, 50), "p95_ms": percentile(middle, 95)},
+    }
+
+async def heavy_users(flat, count) -> tuple:
+    # Heaviest users by message count, and the median timestamp of each one's
+    # history (the `before` cursor for the middle-page read).
+    top = await flat.collection.aggregate([
+        {"$group": {"_id": "$user_id", "messages": {"$sum": 1}}},
+        {"$sort": {"messages": -1}},
+        {"$limit": count},
+    ], allowDiskUse=True).to_list(count)
+    mid_points = {}
+    for row in top:
+        mid = await flat.collection.find({"user_id": row["_id"]}, {"_id": 0, "timestamp": 1}) \
+            .sort("timestamp", 1).skip(row["messages"] // 2).limit(1).to_list(1)
+        mid_points[row["_id"]] = mid[0]["timestamp"]
+    return [row["_id"] for row in top], {row["_id"]: row["messages"] for row in top}, mid_points
+
+async def run(args):
+    client = create_client(args.mongo_url)
+    db = client[args.db]
+    flat = FlatChatHistory(db.chat_history)
+    bucketed = BucketedChatHistory(db.chat_history_buckets, args.max_turns)
+    try:
+        await db.chat_history.drop()
+        await db.chat_history_buckets.drop()
+
+        def records():
+            return gen_chat_history(random.Random(f"{args.seed}:chat_history"), args.seed, args.messages, args.users)
+
+        results = {"messages": args.messages, "users": args.users, "max_turns": args.max_turns}
+        for name, store, loader in (("flat", flat, load_flat), ("bucketed", bucketed, load_bucketed)):
+            print(f"Loading {args.messages:,} messages ({name})...")
+            started = time.perf_counter()
+            await loader(store, records(), args.batch_size)
+            await store.ensure_indexes()
+            results[name] = {"load_seconds": round(time.perf_counter() - started, 1)}
+
+        users, counts, mid_points = await heavy_users(flat, args.heavy_users)
+        results["heavy_users"] = {"count": len(users), "max_messages": max(counts.values()),
+                                  "min_messages": min(counts.values())}
+        for name, store in (("flat", flat), ("bucketed", bucketed)):
+            results[name]["stats"] = await collection_stats(db, store)
+            # Warm both layouts' indexes into cache before timing.
+            await timed_reads(store, users, mid_points, args.page_size)
+            results[name]["reads"] = await timed_reads(store, users, mid_points, args.page_size)
+
+        for name in ("flat", "bucketed"):
+            stats, reads = results[name]["stats"], results[name]["reads"]
+            print(f"{name:<9} docs {stats['documents']:>10,}  data {stats['data_mb']:>8.1f} MiB  "
+                  f"storage {stats['storage_mb']:>8.1f} MiB  indexes {stats['index_mb']:>7.1f} MiB  "
+                  f"first page p95 {reads['first_page']['p95_ms']:>7.2f} ms  "
+                  f"middle page p95 {reads['middle_page']['p95_ms']:>7.2f} ms")
+        if args.output:
+            with open(args.output, "w") as fh:
+                json.dump(results, fh, indent=2)
+        return results
+    finally:
+        if not args.keep:
+            await client.drop_database(args.db)
+        client.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare flat and bucketed chat_history layouts.")
+    parser.add_argument("--mongo-url", required=True, help="collStats needs a real MongoDB")
+    parser.add_argument("--db", default="campus_chatbot_bench_layout")
+    parser.add_argument("--messages", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--max-turns", type=int, default=200)
+    parser.add_argument("--heavy-users", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch database")
+    parser.add_argument("--output", help="Write results JSON here")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,207 @@
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import subprocess
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+from harness import app_client, create_session, load_app, seed, start_fake_gemini, stop_fake_gemini
+
+# Closed-loop load generator: `concurrency` workers each pick an operation by
+# weight, issue it, record the latency under its route label and repeat until
+# the duration is up. Results are written as JSON so runs can be compared.
+
+CHAT_QUESTIONS = [
+    "where is room 204", "when is the next hackathon", "who is the hod of computer science",
+    "how do I apply for financial aid", "what are the library hours", "tell me about the career fair",
+]
+
+WORKLOADS = {
+    # name: {operation: weight}
+    "mixed": {"chat_anon": 3, "chat_auth": 3, "list": 10, "history": 2, "admin_crud": 1},
+    "chat": {"chat_anon": 1, "chat_auth": 1},
+    "read": {"list": 5, "history": 1},
+    "admin": {"admin_crud": 1, "admin_list": 1},
+}
+
+LIST_ROUTES = ["/api/faqs", "/api/departments", "/api/faculty", "/api/events", "/api/locations",
+               "/api/events?upcoming=true&limit=10"]
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, route: str, started: float, response=None, error: Exception = None):
+        self.latencies[route].append((time.perf_counter() - started) * 1000)
+        if error is not None or response is None or response.status_code >= 400:
+            self.errors[route] += 1
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))], 2)
+
+async def timed(rec, route, coro):
+    started = time.perf_counter()
+    try:
+        response = await coro
+    except Exception as exc:
+        rec.record(route, started, error=exc)
+        return None
+    rec.record(route, started, response)
+    return response
+
+async def op_chat_anon(client, rng, rec, ctx):
+    await timed(rec, "POST /api/chat/query (anon)",
+                client.post("/api/chat/query", json={"query": rng.choice(CHAT_QUESTIONS)}))
+
+async def op_chat_auth(client, rng, rec, ctx):
+    await timed(rec, "POST /api/chat/query (auth)",
+                client.post("/api/chat/query", json={"query": rng.choice(CHAT_QUESTIONS)}, headers=ctx["student"]))
+
+async def op_list(client, rng, rec, ctx):
+    route = rng.choice(LIST_ROUTES)
+    await timed(rec, f"GET {route}", client.get(route))
+
+async def op_history(client, rng, rec, ctx):
+    await timed(rec, "GET /api/chat/history", client.get("/api/chat/history", headers=ctx["student"]))
+
+async def op_admin_list(client, rng, rec, ctx):
+    await timed(rec, "GET /api/admin/all-queries", client.get("/api/admin/all-queries", headers=ctx["admin"]))
+
+async def op_admin_crud(client, rng, rec, ctx):
+    body = {"question": f"Bench question {rng.random()}?", "answer": "Bench answer.", "category": "Bench", "tags": []}
+    created = await timed(rec, "POST /api/faqs", client.post("/api/faqs", json=body, headers=ctx["admin"]))
+    if created is None or created.status_code != 200:
+        return
+    faq_id = created.json()["id"]
+    await timed(rec, "PUT /api/faqs/{id}",
+                client.put(f"/api/faqs/{faq_id}", json={"answer": "Updated bench answer."}, headers=ctx["admin"]))
+    await timed(rec, "DELETE /api/faqs/{id}", client.delete(f"/api/faqs/{faq_id}", headers=ctx["admin"]))
+
+OPERATIONS = {
+    "chat_anon": op_chat_anon,
+    "chat_auth": op_chat_auth,
+    "list": op_list,
+    "history": op_history,
+    "admin_list": op_admin_list,
+    "admin_crud": op_admin_crud,
+}
+
+async def worker(worker_id, client, weights, deadline, rec, ctx, seed):
+    rng = random.Random(f"{seed}:{worker_id}")
+    names, w = zip(*weights.items())
+    while time.perf_counter() < deadline:
+        await OPERATIONS[rng.choices(names, w)[0]](client, rng, rec, ctx)
+
+def summarize(rec, elapsed):
+    routes = {}
+    for route, values in sorted(rec.latencies.items()):
+        routes[route] = {
+            "count": len(values),
+            "errors": rec.errors.get(route, 0),
+            "rps": round(len(values) / elapsed, 2),
+            "p50_ms": percentile(values, 50),
+            "p95_ms": percentile(values, 95),
+            "p99_ms": percentile(values, 99),
+            "max_ms": round(max(values), 2),
+        }
+    total = sum(r["count"] for r in routes.values())
+    return {
+        "total_requests": total,
+        "total_errors": sum(r["errors"] for r in routes.values()),
+        "throughput_rps": round(total / elapsed, 2),
+        "routes": routes,
+    }
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+def print_report(summary, baseline=None):
+    print(f"\nThroughput: {summary['throughput_rps']} req/s, "
+          f"{summary['total_requests']} requests, {summary['total_errors']} errors")
+    header = f"{'route':<45} {'count':>7} {'err':>5} {'p50':>9} {'p95':>9} {'p99':>9}"
+    print(header)
+    print("-" * len(header))
+    base_routes = (baseline or {}).get("routes", {})
+    for route, r in summary["routes"].items():
+        line = f"{route:<45} {r['count']:>7} {r['errors']:>5} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9}"
+        prev = base_routes.get(route)
+        if prev and prev.get("p95_ms"):
+            change = (r["p95_ms"] - prev["p95_ms"]) / prev["p95_ms"] * 100
+            line += f"  p95 {change:+.1f}%"
+        print(line)
+
+async def run(args):
+    gemini_url, gemini = await start_fake_gemini(args.gemini_latency_ms, args.gemini_jitter_ms)
+    server = load_app(args.mongo_url, args.db, gemini_url)
+    await seed(server.db, {"faqs": args.faqs, "departments": 20, "faculty": args.faculty,
+                           "events": args.events, "locations": args.locations}, args.seed)
+    ctx = {
+        "admin": {"Authorization": f"Bearer {await create_session(server.db, True)}"},
+        "student": {"Authorization": f"Bearer {await create_session(server.db, False)}"},
+    }
+
+    await server.app.router.startup()
+    await server.wait_until_ready()
+    rec = Recorder()
+    try:
+        async with app_client(server.app) as client:
+            print(f"Running '{args.workload}' for {args.duration}s at concurrency {args.concurrency}...")
+            started = time.perf_counter()
+            deadline = started + args.duration
+            await asyncio.gather(*(
+                worker(i, client, WORKLOADS[args.workload], deadline, rec, ctx, args.seed)
+                for i in range(args.concurrency)
+            ))
+            elapsed = time.perf_counter() - started
+    finally:
+        await server.app.router.shutdown()
+        await stop_fake_gemini(gemini)
+
+    summary = summarize(rec, elapsed)
+    result = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        **summary,
+    }
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(summary, baseline)
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+        print(f"\nSaved results to {args.output}")
+    return result
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for the CampusBot API.")
+    parser.add_argument("--workload", choices=sorted(WORKLOADS), default="mixed")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+    parser.add_argument("--gemini-latency-ms", type=float, default=800.0)
+    parser.add_argument("--gemini-jitter-ms", type=float, default=200.0)
+    parser.add_argument("--mongo-url", help="Real Mongo to use; defaults to in-memory mongomock-motor")
+    parser.add_argument("--db", default="campus_chatbot_bench")
+    parser.add_argument("--faqs", type=int, default=200)
+    parser.add_argument("--faculty", type=int, default=100)
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--locations", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--compare", help="Previous results JSON to diff p95 against")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
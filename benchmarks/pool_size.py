@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+
+from harness import create_session, seed
+from chat_store import FlatChatHistory
+from generate_data import batched, gen_chat_history
+from intent_router import percentile
+from mongo_client import create_client
+
+# Throughput and latency of an app-like Mongo mix (session + user lookup,
+# reference list, history page, chat insert) at a fixed client concurrency for
+# several maxPoolSize values. Each pool size gets its own client built by the
+# app's factory; wait-queue timeouts and connections opened are reported.
+# Needs a real MongoDB.
+
+OPERATIONS = {"auth": 5, "reference": 3, "history": 2, "insert": 1}
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self.created = 0
+        self.checkout_failures = 0
+
+    def connection_created(self, event):
+        self.created += 1
+
+    def connection_check_out_failed(self, event):
+        self.checkout_failures += 1
+
+    # Remaining pool events are not needed here.
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): pass
+    def connection_check_out_started(self, event): pass
+    def connection_checked_out(self, event): pass
+    def connection_checked_in(self, event): pass
+
+async def prepare(db, args) -> dict:
+    await seed(db, {"faqs": 200, "departments": 20, "faculty": 100, "events": 100, "locations": 50}, args.seed)
+    await db.chat_history.drop()
+    history = FlatChatHistory(db.chat_history)
+    for batch in batched(gen_chat_history(random.Random(args.seed), args.seed, args.history, 200), 1000):
+        await db.chat_history.insert_many(batch)
+    await history.ensure_indexes()
+    await db.sessions.create_index("session_token")
+    await db.users.create_index("id")
+    tokens = [await create_session(db, False) for _ in range(20)]
+    user_ids = await db.chat_history.distinct("user_id")
+    return {"tokens": tokens, "user_ids": user_ids}
+
+async def operation(db, name, rng, fixtures):
+    if name == "auth":
+        session = await db.sessions.find_one({"session_token": rng.choice(fixtures["tokens"])}, {"_id": 0})
+        await db.users.find_one({"id": session["user_id"]}, {"_id": 0})
+    elif name == "reference":
+        await db[rng.choice(["faqs", "faculty", "events", "locations"])].find({}, {"_id": 0}).to_list(20)
+    elif name == "history":
+        await FlatChatHistory(db.chat_history).find({"user_id": rng.choice(fixtures["user_ids"])}, limit=50).to_list(50)
+    else:
+        await db.bench_writes.insert_one({"user_id": rng.choice(fixtures["user_ids"]), "query": "bench",
+                                          "ts": time.time()})
+
+async def run_pool(args, size, fixtures) -> dict:
+    stats = PoolStats()
+    client = create_client(args.mongo_url, maxPoolSize=size, minPoolSize=0,
+                           waitQueueTimeoutMS=args.wait_queue_timeout_ms, event_listeners=[stats])
+    db = client[args.db]
+    latencies, errors = [], defaultdict(int)
+    names, weights = zip(*OPERATIONS.items())
+    try:
+        await db.command("ping")
+        deadline = time.perf_counter() + args.duration
+
+        async def worker(i):
+            rng = random.Random(f"{args.seed}:{size}:{i}")
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights)[0]
+                started = time.perf_counter()
+                try:
+                    await operation(db, name, rng, fixtures)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                except PyMongoError as exc:
+                    errors[type(exc).__name__] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    finally:
+        client.close()
+    return {
+        "pool_size": size,
+        "ops_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "errors": dict(errors),
+        "connections_opened": stats.created,
+        "checkout_failures": stats.checkout_failures,
+    }
+
+async def run(args):
+    setup = create_client(args.mongo_url)
+    try:
+        print("Seeding...")
+        fixtures = await prepare(setup[args.db], args)
+        results = []
+        print(f"{'pool':>6} {'ops/s':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'conns':>6} {'errors':>7}")
+        for size in args.pool_sizes:
+            r = await run_pool(args, size, fixtures)
+            results.append(r)
+            print(f"{size:>6} {r['ops_per_s']:>9,.1f} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} "
+                  f"{r['connections_opened']:>6} {sum(r['errors'].values()):>7}")
+        if args.output:
+            with open(args.output, "w") as fh:
+                json.dump({"concurrency": args.concurrency, "duration": args.duration, "results": results}, fh, indent=2)
+        return results
+    finally:
+        if not args.keep:
+            await setup.drop_database(args.db)
+        setup.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Effect of Mongo pool size under concurrent load.")
+    parser.add_argument("--mongo-url", required=True)
+    parser.add_argument("--db", default="campus_chatbot_bench_pool")
+    parser.add_argument("--pool-sizes", type=lambda v: [int(x) for x in v.split(",")], default=[5, 10, 25, 50, 100])
+    parser.add_argument("--concurrency", type=int, default=200, help="Concurrent in-flight operations")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per pool size")
+    parser.add_argument("--wait-queue-timeout-ms", type=int, default=2000)
+    parser.add_argument("--history", type=int, default=50_000, help="chat_history rows to seed")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch database")
+    parser.add_argument("--output", help="Write results JSON here")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
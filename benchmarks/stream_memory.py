@@ -0,0 +1,93 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import tracemalloc
+from typing import List
+
+from harness import load_app
+
+# Peak Python heap of serving chat_history through the materializing path
+# (to_list -> Pydantic list -> JSON string, as the non-streamed endpoints do)
+# versus stream_documents(). Without --mongo-url the rows come from a lazy
+# in-process cursor so the measurement only covers app-side memory; with it,
+# the real collection is read (seed it first with backend/generate_data.py).
+
+class GeneratedCursor:
+    # Stands in for a Motor cursor: yields generated documents one at a time.
+    def __init__(self, rows: int, seed: int = 42):
+        import generate_data
+
+        self._docs = generate_data.gen_chat_history(random.Random(f"{seed}:chat_history"), seed, rows, 50000)
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._docs)
+        except StopIteration:
+            raise StopAsyncIteration
+
+async def collect(cursor) -> list:
+    return [doc async for doc in cursor]
+
+async def materialized(server, cursor) -> int:
+    from pydantic import TypeAdapter
+
+    docs = await collect(cursor)
+    payload = json.dumps(TypeAdapter(List[server.ChatMessage]).dump_python(
+        [server.ChatMessage(**doc) for doc in docs], mode="json"))
+    return len(payload)
+
+async def streamed(server, cursor) -> int:
+    total = 0
+    async for chunk in server.stream_documents(cursor, server.ChatMessage):
+        total += len(chunk)
+    return total
+
+async def measure(name, fn, server, make_cursor):
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = await fn(server, make_cursor())
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<14} peak {peak / 1024 / 1024:>9.1f} MiB   output {size / 1024 / 1024:>8.1f} MiB   {elapsed:>6.1f}s")
+    return {"peak_bytes": peak, "output_bytes": size, "seconds": round(elapsed, 2)}
+
+async def run(args):
+    server = load_app(args.mongo_url, args.db)
+    if args.mongo_url:
+        def make_cursor():
+            return server.db.chat_history.find({}, {"_id": 0}).limit(args.rows)
+    else:
+        def make_cursor():
+            return GeneratedCursor(args.rows, args.seed)
+
+    print(f"Serializing {args.rows:,} chat_history rows...")
+    results = {"rows": args.rows, "streamed": await measure("streamed", streamed, server, make_cursor)}
+    if not args.skip_materialized:
+        results["materialized"] = await measure("materialized", materialized, server, make_cursor)
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=2)
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare peak memory of streamed vs materialized reads.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--mongo-url", help="Read from a real chat_history instead of generated rows")
+    parser.add_argument("--db", default="campus_chatbot_bench")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-materialized", action="store_true",
+                        help="Only run the streamed path (the materialized one needs several GiB at 1M rows)")
+    parser.add_argument("--output", help="Write results JSON here")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
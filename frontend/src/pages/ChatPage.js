@@ -46,6 +46,21 @@ function ChatPage({ user, setUser }) {
     }
   };
 
+  // Only pull entries newer than the latest one we already have.
+  const fetchNewHistory = async (sinceId) => {
+    try {
+      const response = await axios.get(`${API}/chat/history`, {
+        params: { since: sinceId },
+        withCredentials: true
+      });
+      if (response.data.length) {
+        setHistory(prev => [...response.data, ...prev]);
+      }
+    } catch (error) {
+      console.error('Failed to fetch history:', error);
+    }
+  };
+
   const handleSendMessage = async (e) => {
     e.preventDefault();
     if (!query.trim() || loading) return;
@@ -65,7 +80,11 @@ function ChatPage({ user, setUser }) {
 
       setSessionId(response.data.session_id);
       setMessages(prev => [...prev, { type: 'bot', text: response.data.response }]);
-      fetchHistory();
+      if (history.length) {
+        fetchNewHistory(history[0].id);
+      } else {
+        fetchHistory();
+      }
     } catch (error) {
       console.error('Failed to send message:', error);
       toast.error('Failed to get response. Please try again.');
@@ -0,0 +1,49 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+BACKEND_DIR = ROOT / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+# The tests run against mongomock-motor (pip install -r
+# backend/requirements-dev.txt) and are skipped without it.
+
+def _mongomock_motor():
+    module = pytest.importorskip("mongomock_motor", reason="pip install -r backend/requirements-dev.txt")
+    import mongomock.aggregate
+
+    # mongomock has no $reverseArray, which the bucketed history layout
+    # uses for newest-first reads.
+    parser = mongomock.aggregate._Parser
+    if not getattr(parser, "_reverse_array", False):
+        handle = parser._handle_array_operator
+
+        def handle_array_operator(self, operator, value):
+            if operator == "$reverseArray":
+                values = self.parse(value)
+                return None if values is None else list(reversed(values))
+            return handle(self, operator, value)
+
+        parser._handle_array_operator = handle_array_operator
+        parser._reverse_array = True
+    return module
+
+@pytest.fixture
+def mongo():
+    # A fresh in-memory database per test.
+    return _mongomock_motor().AsyncMongoMockClient()["test"]
+
+@pytest.fixture
+def app_server(monkeypatch):
+    # backend/server.py wired to mongomock by the benchmark harness, with the
+    # harness's environment undone after the test.
+    _mongomock_motor()
+    monkeypatch.syspath_prepend(str(ROOT / "benchmarks"))
+    import harness
+
+    for name, value in harness.app_env().items():
+        monkeypatch.setenv(name, value)
+    return harness.load_app()
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from chat_store import BucketedChatHistory, bucket_docs, make_chat_history
+
+def record(i, user="u1", minute=None):
+    minute = i if minute is None else minute
+    return {"id": f"r{i:02d}", "user_id": user, "query": f"q{i}", "response": "a",
+            "timestamp": f"2026-01-01T10:{minute:02d}:00+00:00"}
+
+async def stored(history, records):
+    await history.ensure_indexes()
+    for r in records:
+        await history.insert(r)
+    return history
+
+async def ids(history, query=None, **kwargs):
+    return [r["id"] for r in await history.find(query or {"user_id": "u1"}, **kwargs).to_list(None)]
+
+async def buckets(history):
+    return await history.collection.find({}, {"_id": 0, "turns": 0}).sort("first_ts", 1).to_list(None)
+
+@pytest.mark.parametrize("layout", ["flat", "bucketed"])
+def test_find_orders_a_users_records_newest_first(mongo, layout):
+    async def run():
+        # Live turns arrive in time order, give or take concurrent requests
+        # (r01 before r00).
+        history = await stored(make_chat_history(mongo, layout, 3),
+                               [record(i) for i in (1, 0, 2, 3, 4, 5, 6, 7)] + [record(9, user="u2")])
+        assert await ids(history) == [f"r{i:02d}" for i in range(7, -1, -1)]
+        assert await ids(history, newest_first=False, limit=3) == ["r00", "r01", "r02"]
+        # Equal timestamps are ordered by id.
+        await history.insert(record(8, minute=7))
+        assert (await ids(history, limit=2)) == ["r08", "r07"]
+    asyncio.run(run())
+
+def test_full_bucket_closes_and_stays_closed_after_deletes(mongo):
+    async def run():
+        history = await stored(BucketedChatHistory(mongo.chat_history_buckets, 3), [record(i) for i in range(4)])
+        assert [(b["count"], b["closed"]) for b in await buckets(history)] == [(3, True), (1, False)]
+
+        assert await history.delete("r01")
+        await history.insert(record(4))
+        await history.insert(record(5))
+        # The freed slot is not reused: new turns go to the open bucket only.
+        assert [(b["count"], b["closed"]) for b in await buckets(history)] == [(2, True), (3, True)]
+        await history.insert(record(6))
+        assert await ids(history) == ["r06", "r05", "r04", "r03", "r02", "r00"]
+    asyncio.run(run())
+
+def test_pulling_turns_recomputes_bucket_bounds(mongo):
+    async def run():
+        history = await stored(BucketedChatHistory(mongo.chat_history_buckets, 3), [record(i) for i in range(6)])
+        assert await history.delete("r00")
+        assert await history.delete("r05")
+        first, second = await buckets(history)
+        assert (first["count"], first["first_ts"], first["last_ts"]) == \
+            (2, "2026-01-01T10:01:00+00:00", "2026-01-01T10:02:00+00:00")
+        assert (second["count"], second["first_ts"], second["last_ts"]) == \
+            (2, "2026-01-01T10:03:00+00:00", "2026-01-01T10:04:00+00:00")
+        # Pruning on the recomputed bounds still finds the remaining turns.
+        assert await ids(history, {"user_id": "u1", "timestamp": {"$gt": "2026-01-01T10:02:00+00:00"}},
+                         min_ts="2026-01-01T10:02:00+00:00") == ["r04", "r03"]
+        assert not await history.delete("r00")
+    asyncio.run(run())
+
+def test_delete_records_counts_only_turns_it_pulled(mongo):
+    async def run():
+        history = await stored(BucketedChatHistory(mongo.chat_history_buckets, 3), [record(i) for i in range(5)])
+        batch = [record(i) for i in (0, 1, 2, 3)]
+        assert await history.delete_records(batch) == 4
+        # Emptied buckets are removed; a stale batch pulls nothing.
+        assert len(await buckets(history)) == 1
+        assert await history.delete_records(batch) == 0
+        assert await ids(history) == ["r04"]
+    asyncio.run(run())
+
+def test_racing_first_inserts_share_one_open_bucket(mongo):
+    async def run():
+        history = BucketedChatHistory(mongo.chat_history_buckets, 3)
+        await history.ensure_indexes()
+        await asyncio.gather(*(history.insert(record(i)) for i in range(5)))
+        assert [(b["count"], b["closed"]) for b in await buckets(history)] == [(3, True), (2, False)]
+        assert sorted(await ids(history)) == [f"r{i:02d}" for i in range(5)]
+    asyncio.run(run())
+
+def test_bucket_docs_match_inserted_buckets(mongo):
+    records = [record(i) for i in (3, 1, 0, 2, 4)]
+    docs = bucket_docs(records, 3)
+    assert [(d["count"], d["closed"], [t["id"] for t in d["turns"]]) for d in docs] == \
+        [(3, True, ["r00", "r01", "r02"]), (2, False, ["r03", "r04"])]
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from conversation_memory import ConversationConflict, ConversationStore
+
+def stores(mongo, n=2):
+    # Separate hot tiers over one collection, as on separate workers.
+    return [ConversationStore(mongo.conversations) for _ in range(n)]
+
+async def stored_turns(mongo, session_id):
+    doc = await mongo.conversations.find_one({"session_id": session_id})
+    return [t["query"] for t in doc["turns"]], doc["version"]
+
+def test_stale_copies_merge_instead_of_overwriting(mongo):
+    async def run():
+        a, b = stores(mongo)
+        await a.ensure_indexes()
+        conv = await a.get("s1", "u1")
+        await a.append(conv, "q1", "a1")
+        # Both workers hold the session at version 1...
+        stale_a, stale_b = await a.get("s1", "u1"), await b.get("s1", "u1")
+        await a.append(stale_a, "q2", "a2")
+        # ...so b's write conflicts, reloads and applies its turn on top.
+        await b.append(stale_b, "q3", "a3")
+        assert await stored_turns(mongo, "s1") == (["q1", "q2", "q3"], 3)
+        assert [t["query"] for t in stale_b.turns] == ["q1", "q2", "q3"]
+    asyncio.run(run())
+
+def test_racing_first_writes_keep_both_turns(mongo):
+    async def run():
+        a, b = stores(mongo)
+        await a.ensure_indexes()
+        conv_a, conv_b = await a.get("s1", "u1"), await b.get("s1", "u1")
+        await asyncio.gather(a.append(conv_a, "qa", "x"), b.append(conv_b, "qb", "y"))
+        turns, version = await stored_turns(mongo, "s1")
+        assert sorted(turns) == ["qa", "qb"] and version == 2
+    asyncio.run(run())
+
+def test_another_users_session_id_is_never_reused(mongo):
+    async def run():
+        a, b = stores(mongo)
+        await a.ensure_indexes()
+        await a.append(await a.get("s1", "alice"), "private", "x")
+        hijack = await b.get("s1", "mallory")
+        assert hijack.session_id != "s1" and not hijack.turns
+        # Even a copy loaded before alice's write cannot overwrite it.
+        early = await stores(mongo, 1)[0].get("s2", "mallory")
+        await a.append(await a.get("s2", "alice"), "mine", "x")
+        await b.append(early, "theirs", "y")
+        assert early.session_id != "s2"
+        assert await stored_turns(mongo, "s1") == (["private"], 1)
+        assert await stored_turns(mongo, "s2") == (["mine"], 1)
+        assert (await stored_turns(mongo, early.session_id))[0] == ["theirs"]
+    asyncio.run(run())
+
+def test_documents_from_before_versioning_are_updated(mongo):
+    async def run():
+        store = stores(mongo, 1)[0]
+        await mongo.conversations.insert_one({"session_id": "s1", "user_id": "u1", "turns": [], "summary": ""})
+        await store.append(await store.get("s1", "u1"), "q1", "a1")
+        assert await stored_turns(mongo, "s1") == (["q1"], 2)
+    asyncio.run(run())
+
+def test_endless_conflicts_raise_conversation_conflict(mongo, monkeypatch):
+    async def run():
+        store = stores(mongo, 1)[0]
+        conv = await store.get("s1", "u1")
+
+        async def conflict(conv):
+            # Another worker writes the session before every attempt.
+            await mongo.conversations.update_one(
+                {"session_id": "s1"}, {"$set": {"user_id": "u1"}, "$inc": {"version": 1}}, upsert=True)
+            return False
+
+        monkeypatch.setattr(store, "_write", conflict)
+        with pytest.raises(ConversationConflict):
+            await store.append(conv, "q", "a")
+    asyncio.run(run())
+
+def test_chat_answer_survives_a_conversation_conflict(app_server, monkeypatch):
+    import harness
+
+    async def answer(prompt):
+        return "the answer", None
+
+    async def conflict(*args):
+        raise ConversationConflict("busy")
+
+    monkeypatch.setattr(app_server, "call_gemini", answer)
+    monkeypatch.setattr(app_server.conversations, "append", conflict)
+
+    async def run():
+        token = await harness.create_session(app_server.db, is_admin=False)
+        async with harness.app_client(app_server.app) as client:
+            response = await client.post("/api/chat/query", json={"query": "hello"},
+                                         headers={"Authorization": f"Bearer {token}"})
+            assert response.status_code == 200, response.text
+            assert response.json()["response"] == "the answer"
+            # The turn is still in the student's history.
+            history = await client.get("/api/chat/history", headers={"Authorization": f"Bearer {token}"})
+            assert [r["query"] for r in history.json()] == ["hello"]
+    asyncio.run(run())
@@ -0,0 +1,55 @@
+import asyncio
+
+import faq_dedup
+from faq_dedup import FAQDuplicateIndex
+
+def faq(faq_id, question, answer="Use the reset link on the login page."):
+    return {"id": faq_id, "question": question, "answer": answer}
+
+FAQS = [
+    faq("a1", "How do I reset my campus portal password?"),
+    faq("a2", "How do I reset my campus portal password??"),
+    faq("a3", "how do i reset my campus portal password"),
+    faq("b1", "Where is the chemistry lab?", "Science block, room 210."),
+    faq("b2", "Where is the chemistry lab located?", "Science block, room 210."),
+] + [faq(f"u{i}", text, "") for i, text in enumerate([
+    "When does the library open on weekends?", "Who approves scholarship appeals?",
+    "Can I park overnight in lot C?", "What is the late fee for tuition?",
+    "Is there a shuttle to the north campus?", "How many credits is a full-time load?",
+    "Where do I collect my student ID card?", "Are pets allowed in the dormitories?",
+])]
+
+def test_clusters_compare_only_faqs_sharing_a_band(mongo, monkeypatch):
+    loaded = []
+    cluster_signatures = faq_dedup.cluster_signatures
+
+    def spy(signatures, buckets, threshold):
+        loaded.extend(signatures)
+        return cluster_signatures(signatures, buckets, threshold)
+    monkeypatch.setattr(faq_dedup, "cluster_signatures", spy)
+
+    async def run():
+        index = FAQDuplicateIndex(mongo.faq_signatures)
+        await index.ensure_indexes()
+        await mongo.faqs.insert_many([dict(f) for f in FAQS])
+        assert await index.backfill(mongo.faqs) == len(FAQS)
+        clusters, sampled = await index.clusters()
+        assert sorted(sorted(faq_id for faq_id, _ in c) for c in clusters) == [["a1", "a2", "a3"], ["b1", "b2"]]
+        assert sampled == 0
+        # Signatures of FAQs without a shared band are never read.
+        assert sorted(loaded) == ["a1", "a2", "a3", "b1", "b2"]
+    asyncio.run(run())
+
+def test_oversized_buckets_are_sampled(mongo, monkeypatch):
+    monkeypatch.setattr(faq_dedup, "MAX_BUCKET_SIZE", 10)
+    monkeypatch.setattr(faq_dedup, "BUCKET_SAMPLE_SIZE", 3)
+
+    async def run():
+        index = FAQDuplicateIndex(mongo.faq_signatures)
+        await mongo.faqs.insert_many([faq(f"d{i:02d}", "Same question copied everywhere") for i in range(30)])
+        await index.backfill(mongo.faqs)
+        clusters, sampled = await index.clusters()
+        # Copies of one text still end up in one cluster.
+        assert [len(c) for c in clusters] == [30]
+        assert sampled == faq_dedup.BANDS
+    asyncio.run(run())
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from chat_store import make_chat_history
+
+# Keyset paging of GET /api/chat/history: `before` walks backwards from a
+# record id or timestamp, `since` returns what came after one, and records
+# sharing a timestamp are neither skipped nor repeated across pages.
+
+def records(user_id):
+    # Three records share each timestamp so page boundaries fall inside ties.
+    return [{"id": f"r{i:02d}", "user_id": user_id, "query": f"q{i}", "response": "a",
+             "timestamp": f"2026-01-01T10:{i // 3:02d}:00+00:00"} for i in range(10)]
+
+@pytest.fixture(params=["flat", "bucketed"])
+def history_api(request, app_server, monkeypatch):
+    import harness
+
+    history = make_chat_history(app_server.db, request.param, 4)
+    monkeypatch.setattr(app_server, "chat_history", history)
+
+    async def setup():
+        await history.ensure_indexes()
+        token = await harness.create_session(app_server.db, is_admin=False)
+        user = await app_server.db.sessions.find_one({"session_token": token})
+        for r in records(user["user_id"]):
+            await history.insert(r)
+        return token
+
+    token = asyncio.run(setup())
+
+    def get(**params):
+        async def call():
+            async with harness.app_client(app_server.app) as client:
+                return await client.get("/api/chat/history", params=params,
+                                        headers={"Authorization": f"Bearer {token}"})
+        return asyncio.run(call())
+    return get
+
+def page_ids(response):
+    assert response.status_code == 200, response.text
+    return [r["id"] for r in response.json()]
+
+def test_before_pages_through_ties_without_gaps(history_api):
+    seen, before = [], None
+    while True:
+        page = page_ids(history_api(limit=4, **({"before": before} if before else {})))
+        if not page:
+            break
+        seen += page
+        before = page[-1]
+    assert seen == [f"r{i:02d}" for i in range(9, -1, -1)]
+
+def test_since_returns_only_newer_records(history_api):
+    assert page_ids(history_api(since="r04")) == ["r09", "r08", "r07", "r06", "r05"]
+    assert page_ids(history_api(since="r09")) == []
+
+def test_timestamp_cursors_bound_the_window(history_api):
+    # Timestamps are exclusive bounds; naive ones are taken as UTC.
+    assert page_ids(history_api(since="2026-01-01T10:01:00", before="2026-01-01T10:03:00+00:00")) == \
+        ["r08", "r07", "r06"]
+
+def test_both_cursors_and_unknown_ids(history_api):
+    assert page_ids(history_api(since="r02", before="r06")) == ["r05", "r04", "r03"]
+    assert history_api(before="nope").status_code == 400
@@ -0,0 +1,102 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limit
+from rate_limit import (
+    FairScheduler,
+    MemoryRateLimiter,
+    MongoRateLimiter,
+    RateLimit,
+    SchedulerQueueFull,
+    client_identity,
+)
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=clock, time=clock))
+    return clock
+
+@pytest.mark.parametrize("store", ["memory", "mongo"])
+def test_token_bucket_refills_continuously(store, clock, mongo):
+    limiter = MemoryRateLimiter() if store == "memory" else MongoRateLimiter(mongo.rate_limits)
+    limit = RateLimit.parse("2/10")
+
+    async def hits(n, key="a"):
+        return [(r.allowed, r.remaining) for r in [await limiter.hit(key, limit) for _ in range(n)]]
+
+    async def run():
+        assert await hits(3) == [(True, 1), (True, 0), (False, 0)]
+        blocked = await limiter.hit("a", limit)
+        assert blocked.headers()["Retry-After"] == "5"
+        # One token every 5 s, never more than the capacity.
+        clock.now += 5
+        assert await hits(2) == [(True, 0), (False, 0)]
+        clock.now += 60
+        assert await hits(3) == [(True, 1), (True, 0), (False, 0)]
+        # Buckets are per key.
+        assert await hits(1, key="b") == [(True, 1)]
+    asyncio.run(run())
+
+def test_fair_scheduler_round_robins_between_identities():
+    async def run():
+        scheduler = FairScheduler(capacity=1, max_queued_per_identity=3)
+        order, gate = [], asyncio.Event()
+
+        async def call(identity, n):
+            async with scheduler.slot(identity):
+                order.append(f"{identity}{n}")
+                await gate.wait()
+
+        first = asyncio.create_task(call("a", 0))
+        await asyncio.sleep(0)
+        queued = [asyncio.create_task(call(i, n)) for i, n in [("a", 1), ("a", 2), ("a", 3), ("b", 1)]]
+        await asyncio.sleep(0)
+        assert scheduler.queued == 4
+        with pytest.raises(SchedulerQueueFull):
+            await scheduler._acquire("a")
+        gate.set()
+        await asyncio.gather(first, *queued)
+        assert order == ["a0", "a1", "b1", "a2", "a3"]
+        assert scheduler.active == 0 and scheduler.queued == 0
+    asyncio.run(run())
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def run():
+        scheduler = FairScheduler(capacity=1)
+        async with scheduler.slot("a"):
+            waiter = asyncio.create_task(scheduler._acquire("b"))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert scheduler.queued == 0
+        assert scheduler.active == 0
+    asyncio.run(run())
+
+def request(headers, peer="10.0.0.1"):
+    return SimpleNamespace(headers=headers, client=SimpleNamespace(host=peer))
+
+@pytest.mark.parametrize("forwarded,hops,expected", [
+    (None, 0, "ip:10.0.0.1"),
+    # Without trusted proxies the header is ignored.
+    ("6.6.6.6", 0, "ip:10.0.0.1"),
+    # The entry our proxy appended, not the client-written one before it.
+    ("6.6.6.6, 1.2.3.4", 1, "ip:1.2.3.4"),
+    ("6.6.6.6, 1.2.3.4, 10.1.1.1", 2, "ip:1.2.3.4"),
+    # Shorter than the proxy chain: not from our proxies.
+    ("1.2.3.4", 2, "ip:10.0.0.1"),
+])
+def test_client_identity(forwarded, hops, expected):
+    headers = {"x-forwarded-for": forwarded} if forwarded else {}
+    assert client_identity(request(headers), None, hops) == expected
+    assert client_identity(request(headers), SimpleNamespace(id="u1"), hops) == "user:u1"
@@ -0,0 +1,30 @@
+import asyncio
+import os
+import tracemalloc
+
+# Streamed chat_history reads must use the same peak memory whatever the row
+# count. tracemalloc makes serialization ~0.3 ms a row, so by default this
+# compares a small read with one 5x larger instead of running 1M rows;
+# STREAM_MEMORY_TEST_ROWS=1000000 runs the full size as the large read.
+LARGE_ROWS = int(os.environ.get("STREAM_MEMORY_TEST_ROWS", "50000"))
+SMALL_ROWS = max(LARGE_ROWS // 5, 1000)
+
+def peak_bytes(server, stream_memory, rows: int):
+    tracemalloc.start()
+    try:
+        size = asyncio.run(stream_memory.streamed(server, stream_memory.GeneratedCursor(rows)))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, size
+
+def test_streamed_peak_stays_flat(app_server):
+    import stream_memory
+
+    server = app_server
+    small_peak, _ = peak_bytes(server, stream_memory, SMALL_ROWS)
+    large_peak, large_size = peak_bytes(server, stream_memory, LARGE_ROWS)
+    # Flat: more rows add at most a little noise (allocator, pool threads)...
+    assert large_peak < small_peak * 1.5 + 256 * 1024, (small_peak, large_peak)
+    # ...and the peak is a small fraction of what a materialized read holds.
+    assert large_peak < large_size / 10, (large_peak, large_size)
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from tenancy import TENANT_FIELD, TenantConfig, bind_tenant, scoped_database
+
+def field_db(mongo):
+    return scoped_database(mongo, TenantConfig("field", ["north", "south"]))
+
+def test_field_scope_tags_writes_and_filters_reads(mongo):
+    async def run():
+        db = field_db(mongo)
+        for tenant in ("north", "south"):
+            with bind_tenant(tenant):
+                await db.faqs.insert_one({"id": "f1", "question": f"q {tenant}"})
+                await db.faqs.insert_many([{"id": "f2", "question": "shared id"}])
+        with bind_tenant("north"):
+            docs = await db.faqs.find({}, {"_id": 0}).sort("id", 1).to_list(None)
+            # Each campus sees only its own documents, without the tag.
+            assert docs == [{"id": "f1", "question": "q north"}, {"id": "f2", "question": "shared id"}]
+            assert await db.faqs.count_documents({"id": "f2"}) == 1
+            assert sorted(await db.faqs.distinct("question")) == ["q north", "shared id"]
+            assert [d["n"] async for d in db.faqs.aggregate([{"$count": "n"}])] == [2]
+            # Asking for tenant_id explicitly still returns it.
+            assert (await db.faqs.find_one({"id": "f1"}, {TENANT_FIELD: 1, "_id": 0})) == {TENANT_FIELD: "north"}
+        stored = await mongo.faqs.find({"id": "f1"}, {"_id": 0}).sort(TENANT_FIELD, 1).to_list(None)
+        assert [d[TENANT_FIELD] for d in stored] == ["north", "south"]
+    asyncio.run(run())
+
+def test_field_scope_confines_updates_and_deletes(mongo):
+    async def run():
+        db = field_db(mongo)
+        for tenant in ("north", "south"):
+            with bind_tenant(tenant):
+                await db.faqs.insert_one({"id": "f1", "answer": "old"})
+        with bind_tenant("south"):
+            assert (await db.faqs.update_many({}, {"$set": {"answer": "new"}})).modified_count == 1
+            # Upserts pick the campus up from the scoped filter.
+            await db.faqs.update_one({"id": "f9"}, {"$set": {"answer": "made"}}, upsert=True)
+            await db.faqs.replace_one({"id": "f1"}, {"id": "f1", "answer": "replaced"})
+            assert (await db.faqs.delete_many({})).deleted_count == 2
+        assert await mongo.faqs.count_documents({}) == 1
+        assert await mongo.faqs.find_one({}, {"_id": 0}) == {"id": "f1", "answer": "old", TENANT_FIELD: "north"}
+    asyncio.run(run())
+
+def test_field_scope_leads_indexes_with_the_tenant(mongo):
+    async def run():
+        db = field_db(mongo)
+        with bind_tenant("north"):
+            await db.sessions.create_index("session_token", unique=True)
+            await db.sessions.create_index("expires_at", expireAfterSeconds=0)
+        info = await mongo.sessions.index_information()
+        assert info["tenant_id_1_session_token_1"]["key"] == [(TENANT_FIELD, 1), ("session_token", 1)]
+        # TTL indexes must stay single-field.
+        assert info["expires_at_1"]["key"] == [("expires_at", 1)]
+        # Unique per campus: the same token may exist once in each.
+        for tenant in ("north", "south"):
+            with bind_tenant(tenant):
+                await db.sessions.insert_one({"session_token": "t"})
+    asyncio.run(run())
+
+def test_field_scope_refuses_unbound_and_unscoped_calls(mongo):
+    db = field_db(mongo)
+    with pytest.raises(RuntimeError):
+        asyncio.run(db.faqs.find_one({}))
+    with bind_tenant("north"), pytest.raises(AttributeError):
+        db.faqs.bulk_write([])
+
+def test_database_scope_routes_to_the_campus_database(mongo):
+    async def run():
+        db = scoped_database(mongo, TenantConfig("database", ["north", "south"], db_name="test"))
+        with bind_tenant("north"):
+            await db.faqs.insert_one({"id": "f1"})
+        with bind_tenant("south"):
+            assert await db.faqs.count_documents({}) == 0
+        assert await mongo.client["test_north"].faqs.count_documents({}) == 1
+    asyncio.run(run())
+
+@pytest.mark.parametrize("resolution,host,path,expected", [
+    ("host", "chat.n.edu:443", "/api/faqs", ("north", "/api/faqs", "")),
+    ("host", "south.campus.edu", "/api/faqs", ("south", "/api/faqs", "")),
+    ("host", "west.campus.edu", "/api/faqs", (None, "/api/faqs", "")),
+    ("path", "any", "/south/api/faqs", ("south", "/api/faqs", "/south")),
+    ("path", "any", "/api/faqs", (None, "/api/faqs", "")),
+])
+def test_resolve(resolution, host, path, expected):
+    config = TenantConfig("field", ["north", "south"], resolution, {"chat.n.edu": "north"})
+    assert config.resolve(host, path) == expected